@@ -0,0 +1,229 @@
+"""
+Strand Assessment Bank
+======================
+Quiz and assessment items for a whole strand from one batched request.
+
+One completion per strand covers every sub-strand. The model answers with
+JSON:
+
+  {"substrands": [{"title": "<sub-strand>",
+                   "quiz": [item, ...],
+                   "assessment": [item, ...]}, ...],
+   "strand": [item, ...]}
+
+  item: {"question": str,
+         "options": [str, ...],      multiple choice only
+         "answer": int | str,        option index (or letter) / model answer
+         "marks": int,               optional, default 1
+         "explanation": str}         optional
+
+Items are validated one by one. Malformed items are dropped, and sub-strand
+titles are matched back to the curriculum names, so one bad entry does not
+cost the whole strand. The result is split per sub-strand so the renderers
+can put each list at that sub-strand's quiz and assessment positions.
+
+Results are cached on disk under the hash of the strand's curriculum content
+and the prompt version. Both docs of a strand, and re-runs, share one
+request. The completion is parsed as received, without clean_model_output,
+which would strip underscores and emphasis markers out of the JSON.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PROMPT_VERSION = "1"
+QUIZ_ITEMS = 3
+SUBSTRAND_ASSESSMENT_ITEMS = 2
+STRAND_ASSESSMENT_ITEMS = 5
+MAX_OPTIONS = 6
+
+PLACEHOLDER_KIND = re.compile(r"^placeholder:\s*(quiz|assessment)\b", re.IGNORECASE)
+
+Complete = Callable[[str, str, str], str]   # (prompt, grade, subject) → completion text
+
+
+def strand_hash(grade: str, subject: str, strand: str, details: Dict[str, Any]) -> str:
+    payload = json.dumps([PROMPT_VERSION, grade, subject, strand, details], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def items_digest(items: Optional[Dict[str, Any]]) -> str:
+    if not items:
+        return ""
+    return hashlib.sha1(json.dumps(items, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_title(title: str) -> str:
+    return re.sub(r"[^\w]+", " ", title.lower()).strip()
+
+
+def placeholder_kind(text: str) -> Optional[str]:
+    """'quiz' or 'assessment' for the generators' placeholder lines, else None."""
+    m = PLACEHOLDER_KIND.match(text.strip())
+    return m.group(1).lower() if m else None
+
+
+def extract_json(text: str) -> Any:
+    """The outermost JSON object in a completion, ignoring any prose around it."""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        raise ValueError("no JSON object in completion")
+    return json.loads(text[start:end + 1])
+
+
+# =============================================================
+# Validation
+# =============================================================
+
+def validate_item(raw: Any) -> Optional[Dict[str, Any]]:
+    """A cleaned item, or None if it cannot be used."""
+    if not isinstance(raw, dict):
+        return None
+    question = raw.get("question")
+    if not isinstance(question, str) or not question.strip():
+        return None
+    item: Dict[str, Any] = {"question": question.strip()}
+
+    options = raw.get("options")
+    answer = raw.get("answer")
+    if options:
+        if not isinstance(options, list) or not 2 <= len(options) <= MAX_OPTIONS:
+            return None
+        options = [str(o).strip() for o in options]
+        if not all(options) or len(set(options)) != len(options):
+            return None
+        if isinstance(answer, str) and len(answer.strip()) == 1 and answer.strip().isalpha():
+            answer = ord(answer.strip().upper()) - ord("A")
+        elif isinstance(answer, str) and answer.strip() in options:
+            answer = options.index(answer.strip())
+        if not isinstance(answer, int) or isinstance(answer, bool) or not 0 <= answer < len(options):
+            return None
+        item["options"] = options
+        item["answer"] = answer
+    else:
+        if not isinstance(answer, str) or not answer.strip():
+            return None
+        item["answer"] = answer.strip()
+
+    marks = raw.get("marks", 1)
+    item["marks"] = marks if isinstance(marks, int) and not isinstance(marks, bool) and 1 <= marks <= 20 else 1
+    explanation = raw.get("explanation")
+    if isinstance(explanation, str) and explanation.strip():
+        item["explanation"] = explanation.strip()
+    return item
+
+
+def validate_items(raw: Any) -> List[Dict[str, Any]]:
+    if not isinstance(raw, list):
+        return []
+    return [item for item in (validate_item(r) for r in raw) if item]
+
+
+def split_items(data: Any, substrands: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Returns ({'substrands': {sub: {'quiz': [...], 'assessment': [...]}},
+              'strand': [...]}, problems). Sub-strands the model skipped
+    get empty lists and are listed in problems.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("completion is not a JSON object")
+    by_title = {normalize_title(s): s for s in substrands}
+    result: Dict[str, Any] = {"substrands": {s: {"quiz": [], "assessment": []} for s in substrands},
+                              "strand": validate_items(data.get("strand"))}
+    problems: List[str] = []
+
+    entries = data.get("substrands")
+    for pos, entry in enumerate(entries if isinstance(entries, list) else []):
+        if not isinstance(entry, dict):
+            continue
+        sub = by_title.get(normalize_title(str(entry.get("title", ""))))
+        if sub is None and pos < len(substrands) and not entry.get("title"):
+            sub = substrands[pos]
+        if sub is None:
+            problems.append(f"unknown sub-strand {entry.get('title')!r}")
+            continue
+        for kind in ("quiz", "assessment"):
+            result["substrands"][sub][kind].extend(validate_items(entry.get(kind)))
+
+    for sub, items in result["substrands"].items():
+        if not items["quiz"]:
+            problems.append(f"no quiz items for {sub!r}")
+    if not result["strand"]:
+        problems.append("no strand assessment items")
+    return result, problems
+
+
+# =============================================================
+# Bank
+# =============================================================
+
+class AssessmentBank:
+    """
+    Cache of validated strand items under `root`, one <hash>.json per strand.
+    `complete` sends a prompt and returns the completion text.
+    """
+
+    def __init__(self, root: str, complete: Complete):
+        self.root = root
+        self.complete = complete
+        self.lock = threading.Lock()
+        self.stats = {"strands": 0, "cached": 0, "requests": 0, "failed": 0, "items": 0, "dropped_substrands": 0}
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.json")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, key: str, entry: Dict[str, Any]):
+        tmp = self.path_for(key) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.path_for(key))
+
+    def strand_items(self, grade: str, subject: str, strand: str, details: Dict[str, Any],
+                     prompt: str) -> Dict[str, Any]:
+        """
+        Items for the strand, from the cache or one request. Raises
+        ValueError when the completion has nothing usable; nothing is cached
+        then, and callers keep the placeholders.
+        """
+        key = strand_hash(grade, subject, strand, details)
+        with self.lock:
+            self.stats["strands"] += 1
+        cached = self.load(key)
+        if cached is not None:
+            with self.lock:
+                self.stats["cached"] += 1
+            return cached["items"]
+
+        with self.lock:
+            self.stats["requests"] += 1
+        try:
+            items, problems = split_items(extract_json(self.complete(prompt, grade, subject)), list(details.keys()))
+        except ValueError as e:
+            with self.lock:
+                self.stats["failed"] += 1
+            raise ValueError(f"{strand}: {e}")
+
+        count = len(items["strand"]) + sum(len(v["quiz"]) + len(v["assessment"])
+                                           for v in items["substrands"].values())
+        if not count:
+            with self.lock:
+                self.stats["failed"] += 1
+            raise ValueError(f"{strand}: no valid items ({'; '.join(problems)})")
+        with self.lock:
+            self.stats["items"] += count
+            self.stats["dropped_substrands"] += sum(1 for p in problems if p.startswith("no quiz"))
+        self.save(key, {"grade": grade, "subject": subject, "strand": strand, "problems": problems,
+                        "items": items})
+        return items
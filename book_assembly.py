@@ -0,0 +1,214 @@
+"""
+Grade Book Assembly
+===================
+Concatenates already-rendered strand DOCX files into one grade volume
+without re-running build_doc. The parts come from one content_generator
+template, so they share styles and numbering definitions and their bodies
+can be spliced together as raw WordprocessingML.
+
+The assembler makes two passes over the parts and holds only one part's
+document.xml in memory at a time. The volume's document.xml is streamed
+straight into the output zip, so memory stays flat for books of any length.
+
+  Pass 1  collect strand and sub-strand headings for the table of contents,
+          and copy embedded media (once per unique file) with renamed
+          relationship IDs
+  Pass 2  stream each part's body into the volume, renumbering sub-strand
+          headings continuously across the book
+
+The table of contents is a Word TOC field over the StrandTitle and
+SubStrandHeading styles. Its cached entries are the collected headings.
+Word fills in page numbers when the field is updated (F9).
+"""
+
+import hashlib
+import os
+import posixpath
+import re
+import zipfile
+from html import escape
+from typing import Dict, List, Tuple
+
+DOCUMENT_XML = "word/document.xml"
+DOCUMENT_RELS = "word/_rels/document.xml.rels"
+CONTENT_TYPES = "[Content_Types].xml"
+
+# Relationship types referenced from the body that must travel with each part
+BODY_REL_TYPES = ("/image", "/hyperlink")
+
+PARAGRAPH = re.compile(r"<w:p[ >].*?</w:p>", re.DOTALL)
+PARA_STYLE = re.compile(r'<w:pStyle w:val="([^"]+)"/>')
+TEXT_RUN = re.compile(r"<w:t(?: [^>]*)?>(.*?)</w:t>", re.DOTALL)
+FIRST_TEXT = re.compile(r"(<w:t(?: [^>]*)?>)(\d+)\.\s")
+RELATIONSHIP = re.compile(r"<Relationship [^>]*?/>")
+REL_ATTR = re.compile(r'(\w+)="([^"]*)"')
+REL_REF = re.compile(r'(r:(?:embed|id|link))="([^"]+)"')
+SECT_PR = re.compile(r"<w:sectPr[ >].*?</w:sectPr>\s*$", re.DOTALL)
+
+PAGE_BREAK = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+# The book title must not use a style the TOC field collects, or updating
+# the field lists it as the first entry. Title ships with the template.
+COVER_STYLE = "Title"
+
+
+def paragraph_text(xml: str) -> str:
+    return "".join(TEXT_RUN.findall(xml))
+
+
+def split_document(xml: str) -> Tuple[str, str, str]:
+    """(everything up to <w:body>, body content without the final sectPr, the sectPr)."""
+    start = xml.index("<w:body>") + len("<w:body>")
+    end = xml.rindex("</w:body>")
+    body = xml[start:end]
+    m = SECT_PR.search(body)
+    sect = m.group(0) if m else ""
+    if m:
+        body = body[:m.start()]
+    return xml[:start], body, sect
+
+
+def parse_rels(xml: str) -> List[Dict[str, str]]:
+    return [dict(REL_ATTR.findall(rel)) for rel in RELATIONSHIP.findall(xml)]
+
+
+def rel_xml(rel: Dict[str, str]) -> str:
+    attrs = " ".join(f'{k}="{v}"' for k, v in rel.items())
+    return f"<Relationship {attrs}/>"
+
+
+def toc_xml(entries: List[Tuple[int, str]]) -> str:
+    """TOC field whose cached result lists the headings (level 1 strands, level 2 sub-strands)."""
+    out = [
+        '<w:p><w:pPr><w:pStyle w:val="SectionHeading"/></w:pPr><w:r><w:t>Contents</w:t></w:r></w:p>',
+        '<w:p><w:r><w:fldChar w:fldCharType="begin"/></w:r>'
+        '<w:r><w:instrText xml:space="preserve"> TOC \\h \\z \\t "StrandTitle,1,SubStrandHeading,2" </w:instrText></w:r>'
+        '<w:r><w:fldChar w:fldCharType="separate"/></w:r></w:p>',
+    ]
+    for level, text in entries:
+        indent = '<w:pPr><w:ind w:left="360"/></w:pPr>' if level == 2 else ""
+        bold = "<w:rPr><w:b/></w:rPr>" if level == 1 else ""
+        out.append(f'<w:p>{indent}<w:r>{bold}<w:t xml:space="preserve">{text}</w:t></w:r></w:p>')
+    out.append('<w:p><w:r><w:fldChar w:fldCharType="end"/></w:r></w:p>')
+    out.append(PAGE_BREAK)
+    return "".join(out)
+
+
+def renumber(body: str, counter: int) -> Tuple[str, int]:
+    """Rewrites the 'N. ' prefix of each SubStrandHeading to continue from counter."""
+    def fix(m: "re.Match") -> str:
+        nonlocal counter
+        para = m.group(0)
+        style = PARA_STYLE.search(para)
+        if not style or style.group(1) != "SubStrandHeading":
+            return para
+        counter += 1
+        return FIRST_TEXT.sub(lambda t: f"{t.group(1)}{counter}. ", para, count=1)
+    return PARAGRAPH.sub(fix, body), counter
+
+
+def assemble_book(parts: List[str], output: str, title: str) -> Dict[str, int]:
+    """
+    Concatenates the DOCX files in `parts` into `output` with a cover title,
+    a table of contents and continuous sub-strand numbering.
+    Returns {'parts', 'strands', 'substrands'}.
+    """
+    if not parts:
+        raise ValueError("No parts to assemble")
+
+    with zipfile.ZipFile(parts[0]) as first:
+        head, _, sect = split_document(first.read(DOCUMENT_XML).decode("utf-8"))
+        base_rels_xml = first.read(DOCUMENT_RELS).decode("utf-8")
+        content_types = first.read(CONTENT_TYPES).decode("utf-8")
+        shared = {name: first.read(name) for name in first.namelist()
+                  if name not in (DOCUMENT_XML, DOCUMENT_RELS, CONTENT_TYPES)
+                  and not name.startswith("word/media/")}
+
+    base_rels = [r for r in parse_rels(base_rels_xml) if not r.get("Type", "").endswith(BODY_REL_TYPES)]
+    tmp = output + ".tmp"
+    toc: List[Tuple[int, str]] = []
+    rel_maps: List[Dict[str, str]] = []
+    extra_rels: List[Dict[str, str]] = []
+    extensions = set()
+    media_by_hash: Dict[str, str] = {}
+    counter = 0
+
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as out:
+        for name, data in shared.items():
+            out.writestr(name, data)
+
+        # Pass 1: headings and media
+        for idx, path in enumerate(parts):
+            with zipfile.ZipFile(path) as part:
+                rel_map: Dict[str, str] = {}
+                for rel in parse_rels(part.read(DOCUMENT_RELS).decode("utf-8")):
+                    if not rel.get("Type", "").endswith(BODY_REL_TYPES):
+                        continue
+                    new = dict(rel, Id=f"rIdB{idx}x{rel['Id']}")
+                    if rel.get("TargetMode") != "External":
+                        src = posixpath.normpath(posixpath.join("word", rel["Target"]))
+                        data = part.read(src)
+                        digest = hashlib.sha1(data).hexdigest()
+                        target = media_by_hash.get(digest)
+                        if target is None:
+                            # Identical pictures across strands are stored once
+                            target = f"media/b{idx}_{posixpath.basename(rel['Target'])}"
+                            out.writestr(f"word/{target}", data)
+                            extensions.add(posixpath.splitext(target)[1][1:].lower())
+                            media_by_hash[digest] = target
+                        new["Target"] = target
+                    rel_map[rel["Id"]] = new["Id"]
+                    extra_rels.append(new)
+                rel_maps.append(rel_map)
+
+                body = split_document(part.read(DOCUMENT_XML).decode("utf-8"))[1]
+                for para in PARAGRAPH.findall(body):
+                    style = PARA_STYLE.search(para)
+                    if not style:
+                        continue
+                    if style.group(1) == "StrandTitle":
+                        toc.append((1, paragraph_text(para)))
+                    elif style.group(1) == "SubStrandHeading":
+                        counter += 1
+                        toc.append((2, re.sub(r"^\d+\.\s", f"{counter}. ", paragraph_text(para))))
+                del body
+
+        rels = base_rels + extra_rels
+        out.writestr(DOCUMENT_RELS,
+                     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                     + "".join(rel_xml(r) for r in rels) + "</Relationships>")
+
+        for ext in sorted(extensions):
+            if f'Extension="{ext}"' not in content_types:
+                mime = "image/jpeg" if ext in ("jpg", "jpeg") else f"image/{ext}"
+                content_types = content_types.replace(
+                    "</Types>", f'<Default Extension="{ext}" ContentType="{mime}"/></Types>')
+        out.writestr(CONTENT_TYPES, content_types)
+
+        # Pass 2: stream bodies
+        counter = 0
+        with out.open(DOCUMENT_XML, "w") as doc:
+            doc.write(head.encode("utf-8"))
+            doc.write(f'<w:p><w:pPr><w:pStyle w:val="{COVER_STYLE}"/></w:pPr>'
+                      f'<w:r><w:t>{escape(title, quote=False)}</w:t></w:r></w:p>'.encode("utf-8"))
+            doc.write(toc_xml(toc).encode("utf-8"))
+            for idx, path in enumerate(parts):
+                with zipfile.ZipFile(path) as part:
+                    body = split_document(part.read(DOCUMENT_XML).decode("utf-8"))[1]
+                rel_map = rel_maps[idx]
+                if rel_map:
+                    body = REL_REF.sub(lambda m: f'{m.group(1)}="{rel_map.get(m.group(2), m.group(2))}"', body)
+                body, counter = renumber(body, counter)
+                if idx:
+                    doc.write(PAGE_BREAK.encode("utf-8"))
+                doc.write(body.encode("utf-8"))
+                del body
+            doc.write(f"{sect}</w:body></w:document>".encode("utf-8"))
+
+    os.replace(tmp, output)
+    return {
+        "parts": len(parts),
+        "strands": sum(1 for level, _ in toc if level == 1),
+        "substrands": counter,
+    }
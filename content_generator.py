@@ -1,16 +1,60 @@
+"""
+Content Generator
+=================
+Generates CBC Student and Teacher textbooks (DOCX plus lesson JSON) from
+content.json through the DeepSeek chat API.
+
+Importing this module is cheap and has no side effects: python-docx and
+requests are imported by the functions that render or call the API, and
+OUTPUT_DIR is created when something is written to it. Tools that only
+need parse_blocks, clean_model_output or the prompt builders pay for
+neither. `python content_generator.py import-budget` checks this.
+
+Commands (python content_generator.py COMMAND --help for options):
+    sample          generate the first two sub-strands of a test strand (the default)
+    pipeline        generate every matching strand through the staged pipeline
+    plan            estimate requests, tokens, cost and time without calling the API
+    prompt-report   report prompt-size reduction over content.json
+    enqueue DB      add matching units to a shared work queue
+    worker DB       claim and generate units from a shared queue
+    assemble DB     build DOCX files from a finished queue
+    book GRADE      assemble rendered strands of a grade into one volume
+    import-budget   fail if importing this module is slow or loads heavy dependencies
+
+The older flag spellings (--pipeline, --plan, --worker DB, ...) still work.
+"""
+
+from __future__ import annotations
+
+import io
 import os
+import hashlib
+import inspect
 import sys
 import time
 import json
 import re
-import requests
+import argparse
+import queue
+import socket
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from docx import Document
-from docx.shared import Pt, RGBColor, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.style import WD_STYLE_TYPE
-from docx.enum.text import WD_LINE_SPACING
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
+
+from assessment_bank import (AssessmentBank, QUIZ_ITEMS, STRAND_ASSESSMENT_ITEMS, SUBSTRAND_ASSESSMENT_ITEMS,
+                             items_digest, placeholder_kind)
+from book_assembly import assemble_book
+from image_pipeline import ImageManifest, description_text
+from lesson_json import write_lesson_json
+from provider_pool import Endpoint, ProviderPool
+from token_budget import LedgerStats, RunLedger, TokenBudget, approx_tokens, clip_to_tokens
+from work_queue import WorkQueue
+
+if TYPE_CHECKING:
+    from docx.document import Document
+    from memory_profile import MemoryProfiler
 
 # =============================================================
 # Configuration (API unchanged)
@@ -24,8 +68,108 @@ MAX_TOKENS = 6000
 MAX_RETRIES = 5
 BACKOFF = 2.0
 
+# Provider pool: with PROVIDERS_PATH (or --providers FILE) requests are spread
+# over several OpenAI-compatible endpoints with circuit breakers (see
+# provider_pool.py). Without it, BASE_URL/MODEL/API_KEY form a pool of one.
+PROVIDERS_PATH = ""
+
+# Adaptive output budgets: every completion is logged to the run ledger, and
+# with ADAPTIVE_MAX_TOKENS each request's max_tokens comes from the observed
+# output lengths for its (grade band, subject, doc_type, scope), between
+# token_budget.FLOOR and MAX_TOKENS_CEILING. MAX_TOKENS is used until a key
+# has enough history. Prompts ask the model to finish with STOP_SEQUENCE after
+# the last required section, and the API stops there.
+ADAPTIVE_MAX_TOKENS = False
+MAX_TOKENS_CEILING = 8192
+STOP_SEQUENCE = "END OF SECTIONS"
+
+# Prompt context: outcomes are scoped to the sub-strand being written and
+# clipped to a token budget. Truncation policy is "drop" (omit outcomes that
+# do not fit) or "clip" (shorten the last outcome that straddles the budget).
+OUTCOME_TOKEN_BUDGET = 300
+SUMMARY_TOKEN_BUDGET = 120
+TRUNCATION_POLICY = "drop"
+
+# Section-parallel mode: one request per structure heading, issued
+# concurrently and stitched back in heading order.
+SECTION_PARALLEL = False
+SECTION_WORKERS = 9
+
+# Sections missing from a completion, or cut off at MAX_TOKENS, are
+# re-requested individually instead of regenerating the whole sub-strand.
+MAX_REPAIR_ROUNDS = 1
+
+# Hedged requests: when a call is still running past the given percentile of
+# recent latencies, a duplicate is sent and the first success wins.
+HEDGE_REQUESTS = False
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX_EXTRA = 4
+LATENCY_WINDOW = 200
+
+# Staged pipeline: generation → parsing → rendering/saving, joined by bounded
+# queues. At most PIPELINE_OPEN_STRANDS strands are held in memory at once.
+PIPELINE_WORKERS = 4
+PIPELINE_QUEUE_SIZE = 16
+PIPELINE_OPEN_STRANDS = 4
+
+# Dry-run planning (--plan, --max-cost, --max-hours): requests, tokens, cost
+# and wall time are predicted from the run ledger. Keys without history fall
+# back to PLAN_DEFAULT_OUTPUT tokens at PLAN_TOKENS_PER_SECOND. Prices are USD
+# per million tokens; set them to the provider's current rates.
+INPUT_PRICE_PER_M = 0.27
+OUTPUT_PRICE_PER_M = 1.10
+PLAN_DEFAULT_OUTPUT = {"full": 3500, "section": 450, "assessment": 2500}
+PLAN_TOKENS_PER_SECOND = 30.0
+
+# Worker mode: idle workers poll the shared queue until every unit is done
+# or failed (leases held by other workers may still expire and come back).
+WORKER_POLL_SECONDS = 10
+
+# The sample command generates the first two sub-strands of one strand;
+# --grade/--subject/--strand pick it, defaulting to this grade's first.
+SAMPLE_GRADE = "4"
+
 OUTPUT_DIR = "output_docs"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+# Build manifest: DOCX outputs whose inputs (content, styles, renderer) are
+# unchanged since the last build are not rebuilt. Bump RENDERER_VERSION when
+# rendering changes in a way the source fingerprint would not catch.
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, "build_manifest.json")
+LEDGER_PATH = os.path.join(OUTPUT_DIR, "run_ledger.jsonl")
+RENDERER_VERSION = "1"
+
+# Image generation: with --images BACKEND, [IMAGE DESCRIPTION] blocks are
+# rendered to pictures (deduplicated in IMAGE_DIR) instead of grey text.
+IMAGE_DIR = os.path.join(OUTPUT_DIR, "images")
+IMAGE_WIDTH_INCHES = 4.5
+
+# Structured lesson JSON (see lesson_json.py) is written next to each DOCX
+# from the same parsed blocks, for the web app to serve section by section.
+LESSON_JSON = True
+
+# Strand assessments: with --assessments, quiz and assessment placeholders are
+# filled from one batched JSON request per strand, cached in ASSESSMENT_DIR by
+# strand content hash. The batched request covers every sub-strand, so it
+# gets ASSESSMENT_MAX_TOKENS and its raw completion is parsed as JSON.
+ASSESSMENT_DIR = os.path.join(OUTPUT_DIR, "assessments")
+ASSESSMENT_MAX_TOKENS = MAX_TOKENS_CEILING
+
+# Memory profiling (--memory-profile, see memory_profile.py): tracemalloc
+# checkpoints at stage boundaries and diffs per strand, with RSS high-water
+# marks in the run report. A warning is logged when RSS passes
+# MEMORY_ALARM_MB (0 disables it).
+MEMORY_PROFILE = False
+MEMORY_ALARM_MB = 0
+MEMORY_TOP = 10
+
+# Import-time budget for `import-budget`: importing this module must stay
+# under this many milliseconds and must not load these packages.
+IMPORT_BUDGET_MS = 150
+HEAVY_IMPORTS = ("docx", "requests", "lxml", "urllib3")
+
+def ensure_output_dir():
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # =============================================================
 # Logging helper
@@ -55,6 +199,10 @@ def apply_styles(doc: Document):
     - Body text justified with tidy spacing
     """
 
+    from docx.enum.style import WD_STYLE_TYPE
+    from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
+    from docx.shared import Inches, Pt, RGBColor
+
     base = doc.styles["Normal"]
     base.font.name = "Calibri"
     base.font.size = Pt(12)
@@ -190,6 +338,21 @@ def apply_styles(doc: Document):
             s.font.size = Pt(12)
             s.font.bold = False
 
+_styled_template: Optional[bytes] = None
+
+def new_styled_document() -> Document:
+    """A fresh Document with apply_styles() already applied, copied from a cached template."""
+    from docx import Document
+
+    global _styled_template
+    if _styled_template is None:
+        doc = Document()
+        apply_styles(doc)
+        buf = io.BytesIO()
+        doc.save(buf)
+        _styled_template = buf.getvalue()
+    return Document(io.BytesIO(_styled_template))
+
 # =============================================================
 # Paragraph helpers
 # =============================================================
@@ -221,6 +384,7 @@ def add_quiz_heading(doc: Document, text: str):
     return p
 
 def add_body_paragraph(doc: Document, text: str):
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
     p = doc.add_paragraph(text, style="BodyTextClean")
     p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
     return p
@@ -228,6 +392,13 @@ def add_body_paragraph(doc: Document, text: str):
 def add_image_description(doc: Document, text: str):
     doc.add_paragraph(text, style="ImageDescription")
 
+def add_image(doc: Document, path: str, caption: str):
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.shared import Inches
+    doc.add_picture(path, width=Inches(IMAGE_WIDTH_INCHES))
+    doc.paragraphs[-1].alignment = WD_ALIGN_PARAGRAPH.CENTER
+    add_image_description(doc, caption)
+
 def add_placeholder(doc: Document, text: str):
     doc.add_paragraph(text, style="PlaceholderText")
 
@@ -240,9 +411,23 @@ def add_differentiation(doc: Document, text: str):
 def add_assessment_callout(doc: Document, text: str):
     doc.add_paragraph(text, style="AssessmentCallout")
 
+def add_assessment_items(doc: Document, items: List[Dict[str, Any]], doc_type: str):
+    """Numbered questions with lettered options; the Teacher doc adds the answers."""
+    for i, item in enumerate(items, start=1):
+        marks = f" ({item['marks']} marks)" if item["marks"] > 1 else ""
+        add_manual_number_item(doc, i, item["question"] + marks)
+        options = item.get("options", [])
+        for j, option in enumerate(options):
+            add_bullet_item(doc, f"{chr(65 + j)}. {option}", 1)
+        if doc_type == "Teacher":
+            answer = f"{chr(65 + item['answer'])}. {options[item['answer']]}" if options else item["answer"]
+            explanation = f" — {item['explanation']}" if item.get("explanation") else ""
+            add_assessment_callout(doc, f"Answer: {answer}{explanation}")
+
 def add_bullet_item(doc: Document, text: str, level: int = 0):
     p = doc.add_paragraph(text, style="List Bullet")
     if level:
+        from docx.shared import Inches
         p.paragraph_format.left_indent = Inches(0.3 * level)
     return p
 
@@ -251,6 +436,9 @@ def add_manual_number_item(doc: Document, index: int, text: str, level: int = 0)
     Manual numbering paragraph to guarantee restart per section.
     Creates hanging indent that aligns wrapped lines like Word lists.
     """
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.shared import Inches
+
     p = doc.add_paragraph(style="BodyTextClean")
     base_indent = 0.3 * (level + 1)
     p.paragraph_format.left_indent = Inches(base_indent)
@@ -273,6 +461,8 @@ def clean_model_output(text: str) -> str:
     text = text.replace("**", "").replace("__", "").replace("_", "")
     # Convert stray '*' bullets to '-'
     text = re.sub(r"^\s*\*\s+", "- ", text, flags=re.MULTILINE)
+    # Drop the end marker if the API did not stop on it
+    text = re.sub(rf"^\s*{STOP_SEQUENCE}\s*$", "", text, flags=re.MULTILINE | re.IGNORECASE)
     # Collapse excessive blank lines
     text = re.sub(r"\n{3,}", "\n\n", text)
     return text.strip()
@@ -433,22 +623,134 @@ def parse_blocks(raw: str, doc_type: str) -> List[Dict[str, Any]]:
 # Grade tone
 # =============================================================
 
-def get_grade_tone(grade: str) -> str:
+GRADE_TONES = {
+    "lower": "clear, friendly language with concrete Kenyan and global everyday examples",
+    "middle": "explanatory and analytical writing with both Kenyan and global contexts and comparisons",
+    "upper": "precise, academic exposition with rigorous detail, including Kenyan and global applications",
+}
+
+def grade_band(grade: str) -> str:
     g = int(grade)
     if g <= 6:
-        return "clear, friendly language with concrete Kenyan and global everyday examples"
+        return "lower"
     elif g <= 9:
-        return "explanatory and analytical writing with both Kenyan and global contexts and comparisons"
+        return "middle"
     else:
-        return "precise, academic exposition with rigorous detail, including Kenyan and global applications"
+        return "upper"
+
+def get_grade_tone(grade: str) -> str:
+    return GRADE_TONES[grade_band(grade)]
+
+# =============================================================
+# Prompt context — per sub-strand outcomes + compact strand summary
+# =============================================================
+
+def fit_to_budget(items: List[str], budget: int, policy: str = TRUNCATION_POLICY) -> List[str]:
+    """
+    Keep items in order while their combined approx_tokens count stays within budget.
+    'drop' omits everything past the budget; 'clip' shortens the item that
+    crosses it so the remaining budget is still used.
+    """
+    if policy not in ("drop", "clip"):
+        raise ValueError(f"Unknown truncation policy: {policy}")
+
+    kept: List[str] = []
+    used = 0
+    for item in items:
+        cost = approx_tokens(item) + 1  # separator
+        if used + cost <= budget:
+            kept.append(item)
+            used += cost
+            continue
+        if policy == "clip":
+            room = budget - used - 2  # separator and ellipsis
+            if room >= 4:
+                kept.append(clip_to_tokens(item, room).rstrip() + "…")
+        break
+    return kept
+
+def summarize_strand(strand: str, substrand: str, strand_subs: Dict[str, Any],
+                     budget: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """One-line strand summary: where this sub-strand sits and what its siblings cover."""
+    names = list(strand_subs.keys())
+    position = names.index(substrand) + 1 if substrand in names else 0
+    siblings = [n for n in names if n != substrand]
+    head = f"{strand} has {len(names)} sub-strands"
+    if position:
+        head += f"; this is number {position}"
+    if not siblings:
+        return head + "."
+    room = budget - approx_tokens(head) - 4
+    shown = fit_to_budget(siblings, room, "drop")
+    text = f"{head}. Other sub-strands: {'; '.join(shown)}"
+    if len(shown) < len(siblings):
+        text += f" (+{len(siblings) - len(shown)} more)"
+    return text + "."
+
+def build_prompt_context(strand: str, substrand: str, strand_subs: Dict[str, Any],
+                         outcome_budget: int = OUTCOME_TOKEN_BUDGET,
+                         summary_budget: int = SUMMARY_TOKEN_BUDGET,
+                         policy: str = TRUNCATION_POLICY) -> Dict[str, Any]:
+    """
+    Returns {'outcomes': [...], 'strand_summary': str} for one sub-strand.
+    Falls back to the strand's pooled outcomes when the sub-strand lists none,
+    still bounded by the same budget.
+    """
+    details = strand_subs.get(substrand) or {}
+    outcomes = list(details.get("learning_outcomes", []))
+    if not outcomes:
+        for other in strand_subs.values():
+            outcomes.extend((other or {}).get("learning_outcomes", []))
+    return {
+        "outcomes": fit_to_budget(outcomes, outcome_budget, policy),
+        "strand_summary": summarize_strand(strand, substrand, strand_subs, summary_budget),
+    }
 
 # =============================================================
 # Prompts — fully immersive (Kenya + global, relationships, depth)
 # =============================================================
 
-def student_prompt(grade, subject, strand, substrand, strand_outcomes):
-    outcomes_text = ", ".join(strand_outcomes)
+STUDENT_SECTIONS = [
+    "Overview:",
+    "Key Ideas and Relationships:",
+    "Detailed Explanations:",
+    "Worked Example (Kenyan Context):",
+    "Worked Example (Global Context):",
+    "Applications and Real-Life Connections:",
+    "Vocabulary and Terms:",
+    "Common Misconceptions and Corrections:",
+    "Summary:",
+]
+
+TEACHER_SECTIONS = [
+    "Lesson Objectives (aligned to outcomes):",
+    "Prerequisites and Concept Relationships:",
+    "Lesson Flow (Engage, Explore, Explain, Elaborate, Evaluate):",
+    "Questioning and Checks for Understanding:",
+    "Differentiation:",
+    "Materials and Resources:",
+    "Assessment Strategies and Criteria:",
+    "Common Misconceptions and Remedies:",
+    "Cross-Curricular and Real-World Connections:",
+]
+
+def structure_text(all_sections: List[str], sections: Optional[List[str]]) -> str:
+    """
+    Structure block of a prompt. With a subset of sections the model is told
+    to write only those, so each section request shares the same context.
+    """
+    end = f"\nAfter the last section, write {STOP_SEQUENCE} on its own line and nothing else."
+    if sections is None:
+        return "Structure (use plain text headings in this order):\n" + "\n".join(all_sections) + end
+    return (
+        "Write ONLY the section(s) below, starting each with its heading exactly as shown. "
+        "The other sections of this sub-strand are written separately:\n" + "\n".join(sections) + end
+    )
+
+def student_prompt(grade, subject, strand, substrand, outcomes, strand_summary="", sections=None):
+    outcomes_text = ", ".join(outcomes)
     tone = get_grade_tone(grade)
+    structure = structure_text(STUDENT_SECTIONS, sections)
     return f"""
 You are a professional CBC textbook writer for Grade {grade} {subject}.
 
@@ -462,26 +764,19 @@ Quality requirements:
 - Include both Kenyan and global context/examples.
 - When appropriate for Grade {grade}, include formal notation, symbols, or precise terminology.
 
-Structure (use plain text headings in this order):
-Overview:
-Key Ideas and Relationships:
-Detailed Explanations:
-Worked Example (Kenyan Context):
-Worked Example (Global Context):
-Applications and Real-Life Connections:
-Vocabulary and Terms:
-Common Misconceptions and Corrections:
-Summary:
+{structure}
 [IMAGE DESCRIPTION] lines wherever visuals would help.
 
 Strand: {strand}
+Strand Summary: {strand_summary}
 Sub-Strand: {substrand}
-Strand Learning Outcomes: {outcomes_text}
+Sub-Strand Learning Outcomes: {outcomes_text}
 """
 
-def teacher_prompt(grade, subject, strand, substrand, strand_outcomes):
-    outcomes_text = ", ".join(strand_outcomes)
+def teacher_prompt(grade, subject, strand, substrand, outcomes, strand_summary="", sections=None):
+    outcomes_text = ", ".join(outcomes)
     tone = get_grade_tone(grade)
+    structure = structure_text(TEACHER_SECTIONS, sections)
     return f"""
 You are generating a TEACHER'S GUIDE for Grade {grade} {subject}.
 
@@ -495,65 +790,589 @@ Quality requirements:
 - Provide questioning strategies and checkpoints for understanding.
 - Include differentiation (support and extension), materials, and assessment strategies with criteria (no item lists).
 
-Structure (use plain text headings in this order):
-Lesson Objectives (aligned to outcomes):
-Prerequisites and Concept Relationships:
-Lesson Flow (Engage, Explore, Explain, Elaborate, Evaluate):
-Questioning and Checks for Understanding:
-Differentiation:
-Materials and Resources:
-Assessment Strategies and Criteria:
-Common Misconceptions and Remedies:
-Cross-Curricular and Real-World Connections:
+{structure}
 [IMAGE DESCRIPTION] suggestions where useful.
 
 Strand: {strand}
+Strand Summary: {strand_summary}
 Sub-Strand: {substrand}
-Strand Learning Outcomes: {outcomes_text}
+Sub-Strand Learning Outcomes: {outcomes_text}
+"""
+
+def assessment_prompt(grade, subject, strand, strand_subs):
+    tone = get_grade_tone(grade)
+    lines = []
+    for sub, details in strand_subs.items():
+        outcomes = fit_to_budget(list((details or {}).get("learning_outcomes", [])), OUTCOME_TOKEN_BUDGET)
+        lines.append(f"- {sub}: {', '.join(outcomes)}")
+    subs_text = "\n".join(lines)
+    return f"""
+You are a CBC assessment writer for Grade {grade} {subject}.
+
+Write quiz and assessment items for every sub-strand of the strand below, and a strand-level assessment.
+Use {tone}. Include Kenyan and global contexts where natural.
+
+Return ONLY a JSON object, no prose and no code fences, in exactly this shape:
+{{"substrands": [{{"title": "<sub-strand title exactly as given>",
+                 "quiz": [{{"question": "...", "options": ["...", "...", "...", "..."], "answer": 0, "explanation": "..."}}],
+                 "assessment": [{{"question": "...", "answer": "<model answer or marking points>", "marks": 2}}]}}],
+ "strand": [{{"question": "...", "answer": "...", "marks": 4}}]}}
+
+Per sub-strand: {QUIZ_ITEMS} multiple-choice quiz items (four options, "answer" is the index of the correct option)
+and {SUBSTRAND_ASSESSMENT_ITEMS} short-answer assessment items. Strand: {STRAND_ASSESSMENT_ITEMS} items mixing
+multiple choice and short answer, covering the whole strand. Each item must test a listed outcome.
+
+Strand: {strand}
+Sub-Strands and Learning Outcomes:
+{subs_text}
 """
 
 # =============================================================
-# API Request Handler (unchanged)
+# Prompt size report
 # =============================================================
 
-def api_request(prompt: str) -> str:
-    headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
-    payload = {
-        "model": MODEL,
-        "messages": [{"role": "system", "content": prompt}],
-        "temperature": TEMPERATURE,
-        "max_tokens": MAX_TOKENS
-    }
+def prompt_size_report(curriculum: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Compares prompt tokens for every sub-strand in the curriculum: the old
+    layout (all strand outcomes in every prompt) against scoped context.
+    """
+    legacy = scoped = prompts = 0
+    for grade, subjects in curriculum.items():
+        for subject, strands in subjects.items():
+            for strand, subs in strands.items():
+                pooled: List[str] = []
+                for details in subs.values():
+                    pooled.extend((details or {}).get("learning_outcomes", []))
+                for sub in subs:
+                    ctx = build_prompt_context(strand, sub, subs)
+                    for build in (student_prompt, teacher_prompt):
+                        legacy += approx_tokens(build(grade, subject, strand, sub, pooled))
+                        scoped += approx_tokens(build(grade, subject, strand, sub, ctx["outcomes"], ctx["strand_summary"]))
+                        prompts += 1
+    return {"prompts": prompts, "legacy_tokens": legacy, "scoped_tokens": scoped}
+
+def log_prompt_size_report(report: Dict[str, int]):
+    legacy, scoped = report["legacy_tokens"], report["scoped_tokens"]
+    saved = (1 - scoped / legacy) * 100 if legacy else 0.0
+    log(f"Prompt size: {report['prompts']} prompts, ~{legacy:,} → ~{scoped:,} input tokens ({saved:.1f}% smaller)")
+
+# =============================================================
+# Dry-run plan — requests, tokens, cost and duration before a run
+# =============================================================
 
+def plan_run(strands, section_parallel: bool = SECTION_PARALLEL, assessments: bool = False,
+             concurrency: int = PIPELINE_WORKERS) -> Dict[str, Any]:
+    """
+    Builds every prompt the run would send, without sending it. Input tokens
+    come from approx_tokens; output tokens and latency per request from the
+    ledger (see LedgerStats), or the PLAN_DEFAULT_OUTPUT fallbacks. Wall time
+    assumes `concurrency` requests in flight at all times. Repairs and
+    retries are not included.
+    """
+    stats = LedgerStats(RunLedger(LEDGER_PATH))
+    plan: Dict[str, Any] = {"strands": 0, "substrands": 0, "requests": 0, "input_tokens": 0,
+                            "output_tokens": 0, "request_seconds": 0.0, "from_history": 0, "by_grade": {}}
+
+    def add(grade: str, prompt: str, key: Tuple[str, str, str, str]):
+        expected = stats.expect(key)
+        if expected:
+            output, seconds = expected
+            plan["from_history"] += 1
+        else:
+            output = PLAN_DEFAULT_OUTPUT[key[3]]
+            seconds = output / PLAN_TOKENS_PER_SECOND
+        tokens = approx_tokens(prompt)
+        plan["requests"] += 1
+        plan["input_tokens"] += tokens
+        plan["output_tokens"] += int(output)
+        plan["request_seconds"] += seconds
+        grade_totals = plan["by_grade"].setdefault(grade, {"requests": 0, "input_tokens": 0, "output_tokens": 0})
+        grade_totals["requests"] += 1
+        grade_totals["input_tokens"] += tokens
+        grade_totals["output_tokens"] += int(output)
+
+    for grade, subject, strand_name, details in strands:
+        if not details:
+            continue
+        plan["strands"] += 1
+        for sub in details:
+            plan["substrands"] += 1
+            ctx = build_prompt_context(strand_name, sub, details)
+            for doc_type in DOC_TYPES:
+                build = doc_prompt(doc_type)
+                if section_parallel:
+                    for heading in doc_sections(doc_type):
+                        prompt = build(grade, subject, strand_name, sub, ctx["outcomes"], ctx["strand_summary"],
+                                       sections=[heading])
+                        add(grade, prompt, budget_key(grade, subject, doc_type, "section"))
+                else:
+                    prompt = build(grade, subject, strand_name, sub, ctx["outcomes"], ctx["strand_summary"])
+                    add(grade, prompt, budget_key(grade, subject, doc_type, "full"))
+        if assessments:
+            add(grade, assessment_prompt(grade, subject, strand_name, details),
+                budget_key(grade, subject, "Assessment", "assessment"))
+
+    plan["concurrency"] = max(1, concurrency)
+    plan["hours"] = plan["request_seconds"] / plan["concurrency"] / 3600
+    plan["cost"] = (plan["input_tokens"] * INPUT_PRICE_PER_M + plan["output_tokens"] * OUTPUT_PRICE_PER_M) / 1e6
+    return plan
+
+def log_plan(plan: Dict[str, Any]):
+    for grade, totals in plan["by_grade"].items():
+        log(f"Plan: Grade {grade}: {totals['requests']:,} requests, ~{totals['input_tokens']:,} in / "
+            f"~{totals['output_tokens']:,} out tokens")
+    share = plan["from_history"] / plan["requests"] * 100 if plan["requests"] else 0.0
+    log(f"Plan: {plan['strands']} strands, {plan['substrands']} sub-strands, {plan['requests']:,} requests "
+        f"({share:.0f}% estimated from ledger history)")
+    log(f"Plan: ~{plan['input_tokens']:,} input + ~{plan['output_tokens']:,} output tokens, "
+        f"~${plan['cost']:,.2f}, ~{plan['hours']:.1f} h at concurrency {plan['concurrency']}")
+
+def plan_within_limits(plan: Dict[str, Any], max_cost: Optional[float] = None,
+                       max_hours: Optional[float] = None) -> bool:
+    ok = True
+    if max_cost is not None and plan["cost"] > max_cost:
+        log(f"Plan exceeds the cost ceiling: ~${plan['cost']:,.2f} > ${max_cost:,.2f}")
+        ok = False
+    if max_hours is not None and plan["hours"] > max_hours:
+        log(f"Plan exceeds the time ceiling: ~{plan['hours']:.1f} h > {max_hours:.1f} h")
+        ok = False
+    return ok
+
+# =============================================================
+# API Request Handler
+# =============================================================
+
+def api_complete(prompt: str, cancel: Optional[threading.Event] = None,
+                 max_tokens: Optional[int] = None, stop: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Returns {'text': cleaned content, 'raw': content as received,
+    'finish_reason': str, 'output_tokens': int, 'latency': float}. finish_reason is 'length' when the completion hit
+    max_tokens (default MAX_TOKENS) and '' when every attempt failed or the
+    call was cancelled.
+
+    Each attempt goes to the pool's best endpoint that this call has not
+    tried yet, so a failure moves on at once. The call only backs off once
+    every endpoint has failed it, or when all breakers are open.
+    """
+    import requests
+
+    pool = provider_pool()
+    tried: set = set()
     for attempt in range(1, MAX_RETRIES + 1):
+        if cancel is not None and cancel.is_set():
+            break
+        if len(tried) >= len(pool.endpoints):
+            time.sleep(BACKOFF * attempt)
+            tried.clear()
+        ep = pool.acquire(tried)
+        if ep is None:
+            wait_seconds = max(BACKOFF * attempt, pool.retry_after())
+            log(f"API: no healthy endpoint, waiting {wait_seconds:.0f}s")
+            time.sleep(wait_seconds)
+            tried.clear()
+            continue
+        tried.add(ep.name)
+
+        headers = {"Authorization": f"Bearer {ep.api_key}", "Content-Type": "application/json"}
+        payload = {
+            "model": ep.model,
+            "messages": [{"role": "system", "content": prompt}],
+            "temperature": TEMPERATURE,
+            "max_tokens": max_tokens or MAX_TOKENS
+        }
+        if stop:
+            payload["stop"] = stop
         try:
-            response = requests.post(BASE_URL, headers=headers, json=payload, timeout=600)
+            started = time.monotonic()
+            response = requests.post(ep.base_url, headers=headers, json=payload, timeout=600)
             if response.status_code == 200:
+                latency = time.monotonic() - started
                 data = response.json()
-                return clean_model_output(data["choices"][0]["message"]["content"])
-            if response.status_code in (429, 500, 502, 503, 504):
-                log(f"API retry {attempt} due to {response.status_code}")
-                time.sleep(BACKOFF * attempt)
+                choice = data["choices"][0]
+                content = choice["message"]["content"]
+                if not isinstance(content, str):
+                    raise ValueError(f"malformed completion: content is {type(content).__name__}")
+                result = {
+                    "text": clean_model_output(content),
+                    "raw": content,
+                    "finish_reason": choice.get("finish_reason") or "stop",
+                    "output_tokens": (data.get("usage") or {}).get("completion_tokens") or approx_tokens(content),
+                    "latency": latency,
+                }
             else:
-                response.raise_for_status()
+                result = None
         except Exception as e:
-            log(f"API error attempt {attempt}: {e}")
-            time.sleep(BACKOFF * attempt)
+            pool.failure(ep)
+            log(f"API error attempt {attempt} ({ep.name}): {e}")
+            continue
+
+        # The endpoint is released exactly once, after the body has been validated
+        if result is not None:
+            pool.success(ep, latency)
+            record_latency(latency)
+            return result
+        pool.failure(ep)
+        if response.status_code in (429, 500, 502, 503, 504):
+            log(f"API retry {attempt} ({ep.name}) due to {response.status_code}")
+        else:
+            log(f"API error attempt {attempt} ({ep.name}): HTTP {response.status_code}")
+
+    return {"text": "", "raw": "", "finish_reason": "", "output_tokens": 0, "latency": 0.0}
+
+def api_request(prompt: str) -> str:
+    return hedged_complete(prompt)["text"]
+
+def assessment_request(prompt: str, grade: str, subject: str) -> str:
+    """
+    The batched assessment completion, uncleaned: clean_model_output would
+    strip '_' and '**' out of the JSON. Logged to the run ledger under the
+    key plan_run estimates assessments from.
+    """
+    result = hedged_complete(prompt, ASSESSMENT_MAX_TOKENS)
+    if result["finish_reason"]:
+        token_budget().record(budget_key(grade, subject, "Assessment", "assessment"), approx_tokens(prompt),
+                              result["output_tokens"], result["finish_reason"], ASSESSMENT_MAX_TOKENS,
+                              result["latency"])
+    if result["finish_reason"] == "length":
+        log(f"Assessment completion cut off at {ASSESSMENT_MAX_TOKENS} tokens")
+    return result["raw"]
+
+_provider_pool: Optional[ProviderPool] = None
+_provider_pool_lock = threading.Lock()
+
+def provider_pool() -> ProviderPool:
+    """The process-wide endpoint pool, from PROVIDERS_PATH or the single configured endpoint."""
+    global _provider_pool
+    with _provider_pool_lock:
+        if _provider_pool is None:
+            if PROVIDERS_PATH:
+                _provider_pool = ProviderPool.from_file(PROVIDERS_PATH)
+            else:
+                _provider_pool = ProviderPool([Endpoint("default", BASE_URL, MODEL, API_KEY)])
+        return _provider_pool
 
-    return ""
+def have_api_key() -> bool:
+    return any(ep.api_key for ep in provider_pool().endpoints)
+
+# =============================================================
+# Output token budgets (see token_budget.py)
+# =============================================================
+
+_token_budget: Optional[TokenBudget] = None
+_token_budget_lock = threading.Lock()
+
+def token_budget() -> TokenBudget:
+    """The process-wide budget model, loaded from the ledger on first use."""
+    global _token_budget
+    with _token_budget_lock:
+        if _token_budget is None:
+            os.makedirs(os.path.dirname(LEDGER_PATH) or ".", exist_ok=True)
+            _token_budget = TokenBudget(RunLedger(LEDGER_PATH), MAX_TOKENS, MAX_TOKENS_CEILING)
+        return _token_budget
+
+def budget_key(grade: str, subject: str, doc_type: str, scope: str) -> Tuple[str, str, str, str]:
+    return grade_band(grade), subject, doc_type, scope
+
+def budgeted_complete(prompt: str, grade: str, subject: str, doc_type: str, scope: str,
+                      cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    hedged_complete for a lesson prompt: max_tokens from the budget model
+    (with ADAPTIVE_MAX_TOKENS), the end-of-sections stop sequence, and the
+    call logged to the run ledger. scope is 'full' or 'section'.
+    """
+    budget = token_budget()
+    key = budget_key(grade, subject, doc_type, scope)
+    max_tokens = budget.max_tokens(key) if ADAPTIVE_MAX_TOKENS else MAX_TOKENS
+    result = hedged_complete(prompt, max_tokens, [STOP_SEQUENCE], cancel)
+    if result["finish_reason"]:
+        budget.record(key, approx_tokens(prompt), result["output_tokens"], result["finish_reason"],
+                      max_tokens, result["latency"])
+    return result
+
+# =============================================================
+# Hedged requests
+# =============================================================
+
+_latencies: deque = deque(maxlen=LATENCY_WINDOW)
+_latency_lock = threading.Lock()
+_hedge_slots = threading.BoundedSemaphore(HEDGE_MAX_EXTRA)
+HEDGE_STATS = {"requests": 0, "hedges_fired": 0, "hedge_wins": 0, "hedges_capped": 0}
+
+def record_latency(seconds: float):
+    with _latency_lock:
+        _latencies.append(seconds)
+
+def latency_percentile(pct: float) -> Optional[float]:
+    """Latency at the given percentile of recent successful calls, or None with too few samples."""
+    with _latency_lock:
+        samples = sorted(_latencies)
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    idx = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[idx]
+
+def _bump(stat: str):
+    with _latency_lock:
+        HEDGE_STATS[stat] += 1
+
+class LinkedEvent(threading.Event):
+    """An Event that also reads as set once its parent is set."""
+
+    def __init__(self, parent: Optional[threading.Event] = None):
+        super().__init__()
+        self.parent = parent
+
+    def is_set(self) -> bool:
+        return super().is_set() or (self.parent is not None and self.parent.is_set())
+
+def hedged_complete(prompt: str, max_tokens: Optional[int] = None,
+                    stop: Optional[List[str]] = None, cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    api_complete with optional hedging. A call that outlives the latency
+    percentile gets one duplicate (if a hedge slot is free); the first
+    non-empty result wins and the other call is told to stop. requests has no
+    way to abort a read in progress, so the loser is abandoned: it stops
+    retrying and its result is discarded. Setting `cancel` stops both.
+    """
+    threshold = latency_percentile(HEDGE_PERCENTILE) if HEDGE_REQUESTS else None
+    if threshold is None:
+        return api_complete(prompt, cancel, max_tokens, stop)
+
+    _bump("requests")
+    pool = ThreadPoolExecutor(max_workers=2)
+    cancels = {}
+    try:
+        primary_cancel = LinkedEvent(cancel)
+        primary = pool.submit(api_complete, prompt, primary_cancel, max_tokens, stop)
+        cancels[primary] = primary_cancel
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result()
+
+        if not _hedge_slots.acquire(blocking=False):
+            _bump("hedges_capped")
+            return primary.result()
+
+        _bump("hedges_fired")
+        hedge_cancel = LinkedEvent(cancel)
+        hedge = pool.submit(api_complete, prompt, hedge_cancel, max_tokens, stop)
+        cancels[hedge] = hedge_cancel
+        hedge.add_done_callback(lambda _f: _hedge_slots.release())
+
+        pending = {primary, hedge}
+        result = {"text": "", "raw": "", "finish_reason": "", "output_tokens": 0, "latency": 0.0}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                candidate = fut.result()
+                if candidate["text"]:
+                    if fut is hedge:
+                        _bump("hedge_wins")
+                    return candidate
+                result = candidate
+        return result
+    finally:
+        for ev in cancels.values():
+            ev.set()
+        pool.shutdown(wait=False)
+
+# =============================================================
+# Memory profiling (see memory_profile.py)
+# =============================================================
+
+_memory_profiler: Optional[MemoryProfiler] = None
+
+def start_memory_profile(alarm_mb: float = MEMORY_ALARM_MB):
+    """Starts tracing; imported here because tracemalloc is only needed with --memory-profile."""
+    global _memory_profiler
+    from memory_profile import MemoryProfiler
+    _memory_profiler = MemoryProfiler(MEMORY_TOP, alarm_mb, log)
+    _memory_profiler.start()
+
+def memory_checkpoint(stage: str):
+    if _memory_profiler is not None:
+        _memory_profiler.checkpoint(stage)
+
+def memory_snapshot(label: str):
+    if _memory_profiler is not None:
+        _memory_profiler.snapshot(label)
+
+def finish_memory_profile(report: Dict[str, Any]):
+    """Adds the "memory" section to the run report and logs the high-water marks."""
+    global _memory_profiler
+    if _memory_profiler is None:
+        return
+    memory = report["memory"] = _memory_profiler.stop()
+    _memory_profiler = None
+    log(f"Memory: RSS peak {memory['rss_peak_mb']} MB, traced peak {memory['traced_peak_mb']} MB, "
+        f"{memory['growth_per_snapshot_kb']} KB retained per strand, {len(memory['alarms'])} alarms")
+
+# =============================================================
+# Run report
+# =============================================================
+
+def new_run_report() -> Dict[str, Any]:
+    return {"started": datetime.now().isoformat(timespec="seconds"), "repairs": []}
+
+def save_run_report(report: Dict[str, Any]) -> str:
+    report["finished"] = datetime.now().isoformat(timespec="seconds")
+    ensure_output_dir()
+    path = os.path.join(OUTPUT_DIR, f"run_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return path
+
+# =============================================================
+# Sub-strand generation (whole completion or section-parallel)
+# =============================================================
+
+def doc_sections(doc_type: str) -> List[str]:
+    return TEACHER_SECTIONS if doc_type.lower().startswith("teacher") else STUDENT_SECTIONS
+
+def doc_prompt(doc_type: str):
+    return teacher_prompt if doc_type.lower().startswith("teacher") else student_prompt
+
+def heading_key(heading: str, doc_type: str) -> str:
+    """The section heading text parse_blocks produces for a structure heading."""
+    blocks = parse_blocks(heading, doc_type)
+    if blocks and blocks[0]["type"] == "section_heading":
+        return blocks[0]["text"].lower()
+    return heading.rstrip(":").strip().lower()
+
+def split_sections(text: str, doc_type: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Splits raw output on the expected structure headings.
+    Returns (preamble, {structure heading: section text including its heading line}).
+    """
+    keys = {heading_key(h, doc_type): h for h in doc_sections(doc_type)}
+    preamble: List[str] = []
+    sections: Dict[str, List[str]] = {}
+    current = preamble
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped:
+            blocks = parse_blocks(stripped, doc_type)
+            if blocks and blocks[0]["type"] == "section_heading":
+                heading = keys.get(blocks[0]["text"].lower())
+                if heading and heading not in sections:
+                    sections[heading] = []
+                    current = sections[heading]
+        current.append(line)
+    return "\n".join(preamble).strip(), {h: "\n".join(lines).strip() for h, lines in sections.items()}
+
+def stitch_sections(headings: List[str], outputs: List[str], preamble: str = "") -> str:
+    """Joins section outputs in heading order, restoring any heading the model left out."""
+    parts = [preamble] if preamble else []
+    for heading, text in zip(headings, outputs):
+        text = text.strip()
+        if not text:
+            continue
+        if not text.lower().startswith(heading[:-1].lower()):
+            text = f"{heading}\n{text}"
+        parts.append(text)
+    return "\n\n".join(parts)
+
+def sections_needing_repair(text: str, doc_type: str, truncated: List[str]) -> List[str]:
+    """Structure headings that are missing from the output or were cut off at max_tokens."""
+    _, found = split_sections(text, doc_type)
+    return [h for h in doc_sections(doc_type) if h not in found or h in truncated]
+
+def request_sections(doc_type: str, grade: str, subject: str, strand: str, substrand: str,
+                     ctx: Dict[str, Any], headings: List[str], workers: int = SECTION_WORKERS,
+                     cancel: Optional[threading.Event] = None) -> List[Dict[str, str]]:
+    """One request per heading, issued in parallel with shared context."""
+    build = doc_prompt(doc_type)
+    prompts = [
+        build(grade, subject, strand, substrand, ctx["outcomes"], ctx["strand_summary"], sections=[h])
+        for h in headings
+    ]
+    if not prompts:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(prompts)))) as pool:
+        return list(pool.map(lambda p: budgeted_complete(p, grade, subject, doc_type, "section", cancel), prompts))
+
+def generate_sections(doc_type: str, grade: str, subject: str, strand: str, substrand: str,
+                      ctx: Dict[str, Any], cancel: Optional[threading.Event] = None) -> Tuple[str, List[str]]:
+    """Section-parallel generation. Returns (stitched text, truncated headings)."""
+    headings = doc_sections(doc_type)
+    results = request_sections(doc_type, grade, subject, strand, substrand, ctx, headings, cancel=cancel)
+    truncated = [h for h, r in zip(headings, results) if r["finish_reason"] == "length"]
+    return stitch_sections(headings, [r["text"] for r in results]), truncated
+
+def repair_sections(doc_type: str, grade: str, subject: str, strand: str, substrand: str,
+                    ctx: Dict[str, Any], text: str, truncated: List[str],
+                    report: Optional[Dict[str, Any]] = None, cancel: Optional[threading.Event] = None) -> str:
+    """
+    Re-requests only the missing or truncated sections and splices them back
+    in structure order. Repairs are recorded in the run report.
+    """
+    for round_no in range(1, MAX_REPAIR_ROUNDS + 1):
+        needed = sections_needing_repair(text, doc_type, truncated)
+        if not needed or (cancel is not None and cancel.is_set()):
+            break
+        log(f"Repairing {doc_type} → {substrand}: {len(needed)} section(s)")
+        results = request_sections(doc_type, grade, subject, strand, substrand, ctx, needed, cancel=cancel)
+        preamble, found = split_sections(text, doc_type)
+        for heading, result in zip(needed, results):
+            if result["text"].strip():
+                found[heading] = result["text"]
+        truncated = [h for h, r in zip(needed, results) if r["finish_reason"] == "length"]
+        headings = [h for h in doc_sections(doc_type) if h in found]
+        text = stitch_sections(headings, [found[h] for h in headings], preamble)
+        if report is not None:
+            report["repairs"].append({
+                "doc_type": doc_type,
+                "substrand": substrand,
+                "round": round_no,
+                "sections": needed,
+                "still_truncated": truncated,
+            })
+    return text
+
+def generate_substrand(doc_type: str, grade: str, subject: str, strand: str, substrand: str,
+                       ctx: Dict[str, Any], section_parallel: bool = SECTION_PARALLEL,
+                       report: Optional[Dict[str, Any]] = None, cancel: Optional[threading.Event] = None) -> str:
+    """
+    One sub-strand's text, whole or section-parallel, with missing sections
+    repaired. Setting `cancel` stops every request this call has in flight.
+    """
+    if section_parallel:
+        text, truncated = generate_sections(doc_type, grade, subject, strand, substrand, ctx, cancel)
+    else:
+        build = doc_prompt(doc_type)
+        prompt = build(grade, subject, strand, substrand, ctx["outcomes"], ctx["strand_summary"])
+        result = budgeted_complete(prompt, grade, subject, doc_type, "full", cancel)
+        text = result["text"]
+        truncated = []
+        if result["finish_reason"] == "length":
+            _, found = split_sections(text, doc_type)
+            truncated = list(found)[-1:]
+    return repair_sections(doc_type, grade, subject, strand, substrand, ctx, text, truncated, report, cancel)
 
 # =============================================================
 # DOCX Builder — structured rendering with list reset & suppression
 # =============================================================
 
-def render_blocks(doc: Document, blocks: List[Dict[str, Any]], doc_type: str, current_substrand: str):
+def render_blocks(doc: Document, blocks: List[Dict[str, Any]], doc_type: str, current_substrand: str,
+                  images: Optional[ImageManifest] = None,
+                  assessment: Optional[Dict[str, List[Dict[str, Any]]]] = None):
     """
     Writes structured blocks with appropriate styles.
     - Numbered lists are rendered manually to restart per section.
     - Quiz and Assessment sections are placeholders; content under them is skipped.
+      With `assessment` ({'quiz': items, 'assessment': items}) the generated
+      items replace the first placeholder of each kind.
     - Exercise sections are suppressed entirely.
+    - Image descriptions become pictures when `images` has one generated.
     """
     suppress_until_next_heading: Optional[str] = None  # 'quiz' | 'assessment' | 'exercise'
+    pending = dict(assessment or {})
+
+    def fill(kind: str) -> bool:
+        items = pending.pop(kind, None)
+        if items:
+            add_assessment_items(doc, items, doc_type)
+        return bool(items)
 
     for blk in blocks:
         t = blk["type"]
@@ -571,11 +1390,13 @@ def render_blocks(doc: Document, blocks: List[Dict[str, Any]], doc_type: str, cu
                 suppress_until_next_heading = "exercise"
             elif kind == "quiz":
                 add_quiz_heading(doc, text)
-                add_placeholder(doc, f"Placeholder: Quiz for sub-strand '{current_substrand}'.")
+                if not fill("quiz"):
+                    add_placeholder(doc, f"Placeholder: Quiz for sub-strand '{current_substrand}'.")
                 suppress_until_next_heading = "quiz"
             elif kind == "assessment":
                 add_section_heading(doc, "Assessment")
-                add_placeholder(doc, f"Placeholder: Assessment for sub-strand '{current_substrand}'.")
+                if not fill("assessment"):
+                    add_placeholder(doc, f"Placeholder: Assessment for sub-strand '{current_substrand}'.")
                 suppress_until_next_heading = "assessment"
             else:
                 add_section_heading(doc, text)
@@ -587,9 +1408,18 @@ def render_blocks(doc: Document, blocks: List[Dict[str, Any]], doc_type: str, cu
         if t == "paragraph":
             add_body_paragraph(doc, blk["text"])
         elif t == "image_description":
-            add_image_description(doc, blk["text"])
+            path = images.file_for(blk["text"]) if images else None
+            if path:
+                add_image(doc, path, description_text(blk["text"]))
+            else:
+                add_image_description(doc, blk["text"])
         elif t == "placeholder":
-            add_placeholder(doc, blk["text"])
+            kind = placeholder_kind(blk["text"])
+            if kind and pending.get(kind):
+                (add_quiz_heading if kind == "quiz" else add_section_heading)(doc, kind.title())
+                fill(kind)
+            else:
+                add_placeholder(doc, blk["text"])
         elif t == "teacher_note":
             add_teacher_note(doc, blk["text"])
         elif t == "bullet_list":
@@ -602,83 +1432,768 @@ def render_blocks(doc: Document, blocks: List[Dict[str, Any]], doc_type: str, cu
             if "text" in blk and blk["text"]:
                 add_body_paragraph(doc, blk["text"])
 
-def build_doc(grade: str, subject: str, strand_name: str, content_map: Dict[str, str], doc_type: str = "Student") -> Document:
-    doc = Document()
-    apply_styles(doc)
+def parse_content_map(content_map: Dict[str, str], doc_type: str) -> Dict[str, List[Dict[str, Any]]]:
+    return {sub: parse_blocks(text, doc_type) for sub, text in content_map.items()}
+
+def build_doc(grade: str, subject: str, strand_name: str, content_map: Dict[str, str], doc_type: str = "Student",
+              images: Optional[ImageManifest] = None) -> Document:
+    return build_doc_from_blocks(grade, subject, strand_name, parse_content_map(content_map, doc_type), doc_type, images)
+
+def prepare_images(images: ImageManifest, blocks_map: Dict[str, List[Dict[str, Any]]], source: str):
+    """Registers every image description in the manifest and generates the missing ones."""
+    keys = [
+        images.register(blk["text"], f"{source} / {sub}")
+        for sub, blocks in blocks_map.items()
+        for blk in blocks if blk["type"] == "image_description"
+    ]
+    generated = images.generate(keys)
+    if keys:
+        log(f"Images: {len(keys)} descriptions, {len(set(keys))} unique, {generated} generated")
+
+def build_doc_from_blocks(grade: str, subject: str, strand_name: str,
+                          blocks_map: Dict[str, List[Dict[str, Any]]], doc_type: str = "Student",
+                          images: Optional[ImageManifest] = None,
+                          assessments: Optional[Dict[str, Dict[str, List[Dict[str, Any]]]]] = None) -> Document:
+    if images is not None:
+        prepare_images(images, blocks_map, f"Grade {grade} {subject} / {strand_name} / {doc_type}")
+
+    doc = new_styled_document()
 
     # Exact strand name in title
     add_strand_title(doc, f"Grade {grade} {subject} - {strand_name} ({doc_type} Textbook)")
     add_body_paragraph(doc, f"Generated on {datetime.now().strftime('%Y-%m-%d')}")
 
-    items = list(content_map.items())
+    items = list(blocks_map.items())
     total = len(items)
 
-    for idx, (sub, text) in enumerate(items, start=1):
+    for idx, (sub, blocks) in enumerate(items, start=1):
         add_substrand_heading(doc, idx, sub)
-
-        blocks = parse_blocks(text, doc_type)
-        render_blocks(doc, blocks, doc_type, current_substrand=sub)
+        render_blocks(doc, blocks, doc_type, current_substrand=sub, images=images,
+                      assessment=(assessments or {}).get(sub))
 
         if idx < total:
             doc.add_page_break()
 
     return doc
 
+def render_strand(grade: str, subject: str, strand_name: str, blocks_map: Dict[str, List[Dict[str, Any]]],
+                  doc_type: str, path: str, images: Optional[ImageManifest] = None,
+                  assessments: Optional[Dict[str, Dict[str, List[Dict[str, Any]]]]] = None) -> List[str]:
+    """Writes the DOCX and, with LESSON_JSON, the lesson JSON from one set of parsed blocks."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    build_doc_from_blocks(grade, subject, strand_name, blocks_map, doc_type, images, assessments).save(path)
+    outputs = [path]
+    if LESSON_JSON:
+        json_paths = write_lesson_json(path, grade, subject, strand_name, doc_type, blocks_map,
+                                       images.file_for if images else None, assessments)
+        outputs.extend(json_paths.values())
+    return outputs
+
+def output_path(grade: str, subject: str, strand_name: str, doc_type: str) -> str:
+    return os.path.join(
+        OUTPUT_DIR, f"Grade{grade}_{sanitize_file_name(subject)}_{sanitize_file_name(strand_name)}_{doc_type}.docx"
+    )
+
+QUIZ_SLOT = re.compile(r"^\s*(?:quiz\b|placeholder:\s*quiz\b)", re.IGNORECASE | re.MULTILINE)
+ASSESSMENT_SLOT = re.compile(r"^\s*(?:assessment\b|placeholder:\s*assessment\b)", re.IGNORECASE | re.MULTILINE)
+
+def with_assessment_slots(sub: str, text: str, doc_type: str) -> str:
+    """
+    Makes sure generated items have somewhere to go: every doc gets a quiz
+    slot (the Teacher doc shows its answer key), and Student docs get a
+    sub-strand assessment slot, which Teacher docs already have in
+    'Assessment Strategies and Criteria'.
+    """
+    if not QUIZ_SLOT.search(text):
+        text += f"\n\nPlaceholder: Quiz for sub-strand '{sub}'"
+    if doc_type == "Student" and not ASSESSMENT_SLOT.search(text):
+        text += f"\n\nPlaceholder: Assessment for sub-strand '{sub}'"
+    return text
+
+def strand_assessment(strand_name: str, doc_type: str) -> Tuple[str, str]:
+    """(content_map key, text) for the strand-level assessment placeholder."""
+    if doc_type == "Teacher":
+        return f"{strand_name} Assessment", f"Placeholder: Assessment guidance for strand '{strand_name}'."
+    return f"{strand_name} Assessment", f"Placeholder: Assessment for strand '{strand_name}'."
+
+def strand_assessments(bank: Optional[AssessmentBank], grade: str, subject: str, strand_name: str,
+                       strand_details: Dict[str, Any]) -> Optional[Dict[str, Dict[str, List[Dict[str, Any]]]]]:
+    """
+    Generated items keyed like content_map: each sub-strand gets its quiz and
+    assessment lists, and the strand assessment title gets the strand items.
+    None (placeholders stay) without a bank or when the request fails.
+    """
+    if bank is None or not strand_details:
+        return None
+    prompt = assessment_prompt(grade, subject, strand_name, strand_details)
+    try:
+        items = bank.strand_items(grade, subject, strand_name, strand_details, prompt)
+    except ValueError as e:
+        log(f"Assessments unavailable: {e}")
+        return None
+    result = dict(items["substrands"])
+    title, _ = strand_assessment(strand_name, "Student")
+    result[title] = {"assessment": items["strand"]}
+    return result
+
+# =============================================================
+# Build manifest — skip DOCX outputs whose inputs are unchanged
+# =============================================================
+
+_renderer_fingerprint: Optional[str] = None
+
+def renderer_fingerprint() -> str:
+    """Hash of RENDERER_VERSION plus the source of the style and rendering code."""
+    global _renderer_fingerprint
+    if _renderer_fingerprint is None:
+        h = hashlib.sha256(RENDERER_VERSION.encode("utf-8"))
+        for fn in (apply_styles, parse_blocks, detect_section_heading, render_blocks, add_assessment_items,
+                   build_doc_from_blocks):
+            try:
+                h.update(inspect.getsource(fn).encode("utf-8"))
+            except (OSError, TypeError):
+                h.update(fn.__name__.encode("utf-8"))
+        _renderer_fingerprint = h.hexdigest()
+    return _renderer_fingerprint
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def artifact_fingerprint(grade: str, subject: str, strand_name: str, doc_type: str,
+                         digests: Dict[str, str], images: Optional[ImageManifest] = None,
+                         assessments: Optional[Dict[str, Any]] = None) -> str:
+    """Fingerprint of everything a DOCX depends on; digests maps sub-strand → text_digest, in order."""
+    payload = json.dumps([grade, subject, strand_name, doc_type, list(digests.items()),
+                          renderer_fingerprint(), images.backend_name if images else None, LESSON_JSON,
+                          items_digest(assessments)],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def content_digests(content_map: Dict[str, str]) -> Dict[str, str]:
+    return {sub: text_digest(text) for sub, text in content_map.items()}
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict[str, Any]:
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+def save_manifest(manifest: Dict[str, Any], path: str = MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def stale_reason(manifest: Dict[str, Any], path: str, fingerprint: str) -> Optional[str]:
+    """Why the output needs rebuilding, or None when it is up to date."""
+    entry = manifest.get(path)
+    if entry is None:
+        return "not in manifest"
+    if not all(os.path.exists(p) for p in entry.get("outputs", [path])):
+        return "output missing"
+    if entry.get("renderer") != renderer_fingerprint():
+        return "styles or renderer changed"
+    if entry.get("fingerprint") != fingerprint:
+        return "content changed"
+    return None
+
+def save_artifact(manifest: Dict[str, Any], path: str, fingerprint: str, write,
+                  report: Optional[Dict[str, Any]] = None, force: bool = False) -> bool:
+    """
+    Calls write(path) — which returns every file it wrote — unless the
+    manifest says the outputs are up to date. Records the decision in the
+    run report. Returns True if rebuilt.
+    """
+    reason = "forced" if force else stale_reason(manifest, path, fingerprint)
+    if reason is None:
+        log(f"Up to date: {path}")
+    else:
+        outputs = write(path)
+        manifest[path] = {
+            "fingerprint": fingerprint,
+            "renderer": renderer_fingerprint(),
+            "outputs": outputs,
+            "built": datetime.now().isoformat(timespec="seconds"),
+        }
+        save_manifest(manifest)
+        log(f"Saved ({reason}): {path}")
+    if report is not None:
+        report.setdefault("artifacts", []).append({
+            "path": path,
+            "action": "skipped" if reason is None else "rebuilt",
+            "reason": reason or "up to date",
+        })
+    return reason is not None
+
+# =============================================================
+# Staged pipeline — generation, parsing and rendering overlap
+# =============================================================
+
+DOC_TYPES = ("Student", "Teacher")
+
+def iter_strands(curriculum: Dict[str, Any], grade: Optional[str] = None,
+                 subject: Optional[str] = None, strand: Optional[str] = None):
+    """Yields (grade, subject, strand_name, strand_details) matching the filters."""
+    for g, subjects in curriculum.items():
+        if grade and g != grade:
+            continue
+        for subj, strands in subjects.items():
+            if subject and subj != subject:
+                continue
+            for name, details in strands.items():
+                if strand and name != strand:
+                    continue
+                yield g, subj, name, details
+
+def run_pipeline(strands, section_parallel: bool = SECTION_PARALLEL,
+                 report: Optional[Dict[str, Any]] = None, force: bool = False,
+                 images: Optional[ImageManifest] = None, bank: Optional[AssessmentBank] = None) -> List[str]:
+    """
+    Three stages joined by bounded queues:
+      1. generation — a worker pool calls the API per (sub-strand, doc_type),
+         plus one batched assessment request per strand when `bank` is set
+      2. parsing    — collects parse_blocks output until a strand is complete
+      3. rendering  — builds and saves both DOCX files for the finished strand
+    A strand's files are written as soon as its last sub-strand arrives.
+    The feeder waits for a free strand slot before starting the next strand,
+    and full queues block upstream stages, so memory stays bounded.
+    """
+    parse_q: "queue.Queue" = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    render_q: "queue.Queue" = queue.Queue(maxsize=PIPELINE_OPEN_STRANDS)
+    open_slots = threading.Semaphore(PIPELINE_OPEN_STRANDS)
+    manifest = load_manifest()
+    saved: List[str] = []
+
+    def generate(key, grade, subject, strand_name, sub, ctx, doc_type):
+        try:
+            text = generate_substrand(doc_type, grade, subject, strand_name, sub, ctx, section_parallel, report)
+        except Exception as e:
+            log(f"Generation failed for {doc_type} → {sub}: {e}")
+            text = ""
+        text = with_assessment_slots(sub, text, doc_type)
+        memory_checkpoint("generate")
+        parse_q.put(("unit", key, sub, doc_type, text))
+
+    def assess(key, details):
+        # The parser counts this message towards the strand, so it is always sent
+        items = None
+        try:
+            items = strand_assessments(bank, *key, details)
+        except Exception as e:
+            log(f"Assessments failed for {key[2]}: {e}")
+            if report is not None:
+                report.setdefault("assessment_errors", []).append(
+                    {"grade": key[0], "subject": key[1], "strand": key[2], "error": str(e)})
+        finally:
+            parse_q.put(("assessments", key, items))
+
+    def feed():
+        with ThreadPoolExecutor(max_workers=PIPELINE_WORKERS) as pool:
+            for grade, subject, strand_name, details in strands:
+                subs = list(details.keys())
+                if not subs:
+                    continue
+                open_slots.acquire()
+                key = (grade, subject, strand_name)
+                log(f"Pipeline: generating Grade {grade} {subject} → {strand_name} ({len(subs)} sub-strands)")
+                parse_q.put(("strand", key, subs))
+                if bank is not None:
+                    pool.submit(assess, key, details)
+                for sub in subs:
+                    ctx = build_prompt_context(strand_name, sub, details)
+                    for doc_type in DOC_TYPES:
+                        pool.submit(generate, key, grade, subject, strand_name, sub, ctx, doc_type)
+        parse_q.put(None)
+
+    def parse():
+        pending: Dict[Any, Dict[str, Any]] = {}
+        while True:
+            msg = parse_q.get()
+            if msg is None:
+                render_q.put(None)
+                return
+            if msg[0] == "strand":
+                _, key, subs = msg
+                pending[key] = {"subs": subs, "remaining": len(subs) * len(DOC_TYPES) + (bank is not None),
+                                "blocks": {d: {} for d in DOC_TYPES},
+                                "digests": {d: {} for d in DOC_TYPES},
+                                "assessments": None}
+                continue
+            if msg[0] == "assessments":
+                _, key, items = msg
+                state = pending[key]
+                state["assessments"] = items
+            else:
+                _, key, sub, doc_type, text = msg
+                state = pending[key]
+                state["blocks"][doc_type][sub] = parse_blocks(clean_model_output(text), doc_type)
+                state["digests"][doc_type][sub] = text_digest(text)
+            state["remaining"] -= 1
+            if state["remaining"] == 0:
+                del pending[key]
+                blocks, digests = {}, {}
+                for d in DOC_TYPES:
+                    ordered = {sub: state["blocks"][d][sub] for sub in state["subs"]}
+                    ordered_digests = {sub: state["digests"][d][sub] for sub in state["subs"]}
+                    title, placeholder = strand_assessment(key[2], d)
+                    ordered[title] = parse_blocks(placeholder, d)
+                    ordered_digests[title] = text_digest(placeholder)
+                    blocks[d] = ordered
+                    digests[d] = ordered_digests
+                memory_checkpoint("parse")
+                render_q.put((key, blocks, digests, state["assessments"]))
+
+    def render():
+        while True:
+            item = render_q.get()
+            if item is None:
+                return
+            (grade, subject, strand_name), blocks, digests, assessments = item
+            try:
+                for doc_type in DOC_TYPES:
+                    path = output_path(grade, subject, strand_name, doc_type)
+                    fp = artifact_fingerprint(grade, subject, strand_name, doc_type, digests[doc_type], images,
+                                              assessments)
+                    write = lambda p: render_strand(grade, subject, strand_name, blocks[doc_type], doc_type, p, images,
+                                                    assessments)
+                    if save_artifact(manifest, path, fp, write, report, force):
+                        saved.append(path)
+            except Exception as e:
+                log(f"Rendering failed for {strand_name}: {e}")
+            finally:
+                open_slots.release()
+            del item, blocks, digests
+            memory_checkpoint("render")
+            memory_snapshot(f"Grade {grade} {subject} → {strand_name}")
+
+    stages = [threading.Thread(target=fn, name=f"pipeline-{fn.__name__}", daemon=True)
+              for fn in (feed, parse, render)]
+    for t in stages:
+        t.start()
+    for t in stages:
+        t.join()
+    return saved
+
+# =============================================================
+# Distributed workers — shared queue of (strand, sub-strand, doc_type) units
+# =============================================================
+
+def queue_units(strands) -> List[Dict[str, Any]]:
+    units = []
+    for grade, subject, strand_name, details in strands:
+        for position, sub in enumerate(details.keys()):
+            for doc_type in DOC_TYPES:
+                units.append({"grade": grade, "subject": subject, "strand": strand_name,
+                              "substrand": sub, "doc_type": doc_type, "position": position})
+    return units
+
+def run_worker(wq: WorkQueue, curriculum: Dict[str, Any], worker_id: str,
+               section_parallel: bool = SECTION_PARALLEL, report: Optional[Dict[str, Any]] = None) -> int:
+    """Claims and generates units until the queue has nothing left. Returns units completed."""
+    completed = 0
+    while True:
+        unit = wq.claim(worker_id)
+        if unit is None:
+            if not wq.outstanding():
+                break
+            time.sleep(WORKER_POLL_SECONDS)
+            continue
+
+        grade, subject, strand_name = unit["grade"], unit["subject"], unit["strand"]
+        sub, doc_type = unit["substrand"], unit["doc_type"]
+        log(f"Worker {worker_id}: {doc_type} → {sub} (attempt {unit['attempts']})")
+
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(wq.lease_seconds / 3):
+                if not wq.heartbeat(unit["id"], worker_id):
+                    log(f"Worker {worker_id}: lease lost for unit {unit['id']}")
+                    return
+
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        try:
+            details = curriculum[grade][subject][strand_name]
+            ctx = build_prompt_context(strand_name, sub, details)
+            text = generate_substrand(doc_type, grade, subject, strand_name, sub, ctx, section_parallel, report)
+            if not text:
+                wq.fail(unit["id"], worker_id, "empty completion")
+                continue
+            text = with_assessment_slots(sub, text, doc_type)
+            if wq.complete(unit["id"], worker_id, text):
+                completed += 1
+            else:
+                log(f"Worker {worker_id}: result for unit {unit['id']} discarded (lease lost)")
+            memory_checkpoint("generate")
+            memory_snapshot(f"Grade {grade} {subject} → {strand_name} → {sub} ({doc_type})")
+        except Exception as e:
+            log(f"Worker {worker_id}: unit {unit['id']} failed: {e}")
+            wq.fail(unit["id"], worker_id, str(e))
+        finally:
+            stop.set()
+            beat.join()
+    return completed
+
+def assemble_from_queue(wq: WorkQueue, report: Optional[Dict[str, Any]] = None,
+                        force: bool = False, images: Optional[ImageManifest] = None,
+                        bank: Optional[AssessmentBank] = None,
+                        curriculum: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Builds DOCX files for every strand whose units are all done and whose
+    outputs are stale. With `bank` (and the curriculum to key it by), strand
+    assessments are filled in, from the cache where possible.
+    """
+    manifest = load_manifest()
+    saved: List[str] = []
+    for strand in wq.strands():
+        grade, subject, strand_name = strand["grade"], strand["subject"], strand["strand"]
+        if strand["done"] < strand["total"]:
+            log(f"Skipping {strand_name}: {strand['done']}/{strand['total']} units done")
+            continue
+        details = (curriculum or {}).get(grade, {}).get(subject, {}).get(strand_name, {})
+        assessments = strand_assessments(bank, grade, subject, strand_name, details)
+        for doc_type in DOC_TYPES:
+            content_map = wq.results(grade, subject, strand_name, doc_type)
+            title, placeholder = strand_assessment(strand_name, doc_type)
+            content_map[title] = placeholder
+            path = output_path(grade, subject, strand_name, doc_type)
+            fp = artifact_fingerprint(grade, subject, strand_name, doc_type, content_digests(content_map), images,
+                                      assessments)
+            write = lambda p: render_strand(grade, subject, strand_name, parse_content_map(content_map, doc_type),
+                                            doc_type, p, images, assessments)
+            if save_artifact(manifest, path, fp, write, report, force):
+                saved.append(path)
+        memory_checkpoint("render")
+        memory_snapshot(f"Grade {grade} {subject} → {strand_name}")
+    return saved
+
+# =============================================================
+# Grade books — splice rendered strand DOCX files into one volume
+# =============================================================
+
+def assemble_grade_book(curriculum: Dict[str, Any], grade: str, doc_type: str,
+                        subject: Optional[str] = None) -> Optional[str]:
+    """Assembles every rendered strand of the grade (in curriculum order) into one book."""
+    parts, missing = [], 0
+    for g, subj, strand_name, _ in iter_strands(curriculum, grade, subject):
+        path = output_path(g, subj, strand_name, doc_type)
+        if os.path.exists(path):
+            parts.append(path)
+        else:
+            missing += 1
+    if missing:
+        log(f"Book: {missing} strand(s) not rendered yet, leaving them out")
+    if not parts:
+        log(f"Book: nothing rendered for Grade {grade}")
+        return None
+
+    name = f"Grade{grade}_{sanitize_file_name(subject)}_{doc_type}_Book.docx" if subject \
+        else f"Grade{grade}_{doc_type}_Book.docx"
+    ensure_output_dir()
+    output = os.path.join(OUTPUT_DIR, name)
+    title = f"Grade {grade} {subject + ' ' if subject else ''}{doc_type} Textbook"
+    stats = assemble_book(parts, output, title)
+    log(f"Book: {stats['parts']} strands, {stats['substrands']} sub-strands → {output}")
+    return output
+
 # =============================================================
 # Main
 # =============================================================
 
-def main():
-    if not API_KEY:
-        log("Missing API KEY")
-        sys.exit(1)
+COMMANDS = ("sample", "pipeline", "plan", "prompt-report", "enqueue", "worker", "assemble", "book",
+            "import-budget")
+
+# Old flag spelling → command, in the precedence the flags had when combined
+LEGACY_FLAGS = {"--prompt-report": "prompt-report", "--book": "book", "--plan": "plan", "--enqueue": "enqueue",
+                "--assemble": "assemble", "--worker": "worker", "--pipeline": "pipeline"}
+LEGACY_VALUE_FLAGS = {"--book", "--enqueue", "--assemble", "--worker"}
+
+def command_argv(argv: List[str]) -> List[str]:
+    """argv with a command first: the old --worker DB style flags become `worker DB`, no command is `sample`."""
+    if argv and argv[0] in COMMANDS or any(a in ("-h", "--help") for a in argv[:1]):
+        return argv
+    found: Dict[str, Optional[str]] = {}
+    rest: List[str] = []
+    i = 0
+    while i < len(argv):
+        flag, eq, value = argv[i].partition("=")
+        if flag in LEGACY_FLAGS:
+            if flag in LEGACY_VALUE_FLAGS and not eq and i + 1 < len(argv):
+                value = argv[i + 1]
+                i += 1
+            found[flag] = value if flag in LEGACY_VALUE_FLAGS else None
+        else:
+            rest.append(argv[i])
+        i += 1
+    for flag, command in LEGACY_FLAGS.items():
+        if flag in found:
+            return [command] + ([found[flag]] if found[flag] is not None else []) + rest
+    return ["sample"] + rest
+
+def import_budget(budget_ms: float = IMPORT_BUDGET_MS) -> bool:
+    """
+    Imports this module in a fresh interpreter under -X importtime, from an
+    empty working directory. Passes when the import stays under budget_ms,
+    loads none of HEAVY_IMPORTS and leaves the directory empty.
+    """
+    import subprocess
+    import tempfile
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=here + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    cmd = [sys.executable, "-X", "importtime", "-c", "import content_generator"]
+    with tempfile.TemporaryDirectory() as cwd:
+        subprocess.run(cmd, cwd=cwd, env=env, capture_output=True)   # warm the bytecode cache
+        for name in os.listdir(cwd):
+            path = os.path.join(cwd, name)
+            os.rmdir(path) if os.path.isdir(path) else os.remove(path)
+        proc = subprocess.run(cmd, cwd=cwd, env=env, capture_output=True, text=True)
+        created = sorted(os.listdir(cwd))
+    if proc.returncode != 0:
+        log(f"Import failed:\n{proc.stderr[-2000:]}")
+        return False
+
+    rows = []   # (cumulative µs, depth, module), children listed before their parent
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(cumulative), depth, name.strip()))
+    # Only this module's subtree: site hooks and .pth files import things of their own
+    end = next((i for i, r in enumerate(rows) if r[2] == "content_generator" and r[1] == 0), len(rows) - 1)
+    start = end
+    while start > 0 and rows[start - 1][1] > 0:
+        start -= 1
+    rows, total_ms = rows[start:end], rows[end][0] / 1000 if rows else 0.0
+    heavy = sorted({n for _, _, n in rows if n.split(".")[0] in HEAVY_IMPORTS})
+
+    log(f"Import: content_generator {total_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+    for cumulative, _, name in sorted((r for r in rows if r[1] == 1), reverse=True)[:8]:
+        log(f"  {cumulative / 1000:7.1f} ms  {name}")
+    ok = total_ms <= budget_ms and not heavy and not created
+    if heavy:
+        log(f"Import: loads heavy modules at import time: {', '.join(heavy[:10])}")
+    if created:
+        log(f"Import: created files in the working directory: {', '.join(created)}")
+    if total_ms > budget_ms:
+        log("Import: over budget")
+    return ok
+
+def main(argv: Optional[List[str]] = None):
+    global HEDGE_REQUESTS, LESSON_JSON, ADAPTIVE_MAX_TOKENS, PROVIDERS_PATH, MEMORY_PROFILE, MEMORY_ALARM_MB
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--section-parallel", action="store_true", default=SECTION_PARALLEL,
+                         help="generate each section as its own parallel request")
+    options.add_argument("--substrand", help="generate only this sub-strand of the sample strand")
+    options.add_argument("--hedge", action="store_true", default=HEDGE_REQUESTS,
+                         help="send a duplicate request when a call runs past the latency percentile")
+    options.add_argument("--providers", metavar="FILE", default=PROVIDERS_PATH,
+                         help="JSON list of endpoints to balance requests across (see provider_pool.py)")
+    options.add_argument("--adaptive-tokens", action="store_true", default=ADAPTIVE_MAX_TOKENS,
+                         help="set max_tokens per request from output lengths in the run ledger")
+    options.add_argument("--grade", help=f"restrict pipeline/enqueue/plan to one grade (sample: default {SAMPLE_GRADE})")
+    options.add_argument("--subject", help="restrict pipeline/enqueue/plan (and book) to one subject "
+                                           "(sample: default the grade's first)")
+    options.add_argument("--strand", help="restrict pipeline/enqueue/plan to one strand "
+                                          "(sample: default the subject's first)")
+    options.add_argument("--concurrency", type=int,
+                         help="requests in flight for plan (default: what pipeline would use)")
+    options.add_argument("--max-cost", type=float, metavar="USD",
+                         help="refuse to run pipeline/enqueue when the plan costs more")
+    options.add_argument("--max-hours", type=float, metavar="H",
+                         help="refuse to run pipeline/enqueue when the plan takes longer")
+    options.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    options.add_argument("--force", action="store_true", help="rebuild DOCX files even if up to date")
+    options.add_argument("--doc-type", choices=DOC_TYPES, default="Student", help="volume type for book")
+    options.add_argument("--images", metavar="BACKEND",
+                         help="render [IMAGE DESCRIPTION] blocks to pictures with this backend (e.g. stub)")
+    options.add_argument("--assessments", action="store_true",
+                         help="fill quiz/assessment placeholders from one batched request per strand")
+    options.add_argument("--no-lesson-json", dest="lesson_json", action="store_false", default=LESSON_JSON,
+                         help="do not write structured lesson JSON next to each DOCX")
+    options.add_argument("--memory-profile", action="store_true", default=MEMORY_PROFILE,
+                         help="record tracemalloc diffs and RSS high-water marks in the run report")
+    options.add_argument("--memory-alarm", type=float, metavar="MB", default=MEMORY_ALARM_MB,
+                         help="with --memory-profile, warn when RSS passes this many MB")
+
+    parser = argparse.ArgumentParser(description="Generate CBC student and teacher textbooks.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.add_parser("sample", parents=[options], help="generate the first sub-strands of a test strand")
+    commands.add_parser("pipeline", parents=[options],
+                        help="generate every matching strand through the staged pipeline")
+    commands.add_parser("plan", parents=[options],
+                        help="print requests, tokens, cost and duration for the selection without calling the API")
+    commands.add_parser("prompt-report", parents=[options],
+                        help="report prompt-size reduction over content.json")
+    commands.add_parser("enqueue", parents=[options],
+                        help="add every matching (sub-strand, doc_type) unit to a shared queue").add_argument("db")
+    commands.add_parser("worker", parents=[options],
+                        help="claim and generate units from a shared queue").add_argument("db")
+    commands.add_parser("assemble", parents=[options],
+                        help="build DOCX files from a finished queue").add_argument("db")
+    commands.add_parser("book", parents=[options],
+                        help="assemble rendered strands of a grade into one volume").add_argument("grade_book",
+                                                                                                metavar="grade")
+    budget = commands.add_parser("import-budget", help="check import time and side effects of this module")
+    budget.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    args = parser.parse_args(command_argv(sys.argv[1:] if argv is None else argv))
+
+    if args.command == "import-budget":
+        sys.exit(0 if import_budget(args.budget_ms) else 1)
+
+    LESSON_JSON = args.lesson_json
+    HEDGE_REQUESTS = args.hedge
+    ADAPTIVE_MAX_TOKENS = args.adaptive_tokens
+    PROVIDERS_PATH = args.providers
+    MEMORY_PROFILE = args.memory_profile
+    MEMORY_ALARM_MB = args.memory_alarm
 
     with open("content.json", "r", encoding="utf-8") as f:
         curriculum = json.load(f)
 
-    grade = "4"
-    subject = "English"
+    if args.command == "prompt-report":
+        log_prompt_size_report(prompt_size_report(curriculum))
+        return
+
+    images = ImageManifest(IMAGE_DIR, args.images) if args.images else None
+    bank = AssessmentBank(ASSESSMENT_DIR, assessment_request) if args.assessments else None
+
+    if args.command == "book":
+        assemble_grade_book(curriculum, args.grade_book, args.doc_type, args.subject)
+        return
+
+    limits = args.max_cost is not None or args.max_hours is not None
+    if args.command == "plan" or (args.command in ("pipeline", "enqueue") and limits):
+        concurrency = args.concurrency or PIPELINE_WORKERS * (SECTION_WORKERS if args.section_parallel else 1)
+        plan = plan_run(iter_strands(curriculum, args.grade, args.subject, args.strand),
+                        args.section_parallel, args.assessments, concurrency)
+        log_plan(plan)
+        if not plan_within_limits(plan, args.max_cost, args.max_hours):
+            sys.exit(2)
+        if args.command == "plan":
+            return
+
+    if args.command == "enqueue":
+        wq = WorkQueue(args.db)
+        added = wq.enqueue(queue_units(iter_strands(curriculum, args.grade, args.subject, args.strand)))
+        log(f"Queued {added} new units: {wq.counts()}")
+        return
+
+    if args.command == "assemble":
+        wq = WorkQueue(args.db)
+        report = new_run_report()
+        if MEMORY_PROFILE:
+            start_memory_profile(MEMORY_ALARM_MB)
+        saved = assemble_from_queue(wq, report, args.force, images, bank, curriculum)
+        if bank:
+            report["assessments"] = dict(bank.stats)
+        finish_memory_profile(report)
+        log(f"Assembled {len(saved)} rebuilt documents: {wq.counts()}")
+        log(f"Run report: {save_run_report(report)}")
+        return
+
+    if not have_api_key():
+        log("Missing API KEY")
+        sys.exit(1)
 
-    strand_name = list(curriculum[grade][subject].keys())[0]          # exact strand name
-    strand_subs = list(curriculum[grade][subject][strand_name].items())[:2]
+    if args.command == "worker":
+        report = new_run_report()
+        if MEMORY_PROFILE:
+            start_memory_profile(MEMORY_ALARM_MB)
+        done = run_worker(WorkQueue(args.db), curriculum, args.worker_id, args.section_parallel, report)
+        report["hedging"] = dict(HEDGE_STATS)
+        report["token_budgets"] = token_budget().summary()
+        report["providers"] = provider_pool().health()
+        finish_memory_profile(report)
+        log(f"Worker {args.worker_id} finished: {done} units completed")
+        log(f"Run report: {save_run_report(report)}")
+        return
+
+    if args.command == "pipeline":
+        report = new_run_report()
+        if MEMORY_PROFILE:
+            start_memory_profile(MEMORY_ALARM_MB)
+        strands = iter_strands(curriculum, args.grade, args.subject, args.strand)
+        saved = run_pipeline(strands, args.section_parallel, report, args.force, images, bank)
+        report["hedging"] = dict(HEDGE_STATS)
+        report["token_budgets"] = token_budget().summary()
+        report["providers"] = provider_pool().health()
+        if images:
+            report["images"] = dict(images.stats)
+        if bank:
+            report["assessments"] = dict(bank.stats)
+        finish_memory_profile(report)
+        log(f"Pipeline finished: {len(saved)} documents rebuilt")
+        log(f"Run report: {save_run_report(report)}")
+        return
+
+    grade = args.grade or SAMPLE_GRADE
+    if grade not in curriculum:
+        parser.error(f"unknown grade {grade!r}")
+    subject = args.subject or next(iter(curriculum[grade]))
+    if subject not in curriculum[grade]:
+        parser.error(f"unknown subject {subject!r} for Grade {grade}")
+    strand_name = args.strand or next(iter(curriculum[grade][subject]))   # exact strand name
+    if strand_name not in curriculum[grade][subject]:
+        parser.error(f"unknown strand {strand_name!r} for Grade {grade} {subject}")
+    strand_details = curriculum[grade][subject][strand_name]
+    strand_subs = list(strand_details.items())[:2]
+    if args.substrand:
+        if args.substrand not in strand_details:
+            parser.error(f"unknown sub-strand {args.substrand!r} in {strand_name}")
+        strand_subs = [(args.substrand, strand_details[args.substrand])]
 
     log(f"Testing: Grade {grade}, Subject {subject}, Strand {strand_name}")
 
-    strand_outcomes: List[str] = []
-    for _, details in curriculum[grade][subject][strand_name].items():
-        strand_outcomes.extend(details.get("learning_outcomes", []))
-
+    report = new_run_report()
+    if MEMORY_PROFILE:
+        start_memory_profile(MEMORY_ALARM_MB)
     student_map: Dict[str, str] = {}
     teacher_map: Dict[str, str] = {}
 
     for sub, _details in strand_subs:
+        ctx = build_prompt_context(strand_name, sub, strand_details)
+
         log(f"Generating Student → {sub}")
-        s_prompt = student_prompt(grade, subject, strand_name, sub, strand_outcomes)
-        s_content = api_request(s_prompt)
-        if "quiz" not in s_content.lower():
-            s_content += f"\n\nPlaceholder: Quiz for sub-strand '{sub}'"
-        student_map[sub] = s_content
+        s_content = generate_substrand("Student", grade, subject, strand_name, sub, ctx, args.section_parallel, report)
+        student_map[sub] = with_assessment_slots(sub, s_content, "Student")
 
         log(f"Generating Teacher → {sub}")
-        t_prompt = teacher_prompt(grade, subject, strand_name, sub, strand_outcomes)
-        t_content = api_request(t_prompt)
-        teacher_map[sub] = t_content
+        t_content = generate_substrand("Teacher", grade, subject, strand_name, sub, ctx, args.section_parallel, report)
+        teacher_map[sub] = with_assessment_slots(sub, t_content, "Teacher")
+        memory_checkpoint("generate")
 
     # Strand-level assessment placeholders
-    student_map[f"{strand_name} Assessment"] = f"Placeholder: Assessment for strand '{strand_name}'."
-    teacher_map[f"{strand_name} Assessment"] = f"Placeholder: Assessment guidance for strand '{strand_name}'."
-
-    s_doc = build_doc(grade, subject, strand_name, student_map, "Student")
-    t_doc = build_doc(grade, subject, strand_name, teacher_map, "Teacher")
-
-    s_file = os.path.join(OUTPUT_DIR, f"Grade{grade}_{subject}_{sanitize_file_name(strand_name)}_Student.docx")
-    t_file = os.path.join(OUTPUT_DIR, f"Grade{grade}_{subject}_{sanitize_file_name(strand_name)}_Teacher.docx")
-
-    s_doc.save(s_file)
-    t_doc.save(t_file)
-
-    log(f"Saved Student: {s_file}")
-    log(f"Saved Teacher: {t_file}")
+    for content_map, doc_type in ((student_map, "Student"), (teacher_map, "Teacher")):
+        title, placeholder = strand_assessment(strand_name, doc_type)
+        content_map[title] = placeholder
+
+    assessments = strand_assessments(bank, grade, subject, strand_name, dict(strand_subs))
+
+    manifest = load_manifest()
+    for content_map, doc_type in ((student_map, "Student"), (teacher_map, "Teacher")):
+        path = output_path(grade, subject, strand_name, doc_type)
+        fp = artifact_fingerprint(grade, subject, strand_name, doc_type, content_digests(content_map), images,
+                                  assessments)
+        save_artifact(manifest, path, fp,
+                      lambda p: render_strand(grade, subject, strand_name, parse_content_map(content_map, doc_type),
+                                              doc_type, p, images, assessments),
+                      report, args.force)
+    memory_checkpoint("render")
+    memory_snapshot(f"Grade {grade} {subject} → {strand_name}")
+
+    report["hedging"] = dict(HEDGE_STATS)
+    report["token_budgets"] = token_budget().summary()
+    report["providers"] = provider_pool().health()
+    if images:
+        report["images"] = dict(images.stats)
+    if bank:
+        report["assessments"] = dict(bank.stats)
+    finish_memory_profile(report)
+    log(f"Run report: {save_run_report(report)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
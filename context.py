@@ -1,10 +1,61 @@
+"""
+Source Bundler
+==============
+Combines source files into one text file (for pasting into an LLM or a
+review), each under a banner with its path.
+
+Inputs can be files, directories (walked recursively) or glob patterns
+("src/**/*.tsx"). Files matched by .gitignore (the root one and any nested
+ones) are skipped, as are .git, binary files and files over --max-bytes.
+Files are read on a thread pool and streamed to the output in a fixed order,
+so the same inputs always produce the same bundle. Explicit paths keep
+their command-line order; directory and glob matches are sorted.
+
+With --budget the bundle becomes a packed LLM context: every file gets a
+token estimate, files are ranked (--priority globs first, then relevance
+to --query), lockfiles and generated files are dropped, large JSON is cut
+down to its shape, and files are added in rank order until the budget is
+full. Digests, token counts and word counts are cached in .context_cache.json,
+so a repeat pack only re-reads files that changed.
+
+--watch keeps the output current. It listens with inotify on Linux and
+polls elsewhere, waits for a burst of saves to settle, re-reads only the
+files whose mtime or size changed, and rewrites the output from the first
+changed section on (in place when the section kept its length).
+
+Usage:
+    python context.py src/ -o combined.txt
+    python context.py "src/**/*.tsx" src/app/globals.css -o - --max-bytes 200000
+    python context.py src/ --budget 60000 --query "lesson generation chapter" --priority "src/lib/*"
+    python context.py src/ -o combined.txt --watch
+    python context.py                     # the default FILE_PATHS list below
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import fnmatch
+import glob
+import hashlib
+import json
+import math
 import os
+import re
+import select
+import struct
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from token_budget import approx_tokens
 
-# List of file paths to combine
-file_paths = [
+# List of file paths to combine when no inputs are given
+FILE_PATHS = [
     r"C:\Users\HP\Documents\technofusion\app\globals.css",
     r"C:\Users\HP\Documents\technofusion\app\layout.tsx",
-    r"C:\Users\HP\Documents\technofusion\app\page.tsx"
+    r"C:\Users\HP\Documents\technofusion\app\page.tsx",
     r"C:\Users\HP\Documents\technofusion\components\navbar.tsx",
     r"C:\Users\HP\Documents\technofusion\components\footer.tsx",
     r"C:\Users\HP\Documents\technofusion\components\overviewContainer.tsx",
@@ -14,20 +65,812 @@ file_paths = [
 ]
 
 # Output file (saved safely in your Downloads folder)
-output_file = r"C:\Users\HP\Downloads\Python Scripts\combined_tsx_code2.txt"
-
-with open(output_file, "w", encoding="utf-8") as outfile:
-    for path in file_paths:
-        outfile.write("\n" + "="*100 + "\n")
-        outfile.write(f"File: {path}\n")
-        outfile.write("="*100 + "\n\n")
-        if os.path.exists(path):
+OUTPUT_FILE = r"C:\Users\HP\Downloads\Python Scripts\combined_tsx_code2.txt"
+
+MAX_FILE_BYTES = 1_000_000
+READ_WORKERS = 16
+BINARY_SNIFF_BYTES = 8192
+BANNER = "=" * 100
+ALWAYS_SKIP = {".git", ".hg", ".svn"}
+GLOB_CHARS = re.compile(r"[*?\[]")
+
+
+# =============================================================
+# .gitignore
+# =============================================================
+
+def gitignore_regex(pattern: str) -> str:
+    """Translates one gitignore glob (without !, leading or trailing /) to a regex."""
+    out, i = [], 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            i += 3
+            continue
+        if c == "*":
+            if pattern.startswith("**", i):
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end].replace("\\", "\\\\")
+                out.append("[" + ("^" + body[1:] if body.startswith("!") else body) + "]")
+                i = end
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class IgnoreRules:
+    """The rules of one .gitignore, matched against paths relative to its directory."""
+
+    def __init__(self, lines: Iterable[str]):
+        self.rules: List[Tuple[re.Pattern, bool, bool]] = []   # (regex, negated, directories only)
+        for line in lines:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            line = line.rstrip() if not line.endswith("\\ ") else line
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if not line:
+                continue
+            regex = gitignore_regex(line)
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self.rules.append((re.compile(regex + r"\Z"), negated, dir_only))
+
+    @classmethod
+    def from_file(cls, path: str) -> "IgnoreRules":
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return cls(f)
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included by a ! rule, None if no rule matches."""
+        result = None
+        for regex, negated, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                result = not negated
+        return result
+
+
+class GitIgnore:
+    """Every .gitignore from the repository root down, loaded as directories are visited."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.rules: Dict[str, Optional[IgnoreRules]] = {}
+
+    @staticmethod
+    def find_root(path: str) -> str:
+        """The enclosing git work tree, or the path itself (its directory for a file)."""
+        start = os.path.abspath(path if os.path.isdir(path) else os.path.dirname(path) or ".")
+        current = start
+        while True:
+            if os.path.exists(os.path.join(current, ".git")):
+                return current
+            parent = os.path.dirname(current)
+            if parent == current:
+                return start
+            current = parent
+
+    def _rules_for(self, directory: str) -> Optional[IgnoreRules]:
+        if directory not in self.rules:
+            path = os.path.join(directory, ".gitignore")
+            self.rules[directory] = IgnoreRules.from_file(path) if os.path.isfile(path) else None
+        return self.rules[directory]
+
+    def ignored(self, path: str, is_dir: bool, parents_checked: bool = False) -> bool:
+        """
+        Whether git would ignore path. parents_checked skips re-testing the
+        parent directories (walk() has already pruned ignored ones).
+        """
+        path = os.path.abspath(path)
+        if os.path.basename(path) in ALWAYS_SKIP:
+            return True
+        rel = os.path.relpath(path, self.root)
+        if rel.startswith(".."):
+            return False
+        parts = rel.replace(os.sep, "/").split("/")
+        # Deeper .gitignore files override shallower ones; a matching ignored
+        # parent directory excludes everything inside it
+        for depth in range(len(parts) if parents_checked else 1, len(parts) + 1):
+            sub_is_dir = is_dir if depth == len(parts) else True
+            verdict = None
+            for level in range(depth):
+                rules = self._rules_for(os.path.join(self.root, *parts[:level]))
+                if rules is not None:
+                    found = rules.match("/".join(parts[level:depth]), sub_is_dir)
+                    if found is not None:
+                        verdict = found
+            if verdict:
+                return True
+        return False
+
+
+# =============================================================
+# Inputs
+# =============================================================
+
+def walk(directory: str, ignore: Optional[GitIgnore]) -> List[str]:
+    """Files under directory, sorted, with ignored directories pruned."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(d for d in dirnames if d not in ALWAYS_SKIP
+                             and not (ignore and ignore.ignored(os.path.join(dirpath, d), True, True)))
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if not (ignore and ignore.ignored(path, False, True)):
+                found.append(path)
+    return found
+
+
+def expand_inputs(inputs: List[str], use_gitignore: bool = True) -> List[str]:
+    """
+    Files for a list of files, directories and globs, in bundle order and
+    without duplicates. Explicit file paths are kept even if they are missing
+    or ignored, so the bundle says so.
+    """
+    ignores: Dict[str, GitIgnore] = {}
+
+    def ignore_for(path: str) -> Optional[GitIgnore]:
+        if not use_gitignore:
+            return None
+        root = GitIgnore.find_root(path)
+        if root not in ignores:
+            ignores[root] = GitIgnore(root)
+        return ignores[root]
+
+    paths: List[str] = []
+    for item in inputs:
+        # An existing path wins over glob syntax: Next.js routes contain [brackets]
+        if os.path.isdir(item):
+            paths.extend(walk(item, ignore_for(item)))
+        elif os.path.exists(item) or not GLOB_CHARS.search(item):
+            paths.append(item)
+        else:
+            for match in sorted(glob.glob(item, recursive=True)):
+                if os.path.isdir(match):
+                    paths.extend(walk(match, ignore_for(match)))
+                elif not (ignore_for(match) and ignore_for(match).ignored(match, False)):
+                    paths.append(match)
+
+    seen, ordered = set(), []
+    for path in paths:
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            ordered.append(path)
+    return ordered
+
+
+# =============================================================
+# Reading and writing
+# =============================================================
+
+def read_file(path: str, max_bytes: int = MAX_FILE_BYTES) -> Dict[str, Any]:
+    """
+    {"path", "status", "bytes", "seconds", "text"}. status is "ok", "missing",
+    "binary", "too_large" or "error"; text is the section body to write.
+    """
+    start = time.perf_counter()
+    result: Dict[str, Any] = {"path": path, "status": "ok", "bytes": 0, "text": ""}
+    try:
+        size = os.path.getsize(path)
+        result["bytes"] = size
+        if size > max_bytes:
+            result["status"] = "too_large"
+            result["text"] = f"[Skipped: {size:,} bytes is over the {max_bytes:,} byte limit]\n"
+        else:
+            with open(path, "rb") as f:
+                data = f.read()
+            if b"\0" in data[:BINARY_SNIFF_BYTES]:
+                result["status"] = "binary"
+                result["text"] = "[Skipped: binary file]\n"
+            else:
+                try:
+                    result["text"] = data.decode("utf-8")
+                except UnicodeDecodeError:
+                    result["status"] = "binary"
+                    result["text"] = "[Skipped: not UTF-8 text]\n"
+    except FileNotFoundError:
+        result["status"] = "missing"
+        result["text"] = "[File not found]\n"
+    except OSError as e:
+        result["status"] = "error"
+        result["text"] = f"[Error reading file: {e}]\n"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def read_in_order(paths: List[str], workers: int = READ_WORKERS,
+                  max_bytes: int = MAX_FILE_BYTES) -> Iterator[Dict[str, Any]]:
+    """
+    read_file results in input order. Reads run ahead on the pool, but at
+    most a few per worker are held in memory.
+    """
+    window = max(1, workers) * 4
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending: deque = deque()
+        for path in paths:
+            pending.append(pool.submit(read_file, path, max_bytes))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def display_path(path: str) -> str:
+    """Path relative to the working directory when it is inside it, with forward slashes."""
+    try:
+        rel = os.path.relpath(path)
+    except ValueError:   # another drive on Windows
+        rel = ".."
+    return (path if rel.startswith("..") else rel).replace(os.sep, "/")
+
+
+def section(path: str, text: str) -> str:
+    if text and not text.endswith("\n"):
+        text += "\n"
+    return f"\n{BANNER}\nFile: {display_path(path)}\n{BANNER}\n\n{text}"
+
+
+def write_bundle(paths: List[str], out, workers: int = READ_WORKERS, max_bytes: int = MAX_FILE_BYTES,
+                 transform: Optional[Callable[[str, str], str]] = None) -> List[Dict[str, Any]]:
+    """
+    Streams every file's section to `out`, passing readable files through
+    transform(path, text) if given. Returns the read results without their text.
+    """
+    results = []
+    for result in read_in_order(paths, workers, max_bytes):
+        text = result.pop("text")
+        if transform and result["status"] == "ok":
+            text = transform(result["path"], text)
+        out.write(section(result["path"], text))
+        results.append(result)
+    return results
+
+
+def log_summary(results: List[Dict[str, Any]], seconds: float, top: int):
+    included = [r for r in results if r["status"] == "ok"]
+    skipped = [r for r in results if r["status"] != "ok"]
+    print(f"\n{'Size':>10}  {'Read ms':>8}  File")
+    shown = sorted(results, key=lambda r: -r["bytes"])[:top] if top > 0 else results
+    for r in shown:
+        note = "" if r["status"] == "ok" else f"  ({r['status'].replace('_', ' ')})"
+        print(f"{r['bytes']:>10,}  {r['seconds'] * 1000:>8.2f}  {display_path(r['path'])}{note}")
+    if top > 0 and len(results) > top:
+        print(f"{'':>10}  {'':>8}  ... {len(results) - top} more (--top 0 lists all)")
+    line = f"\n{len(included)} files, {sum(r['bytes'] for r in included):,} bytes in {seconds:.2f}s"
+    if skipped:
+        counts = Counter(r["status"].replace("_", " ") for r in skipped)
+        line += f"; skipped {len(skipped)} (" + ", ".join(f"{n} {s}" for s, n in sorted(counts.items())) + ")"
+    print(line)
+
+# =============================================================
+# Token-budget packing
+# =============================================================
+
+CACHE_FILE = ".context_cache.json"
+CACHE_VERSION = 1
+LOCKFILES = {"package-lock.json", "yarn.lock", "pnpm-lock.yaml", "Cargo.lock", "poetry.lock",
+             "Pipfile.lock", "composer.lock", "Gemfile.lock"}
+GENERATED_SUFFIXES = (".min.js", ".min.css", ".map")
+JSON_TRIM_CHARS = 8000      # JSON files longer than this are cut down to their shape
+JSON_KEEP_ITEMS = 3         # items kept per array when trimming
+JSON_KEEP_CHARS = 200       # characters kept per string when trimming
+TERM_LIMIT = 300            # most frequent words cached per file for relevance
+PATH_MATCH_WEIGHT = 5.0     # a query word in the path counts as much as e^5 mentions
+SECTION_TOKENS = approx_tokens(section("", ""))
+WORD = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+
+
+def words(text: str) -> List[str]:
+    """Lowercased words, with camelCase and snake_case split, of three letters or more."""
+    return [w.lower() for w in WORD.findall(text) if len(w) >= 3]
+
+
+def shrink_json(value: Any) -> Any:
+    if isinstance(value, list):
+        kept = [shrink_json(v) for v in value[:JSON_KEEP_ITEMS]]
+        if len(value) > JSON_KEEP_ITEMS:
+            kept.append(f"... {len(value) - JSON_KEEP_ITEMS} more items")
+        return kept
+    if isinstance(value, dict):
+        return {k: shrink_json(v) for k, v in value.items()}
+    if isinstance(value, str) and len(value) > JSON_KEEP_CHARS:
+        return value[:JSON_KEEP_CHARS] + "..."
+    return value
+
+
+def trim_text(path: str, text: str) -> str:
+    """The file as packed: lockfiles and generated files dropped, large JSON cut to its shape."""
+    name = os.path.basename(path)
+    if name in LOCKFILES:
+        return f"[Lockfile omitted: {len(text):,} characters]\n"
+    if name.endswith(GENERATED_SUFFIXES):
+        return f"[Generated file omitted: {len(text):,} characters]\n"
+    if name.endswith(".json") and len(text) > JSON_TRIM_CHARS:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return text
+        return (f"[Trimmed JSON: arrays cut to {JSON_KEEP_ITEMS} items, strings to {JSON_KEEP_CHARS} characters]\n"
+                + json.dumps(shrink_json(data), indent=2, ensure_ascii=False) + "\n")
+    return text
+
+
+class TokenCache:
+    """
+    Digest, token counts and top words per file, keyed by absolute path and
+    reused while the file's size and mtime are unchanged.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.dirty = False
+        if path and os.path.exists(path):
             try:
-                with open(path, "r", encoding="utf-8") as infile:
-                    outfile.write(infile.read())
-            except Exception as e:
-                outfile.write(f"[Error reading file: {e}]\n")
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == CACHE_VERSION:
+                    self.entries = data.get("files", {})
+            except (OSError, ValueError):
+                pass   # a damaged cache is rebuilt
+
+    def lookup(self, key: str, st: os.stat_result) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(key)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return entry
+        return None
+
+    def store(self, key: str, entry: Dict[str, Any]):
+        self.entries[key] = entry
+        self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "files": self.entries}, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def scan(paths: List[str], cache: TokenCache, workers: int = READ_WORKERS,
+         max_bytes: int = MAX_FILE_BYTES) -> List[Dict[str, Any]]:
+    """
+    Cache entries (plus "path") for every readable file. Only files whose
+    size or mtime changed since the last scan are read.
+    """
+    entries: Dict[str, Dict[str, Any]] = {}
+    misses: List[Tuple[str, str, os.stat_result]] = []
+    for path in paths:
+        key = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entry = cache.lookup(key, st)
+        if entry is None:
+            misses.append((path, key, st))
+        else:
+            entries[path] = entry
+
+    for (path, key, st), result in zip(misses, read_in_order([m[0] for m in misses], workers, max_bytes)):
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "status": result["status"]}
+        if result["status"] == "ok":
+            text = result["text"]
+            entry.update(
+                digest=hashlib.sha1(text.encode("utf-8")).hexdigest(),
+                raw_tokens=approx_tokens(text),
+                tokens=approx_tokens(trim_text(path, text)) + SECTION_TOKENS,
+                terms=dict(Counter(words(text)).most_common(TERM_LIMIT)),
+            )
+        cache.store(key, entry)
+        entries[path] = entry
+
+    return [dict(entries[path], path=path) for path in paths
+            if path in entries and entries[path]["status"] == "ok"]
+
+
+def relevance(entry: Dict[str, Any], query_words: List[str]) -> float:
+    path_words = set(words(display_path(entry["path"])))
+    score = 0.0
+    for word in query_words:
+        if word in path_words:
+            score += PATH_MATCH_WEIGHT
+        score += math.log1p(entry["terms"].get(word, 0))
+    return score
+
+
+def rank(entries: List[Dict[str, Any]], query: str = "", priorities: Optional[List[str]] = None
+         ) -> List[Dict[str, Any]]:
+    """
+    Files in packing order: those matching an earlier --priority glob first,
+    then by relevance to the query, then by path.
+    """
+    priorities = priorities or []
+    query_words = sorted(set(words(query)))
+
+    def priority(entry: Dict[str, Any]) -> int:
+        shown = display_path(entry["path"])
+        for i, pattern in enumerate(priorities):
+            if fnmatch.fnmatch(shown, pattern) or fnmatch.fnmatch(os.path.basename(shown), pattern):
+                return i
+        return len(priorities)
+
+    for entry in entries:
+        entry["score"] = relevance(entry, query_words) if query_words else 0.0
+    return sorted(entries, key=lambda e: (priority(e), -e["score"], display_path(e["path"])))
+
+
+def pack(ranked: List[Dict[str, Any]], budget: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Greedy fill in rank order; a file that does not fit is passed over for smaller ones."""
+    selected, omitted, used = [], [], 0
+    for entry in ranked:
+        if used + entry["tokens"] <= budget:
+            selected.append(entry)
+            used += entry["tokens"]
+        else:
+            omitted.append(entry)
+    return selected, omitted
+
+
+def log_pack_summary(selected: List[Dict[str, Any]], omitted: List[Dict[str, Any]], budget: int,
+                     seconds: float, top: int):
+    used = sum(e["tokens"] for e in selected)
+    print(f"\n{'Tokens':>8}  {'Raw':>8}  {'Score':>6}  File")
+    shown = selected[:top] if top > 0 else selected
+    for e in shown:
+        print(f"{e['tokens']:>8,}  {e['raw_tokens']:>8,}  {e['score']:>6.1f}  {display_path(e['path'])}")
+    if len(shown) < len(selected):
+        print(f"{'':>8}  {'':>8}  {'':>6}  ... {len(selected) - len(shown)} more (--top 0 lists all)")
+    print(f"\nPacked {len(selected)} files, {used:,} of {budget:,} tokens in {seconds:.2f}s; "
+          f"left out {len(omitted)} ({sum(e['tokens'] for e in omitted):,} tokens)")
+
+
+# =============================================================
+# Watch mode
+# =============================================================
+
+DEBOUNCE = 0.15         # seconds of quiet before rebuilding after a burst of saves
+DEBOUNCE_MAX = 2.0      # rebuild anyway once a burst has gone on this long
+POLL_INTERVAL = 0.5
+
+
+class BundleIndex:
+    """
+    The output file as a list of per-file sections, with each file's stamp
+    (mtime, size) and digest. An update re-reads only files whose stamp
+    changed, and rewrites the output only from the first section whose
+    digest changed (in place when the section length is unchanged).
+    """
+
+    def __init__(self, output: str, workers: int = READ_WORKERS, max_bytes: int = MAX_FILE_BYTES):
+        self.output = output
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.paths: List[str] = []
+        self.sections: Dict[str, bytes] = {}
+        self.stamps: Dict[str, Optional[Tuple[int, int]]] = {}
+        self.digests: Dict[str, str] = {}
+        self.lengths: Dict[str, int] = {}   # section lengths as last written
+
+    @staticmethod
+    def stamp(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def update(self, paths: List[str], changed: Optional[set] = None) -> Dict[str, Any]:
+        """
+        Brings the output up to date with `paths`. changed is the set of
+        absolute paths reported by the watcher; None re-stats every file.
+        """
+        start = time.perf_counter()
+        stale = []
+        for path in paths:
+            if path not in self.sections:
+                stale.append(path)
+            elif (changed is None or os.path.abspath(path) in changed) and self.stamp(path) != self.stamps[path]:
+                stale.append(path)
+
+        edited = set()
+        for result in read_in_order(stale, self.workers, self.max_bytes):
+            path = result["path"]
+            data = section(path, result["text"]).encode("utf-8")
+            digest = hashlib.sha1(data).hexdigest()
+            self.stamps[path] = self.stamp(path)
+            if self.digests.get(path) != digest:
+                self.sections[path] = data
+                self.digests[path] = digest
+                edited.add(path)
+        for path in set(self.sections) - set(paths):
+            del self.sections[path], self.stamps[path], self.digests[path]
+
+        old_paths, self.paths = self.paths, list(paths)
+        written = self._write(old_paths, edited)
+        return {"reread": len(stale), "changed": len(edited), "files": len(paths), "written": written,
+                "ms": (time.perf_counter() - start) * 1000}
+
+    def _write(self, old_paths: List[str], edited: set) -> int:
+        """Writes what changed; returns the bytes written."""
+        if not os.path.exists(self.output) or not old_paths:
+            data = b"".join(self.sections[p] for p in self.paths)
+            with open(self.output, "wb") as f:
+                f.write(data)
+            self.lengths = {p: len(self.sections[p]) for p in self.paths}
+            return len(data)
+
+        first = next((i for i, (a, b) in enumerate(zip(old_paths, self.paths)) if a != b or a in edited),
+                     min(len(old_paths), len(self.paths)))
+        if first == len(old_paths) == len(self.paths):
+            return 0
+        offset = sum(self.lengths[p] for p in old_paths[:first])
+        with open(self.output, "r+b") as f:
+            if old_paths == self.paths and all(len(self.sections[p]) == self.lengths[p] for p in edited):
+                written = 0
+                for p in self.paths[first:]:
+                    if p in edited:
+                        f.seek(offset)
+                        f.write(self.sections[p])
+                        written += len(self.sections[p])
+                    offset += self.lengths[p]
+            else:
+                data = b"".join(self.sections[p] for p in self.paths[first:])
+                f.seek(offset)
+                f.write(data)
+                f.truncate()
+                written = len(data)
+        self.lengths = {p: len(self.sections[p]) for p in self.paths}
+        return written
+
+
+class PollingWatcher:
+    """Stats every input file and directory each interval. Works everywhere."""
+
+    def __init__(self, interval: float = POLL_INTERVAL):
+        self.interval = interval
+        self.files: Dict[str, Optional[Tuple[int, int]]] = {}
+        self.dirs: Dict[str, Optional[Tuple[int, int]]] = {}
+
+    def track(self, files: List[str], dirs: List[str]):
+        self.files = {os.path.abspath(p): BundleIndex.stamp(p) for p in files}
+        self.dirs = {os.path.abspath(d): BundleIndex.stamp(d) for d in dirs}
+
+    def poll(self) -> Tuple[set, bool]:
+        changed = {p for p, st in self.files.items() if BundleIndex.stamp(p) != st}
+        for p in changed:
+            self.files[p] = BundleIndex.stamp(p)
+        structural = False
+        for d, st in self.dirs.items():
+            now = BundleIndex.stamp(d)
+            if now != st:
+                self.dirs[d] = now
+                structural = True   # an entry was added, removed or renamed
+        return changed, structural
+
+    def wait(self, timeout: float) -> Tuple[set, bool]:
+        time.sleep(min(timeout, self.interval))
+        return self.poll()
+
+
+class InotifyWatcher:
+    """Linux inotify through libc, one watch per directory."""
+
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+    IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+    IN_DELETE_SELF, IN_MOVE_SELF, IN_Q_OVERFLOW, IN_ISDIR = 0x400, 0x800, 0x4000, 0x40000000
+    EVENT = struct.Struct("iIII")
+    CONTENT = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE
+    STRUCTURE = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, str] = {}
+        self.watched: Dict[str, int] = {}
+
+    def track(self, files: List[str], dirs: List[str]):
+        wanted = {os.path.abspath(d) for d in dirs} | {os.path.dirname(os.path.abspath(p)) for p in files}
+        for directory in sorted(wanted - set(self.watched)):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.CONTENT | self.STRUCTURE)
+            if wd >= 0:
+                self.watches[wd] = directory
+                self.watched[directory] = wd
+        for directory in set(self.watched) - wanted:
+            self.libc.inotify_rm_watch(self.fd, self.watched[directory])
+            self.watches.pop(self.watched.pop(directory), None)
+
+    def wait(self, timeout: float) -> Tuple[set, bool]:
+        changed, structural = set(), False
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed, structural
+        try:
+            buf = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return changed, structural
+        pos = 0
+        while pos + self.EVENT.size <= len(buf):
+            wd, mask, _, length = self.EVENT.unpack_from(buf, pos)
+            name = buf[pos + self.EVENT.size:pos + self.EVENT.size + length].rstrip(b"\0")
+            pos += self.EVENT.size + length
+            if mask & self.IN_Q_OVERFLOW:
+                structural = True
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            if mask & self.STRUCTURE or (mask & self.IN_ISDIR) or os.path.basename(path) == ".gitignore":
+                structural = True
+            changed.add(path)
+        return changed, structural
+
+
+def make_watcher():
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher()
+
+
+def watch_dirs(inputs: List[str], use_gitignore: bool) -> List[str]:
+    """Directories whose entries can change the input set."""
+    dirs = []
+    for item in inputs:
+        if os.path.isdir(item):
+            root = item
+        elif os.path.exists(item) or not GLOB_CHARS.search(item):
+            dirs.append(os.path.dirname(os.path.abspath(item)))
+            continue
         else:
-            outfile.write("[File not found]\n")
+            root = GLOB_CHARS.split(item, 1)[0]
+            root = root if os.path.isdir(root) else (os.path.dirname(root) or ".")
+        ignore = GitIgnore(GitIgnore.find_root(root)) if use_gitignore else None
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in ALWAYS_SKIP
+                           and not (ignore and ignore.ignored(os.path.join(dirpath, d), True, True))]
+            dirs.append(dirpath)
+    return dirs
+
+
+def watch(args, output: str):
+    """Rebuilds the output whenever an input changes, until interrupted."""
+    inputs = args.inputs or list(FILE_PATHS)
+    watcher = make_watcher()
+    index = BundleIndex(output, args.workers, args.max_bytes)
+    paths = input_paths(args, output)
+    if args.budget:
+        run(args, output)
+    else:
+        stats = index.update(paths)
+        print(f"Bundled {stats['files']} files ({stats['written']:,} bytes) in {stats['ms']:.0f} ms")
+    watcher.track(paths, watch_dirs(inputs, not args.no_gitignore))
+    print(f"Watching with {type(watcher).__name__.replace('Watcher', '').lower()}; Ctrl+C to stop")
+
+    try:
+        while True:
+            changed, structural = watcher.wait(1.0)
+            if not changed and not structural:
+                continue
+            burst_start = time.monotonic()
+            while time.monotonic() - burst_start < DEBOUNCE_MAX:
+                more, more_structural = watcher.wait(DEBOUNCE)
+                if not more and not more_structural:
+                    break
+                changed |= more
+                structural |= more_structural
+            changed.discard(os.path.abspath(output))
+            if structural:
+                paths = input_paths(args, output)
+                watcher.track(paths, watch_dirs(inputs, not args.no_gitignore))
+            if args.budget:
+                run(args, output)   # the token cache keeps a full repack fast
+                continue
+            stats = index.update(paths, None if structural else changed)
+            if stats["reread"] or stats["written"]:
+                print(f"[{time.strftime('%H:%M:%S')}] {stats['changed']} changed of {stats['files']} files, "
+                      f"wrote {stats['written']:,} bytes in {stats['ms']:.1f} ms")
+    except KeyboardInterrupt:
+        pass
+
+
+def input_paths(args, output: str) -> List[str]:
+    """The files to bundle, without the bundle's own output and cache files."""
+    paths = expand_inputs(args.inputs, not args.no_gitignore) if args.inputs else list(FILE_PATHS)
+    skip = {os.path.abspath(p) for p in (output, args.cache, args.cache + ".tmp") if p and p != "-"}
+    return [p for p in paths if os.path.abspath(p) not in skip]
+
+
+def run(args, output: str):
+    start = time.perf_counter()
+    paths = input_paths(args, output)
+
+    selected = omitted = None
+    if args.budget:
+        cache = TokenCache(args.cache)
+        entries = scan(paths, cache, args.workers, args.max_bytes)
+        cache.save()
+        selected, omitted = pack(rank(entries, args.query, args.priority), args.budget)
+        paths = [e["path"] for e in selected]
+
+    transform = trim_text if args.budget else None
+    stdout = sys.stdout
+    if output == "-":
+        results = write_bundle(paths, sys.stdout, args.workers, args.max_bytes, transform)
+        sys.stdout.flush()
+        sys.stdout = sys.stderr   # keep the summary out of the bundle
+    else:
+        with open(output, "w", encoding="utf-8", newline="\n") as outfile:
+            results = write_bundle(paths, outfile, args.workers, args.max_bytes, transform)
+    try:
+        if args.budget:
+            log_pack_summary(selected, omitted, args.budget, time.perf_counter() - start, args.top)
+        else:
+            log_summary(results, time.perf_counter() - start, args.top)
+    finally:
+        sys.stdout = stdout
+    if output != "-":
+        print(f"Combined code written to: {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bundle source files into one text file.")
+    parser.add_argument("inputs", nargs="*", help="Files, directories or glob patterns (default: FILE_PATHS)")
+    parser.add_argument("-o", "--output", default=None, help="Output file, '-' for stdout (default: OUTPUT_FILE)")
+    parser.add_argument("--no-gitignore", action="store_true", help="Include files matched by .gitignore")
+    parser.add_argument("--max-bytes", type=int, default=MAX_FILE_BYTES, help="Skip files larger than this")
+    parser.add_argument("--workers", type=int, default=READ_WORKERS, help="Parallel file reads")
+    parser.add_argument("--top", type=int, default=20, help="Files to list in the summary (0 = all)")
+    parser.add_argument("--budget", type=int, help="Pack the most relevant files into this many tokens")
+    parser.add_argument("--query", default="", help="Rank files by relevance to this text (with --budget)")
+    parser.add_argument("--priority", action="append", default=[], metavar="GLOB",
+                        help="Files to pack first, in the order given (repeatable, with --budget)")
+    parser.add_argument("--cache", default=CACHE_FILE, help="Token cache file ('' to disable)")
+    parser.add_argument("--watch", action="store_true", help="Keep the output up to date as inputs change")
+    args = parser.parse_args()
+
+    output = args.output or (OUTPUT_FILE if not args.inputs else "combined.txt")
+    if args.watch:
+        if output == "-":
+            parser.error("--watch needs an output file")
+        watch(args, output)
+    else:
+        run(args, output)
+
 
-print(f"Combined code written to: {output_file}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Curriculum SQLite Export
+========================
+Writes a processed curriculum (the full_data list produced by
+process_curriculum.py or process_gcse_curriculum.py) to a normalized SQLite
+database, so API routes and scripts can run indexed lookups instead of
+loading and walking the whole JSON tree.
+
+Tables:
+    programmes  one row per grade (CBC) or year (GCSE); `level` is the grade/year number
+    subjects    per programme, with the subject abbreviation used in strand IDs
+    strands     per subject, keyed by the processors' strand ID
+    subtopics   per strand, in order (GCSE objectives are stored here too)
+
+Indexes cover strand ID, programme level and subject abbreviation. The view
+`strand_index` joins a strand to its subject and programme.
+
+The database is built in a temporary file inside one bulk transaction, with
+the indexes created after the rows are loaded, and then moved into place.
+Readers never see a half-written database.
+"""
+
+import json
+import os
+import sqlite3
+from typing import Any, Callable, Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE programmes (
+    id INTEGER PRIMARY KEY,
+    system TEXT NOT NULL,
+    name TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    age_range TEXT,
+    notes TEXT
+);
+CREATE TABLE subjects (
+    id INTEGER PRIMARY KEY,
+    programme_id INTEGER NOT NULL REFERENCES programmes (id),
+    name TEXT NOT NULL,
+    abbrev TEXT NOT NULL,
+    description TEXT,
+    position INTEGER NOT NULL
+);
+CREATE TABLE strands (
+    id INTEGER PRIMARY KEY,
+    subject_id INTEGER NOT NULL REFERENCES subjects (id),
+    strand_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT,
+    position INTEGER NOT NULL
+);
+CREATE TABLE subtopics (
+    id INTEGER PRIMARY KEY,
+    strand_id INTEGER NOT NULL REFERENCES strands (id),
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE VIEW strand_index AS
+    SELECT s.id, s.strand_id, s.name AS strand, s.description,
+           sub.name AS subject, sub.abbrev, p.system, p.level, p.name AS programme
+    FROM strands s
+    JOIN subjects sub ON sub.id = s.subject_id
+    JOIN programmes p ON p.id = sub.programme_id;
+"""
+
+INDEXES = """
+CREATE INDEX idx_programmes_level ON programmes (system, level);
+CREATE INDEX idx_subjects_abbrev ON subjects (abbrev, programme_id);
+CREATE INDEX idx_subjects_programme ON subjects (programme_id);
+CREATE INDEX idx_strands_strand_id ON strands (strand_id);
+CREATE INDEX idx_strands_subject ON strands (subject_id);
+CREATE INDEX idx_subtopics_strand ON subtopics (strand_id, position);
+"""
+
+
+def subtopic_text(item: Any) -> str:
+    return item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+
+
+def export_sqlite(full_data: List[Dict[str, Any]], path: str, system: str,
+                  level_of: Callable[[Dict[str, Any]], int],
+                  abbrev_of: Callable[[str], str]) -> Dict[str, int]:
+    """
+    Writes full_data to `path`, replacing any existing file.
+    level_of(programme_entry) gives the grade/year number and abbrev_of(subject
+    name) the subject abbreviation. Returns row counts per table plus
+    'duplicate_strand_ids'.
+    """
+    programmes, subjects, strands, subtopics = [], [], [], []
+    seen_ids: Dict[str, int] = {}
+    for entry in full_data:
+        programme_id = len(programmes) + 1
+        programmes.append((programme_id, system, entry["programme"], level_of(entry),
+                           entry.get("age_range", ""), entry.get("notes", "")))
+        for subject_pos, subject in enumerate(entry.get("subjects", [])):
+            subject_id = len(subjects) + 1
+            subjects.append((subject_id, programme_id, subject["name"], abbrev_of(subject["name"]),
+                             subject.get("description", ""), subject_pos))
+            for strand_pos, strand in enumerate(subject.get("strands", [])):
+                strand_row = len(strands) + 1
+                seen_ids[strand["id"]] = seen_ids.get(strand["id"], 0) + 1
+                strands.append((strand_row, subject_id, strand["id"], strand["name"],
+                                strand.get("description", ""), strand_pos))
+                items = strand.get("subtopics") or strand.get("objectives") or []
+                for item_pos, item in enumerate(items):
+                    subtopics.append((len(subtopics) + 1, strand_row, item_pos, subtopic_text(item)))
+
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("BEGIN")
+        # Statement by statement: executescript() would commit the open transaction
+        for statement in SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        conn.executemany("INSERT INTO programmes VALUES (?, ?, ?, ?, ?, ?)", programmes)
+        conn.executemany("INSERT INTO subjects VALUES (?, ?, ?, ?, ?, ?)", subjects)
+        conn.executemany("INSERT INTO strands VALUES (?, ?, ?, ?, ?, ?)", strands)
+        conn.executemany("INSERT INTO subtopics VALUES (?, ?, ?, ?)", subtopics)
+        for statement in INDEXES.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+
+    return {
+        "programmes": len(programmes),
+        "subjects": len(subjects),
+        "strands": len(strands),
+        "subtopics": len(subtopics),
+        "duplicate_strand_ids": sum(1 for n in seen_ids.values() if n > 1),
+    }
+
+
+# =============================================================
+# Lookups
+# =============================================================
+
+def connect(path: str) -> sqlite3.Connection:
+    """Read-only connection with rows as sqlite3.Row."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def strand(conn: sqlite3.Connection, strand_id: str) -> Optional[Dict[str, Any]]:
+    """One strand with its subject, programme and subtopics."""
+    row = conn.execute("SELECT * FROM strand_index WHERE strand_id = ?", (strand_id,)).fetchone()
+    if row is None:
+        return None
+    result = dict(row)
+    result["subtopics"] = [r[0] for r in conn.execute(
+        "SELECT text FROM subtopics WHERE strand_id = ? ORDER BY position", (row["id"],))]
+    return result
+
+
+def strands_for(conn: sqlite3.Connection, level: int, abbrev: Optional[str] = None,
+                system: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Strands of a grade/year, optionally for one subject abbreviation, in curriculum order."""
+    sql = ("SELECT s.strand_id, s.name AS strand, sub.name AS subject, sub.abbrev, p.system, p.level "
+           "FROM programmes p JOIN subjects sub ON sub.programme_id = p.id "
+           "JOIN strands s ON s.subject_id = sub.id WHERE p.level = ?")
+    params: List[Any] = [level]
+    if abbrev:
+        sql += " AND sub.abbrev = ?"
+        params.append(abbrev)
+    if system:
+        sql += " AND p.system = ?"
+        params.append(system)
+    sql += " ORDER BY p.id, sub.position, s.position"
+    return [dict(r) for r in conn.execute(sql, params)]
+
+
+def subtopic_counts(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Subtopic totals per subject abbreviation."""
+    rows = conn.execute(
+        "SELECT sub.abbrev, COUNT(t.id) AS subtopics FROM subjects sub "
+        "JOIN strands s ON s.subject_id = sub.id LEFT JOIN subtopics t ON t.strand_id = s.id "
+        "GROUP BY sub.abbrev ORDER BY subtopics DESC"
+    )
+    return [dict(r) for r in rows]
@@ -0,0 +1,278 @@
+"""
+Curriculum Query Service
+========================
+Small read-only HTTP/JSON service over the processor outputs
+(cbc_curriculum_with_ids.json, gcse_curriculum_with_ids.json), so pages and
+API routes fetch only the slice they need instead of importing whole files.
+
+Endpoints (system is "cbc" or "gcse"):
+    GET /curricula                                   systems, programmes and levels
+    GET /<system>/programmes/<programme-slug>        one programme with its subjects and strand names
+    GET /<system>/levels/<n>                         same, by grade (CBC) or year (GCSE) number
+    GET /<system>/levels/<n>/subjects/<abbrev>       one subject with full strands
+    GET /strands/<strand-id>                         full strand(s) with that ID, from any system
+
+Every response body is built, hashed and gzip-compressed when the files
+are loaded. ETags are the body hashes, so unchanged slices answer
+If-None-Match with 304 even across reloads. The gzip representation has
+its own ETag (the hash with a "-gzip" suffix), so a cache never validates
+gzip bytes for a client that did not ask for them. The service polls the source
+files and swaps in a new index when the processors rewrite them. A file
+caught half-written is retried on the next poll and the old index keeps
+serving until then.
+
+Usage:
+    python curriculum_service.py --port 8766
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+import process_curriculum
+import process_gcse_curriculum
+
+DEFAULT_PORT = 8766
+RELOAD_SECONDS = 2.0
+CACHE_CONTROL = "public, max-age=60"
+GZIP_MIN_BYTES = 512
+
+SOURCES = {
+    "cbc": os.path.join("src", "components", "CBCStudent", "cbc_curriculum_with_ids.json"),
+    "gcse": os.path.join("src", "components", "GCSEStudent", "gcse_curriculum_with_ids.json"),
+}
+
+# Per system: programme entry → grade/year number, subject name → abbreviation, slugify
+SYSTEMS: Dict[str, Tuple[Callable[[Dict[str, Any]], int], Callable[[str], str], Callable[[str], str]]] = {
+    "cbc": (lambda grade: process_curriculum.extract_grade_number(grade["programme"]),
+            process_curriculum.subject_abbreviation, process_curriculum.slugify),
+    "gcse": (lambda year: year.get("year_number") or process_gcse_curriculum.extract_year_number(year["programme"]),
+             process_gcse_curriculum.subject_abbreviation, process_gcse_curriculum.slugify),
+}
+
+
+class Response:
+    """A JSON body and its gzip variant, each with its own ETag, built once."""
+
+    __slots__ = ("body", "gzipped", "etag", "gzip_etag")
+
+    def __init__(self, payload: Any):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+        self.gzipped = gzip.compress(self.body, 6, mtime=0) if len(self.body) >= GZIP_MIN_BYTES else None
+
+    def representation(self, accept_encoding: Optional[str]) -> Tuple[bytes, str, bool]:
+        """(body, ETag, gzipped) for a request's Accept-Encoding."""
+        if self.gzipped is not None and accepts_gzip(accept_encoding):
+            return self.gzipped, self.gzip_etag, True
+        return self.body, self.etag, False
+
+
+def strand_summary(strand: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": strand["id"], "name": strand["name"]}
+
+
+def build_routes(data: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Response]:
+    """Every servable path → prebuilt response, for the loaded systems."""
+    routes: Dict[str, Response] = {}
+    catalogue: Dict[str, Any] = {}
+    strands_by_id: Dict[str, List[Dict[str, Any]]] = {}
+
+    for system, entries in data.items():
+        level_of, abbrev_of, slugify = SYSTEMS[system]
+        by_level: Dict[int, List[Dict[str, Any]]] = {}
+        listing = []
+        for entry in entries:
+            level = level_of(entry)
+            slug = slugify(entry["programme"])
+            subjects = [{"name": s["name"], "abbrev": abbrev_of(s["name"]),
+                         "strands": [strand_summary(st) for st in s.get("strands", [])]}
+                        for s in entry.get("subjects", [])]
+            programme = {"system": system, "programme": entry["programme"], "slug": slug, "level": level,
+                         "age_range": entry.get("age_range", ""), "notes": entry.get("notes", ""),
+                         "subjects": subjects}
+            routes[f"/{system}/programmes/{slug}"] = Response(programme)
+            by_level.setdefault(level, []).append(programme)
+            listing.append({"programme": entry["programme"], "slug": slug, "level": level,
+                            "subjects": len(subjects)})
+
+            for subject in entry.get("subjects", []):
+                abbrev = abbrev_of(subject["name"])
+                for strand in subject.get("strands", []):
+                    strands_by_id.setdefault(strand["id"], []).append(
+                        {"system": system, "level": level, "programme": entry["programme"],
+                         "subject": subject["name"], "abbrev": abbrev, **strand})
+
+        for level, programmes in by_level.items():
+            # Levels normally map to one programme; merge if a file lists a level twice
+            merged = dict(programmes[0], subjects=[s for p in programmes for s in p["subjects"]])
+            routes[f"/{system}/levels/{level}"] = Response(merged)
+            by_abbrev: Dict[str, List[Dict[str, Any]]] = {}
+            for entry in entries:
+                if level_of(entry) != level:
+                    continue
+                for subject in entry.get("subjects", []):
+                    by_abbrev.setdefault(abbrev_of(subject["name"]), []).append(subject)
+            for abbrev, subjects in by_abbrev.items():
+                routes[f"/{system}/levels/{level}/subjects/{abbrev}"] = Response({
+                    "system": system, "level": level, "abbrev": abbrev,
+                    "subjects": [{"name": s["name"], "description": s.get("description", ""),
+                                  "strands": s.get("strands", [])} for s in subjects],
+                })
+        catalogue[system] = listing
+
+    for strand_id, matches in strands_by_id.items():
+        routes[f"/strands/{strand_id}"] = Response({"id": strand_id, "matches": matches})
+    routes["/curricula"] = Response(catalogue)
+    return routes
+
+
+class CurriculumStore:
+    """Holds the current route table and reloads it when a source file changes."""
+
+    def __init__(self, sources: Dict[str, str], reload_seconds: float = RELOAD_SECONDS):
+        self.sources = {system: path for system, path in sources.items() if path}
+        self.reload_seconds = reload_seconds
+        self.routes: Dict[str, Response] = {}
+        self.stamps: Dict[str, Tuple[float, int]] = {}
+        self.loaded_at = 0.0
+        self.reloads = 0
+        if not self.reload():
+            raise ValueError("Could not load the curriculum files")
+
+    def _stamps(self) -> Dict[str, Tuple[float, int]]:
+        stamps = {}
+        for system, path in self.sources.items():
+            try:
+                st = os.stat(path)
+                stamps[system] = (st.st_mtime, st.st_size)
+            except OSError:
+                stamps[system] = (0.0, -1)
+        return stamps
+
+    def reload(self) -> bool:
+        stamps = self._stamps()
+        data = {}
+        try:
+            for system, path in self.sources.items():
+                with open(path, "r", encoding="utf-8") as f:
+                    data[system] = json.load(f)
+            routes = build_routes(data)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Curriculum reload failed, keeping the previous index: {e}")
+            return False
+        self.routes = routes   # a single reference swap; readers see old or new, never a mix
+        self.stamps = stamps
+        self.loaded_at = time.time()
+        self.reloads += 1
+        return True
+
+    def watch(self):
+        while True:
+            time.sleep(self.reload_seconds)
+            if self._stamps() != self.stamps:
+                if self.reload():
+                    print(f"Curriculum reloaded ({len(self.routes)} routes)")
+
+    def start_watching(self):
+        threading.Thread(target=self.watch, name="curriculum-watch", daemon=True).start()
+
+    def get(self, path: str) -> Optional[Response]:
+        return self.routes.get(path.rstrip("/") or "/")
+
+
+def accepts_gzip(header: Optional[str]) -> bool:
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def make_handler(store: CurriculumStore):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, head_only: bool):
+            path = unquote(urlparse(self.path).path)
+            response = store.get(path)
+            if response is None:
+                body = b'{"error":"not found"}'
+                self.send_response(404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if not head_only:
+                    self.wfile.write(body)
+                return
+
+            body, etag, gzipped = response.representation(self.headers.get("Accept-Encoding"))
+            if etag_matches(self.headers.get("If-None-Match"), etag):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", CACHE_CONTROL)
+                self.send_header("Vary", "Accept-Encoding")
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", CACHE_CONTROL)
+            self.send_header("Vary", "Accept-Encoding")
+            if gzipped:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if not head_only:
+                self.wfile.write(body)
+
+        def do_GET(self):
+            self._send(head_only=False)
+
+        def do_HEAD(self):
+            self._send(head_only=True)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only curriculum query service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cbc", default=SOURCES["cbc"], help="CBC curriculum with IDs ('' to skip)")
+    parser.add_argument("--gcse", default=SOURCES["gcse"], help="GCSE curriculum with IDs ('' to skip)")
+    parser.add_argument("--reload-seconds", type=float, default=RELOAD_SECONDS)
+    args = parser.parse_args()
+
+    store = CurriculumStore({"cbc": args.cbc, "gcse": args.gcse}, args.reload_seconds)
+    store.start_watching()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(store))
+    print(f"Curriculum service: {len(store.routes)} routes on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Curriculum Binary Snapshot
+==========================
+A versioned, memory-mappable copy of a processed curriculum (the full_data
+list from process_curriculum.py / process_gcse_curriculum.py).
+
+Nothing is parsed at open time beyond a fixed header, so a service starts
+almost instantly. The file is mapped read-only, so worker processes share
+its pages through the OS cache, and strands are decoded only when asked for.
+
+Layout (little-endian):
+
+  header        MAGIC, version, record counts, section offsets, sha256 of the source
+  programmes    fixed-width records: name, level, age_range, notes, first subject, count
+  subjects      fixed-width records: name, abbrev, description, programme, first strand, count
+  strands       fixed-width records: strand ID, name, description, subject, first subtopic, count, flags
+  subtopics     one string index per item
+  id_order      strand record numbers sorted by strand ID (binary search)
+  string index  (offset, length) per string into the string data
+  string data   UTF-8, each distinct string stored once
+
+All string fields are indexes into the string table. Readers must reject a
+file whose MAGIC or VERSION they do not know. Bump VERSION on any layout
+change.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+MAGIC = b"CURSNAP\0"
+VERSION = 1
+
+HEADER = struct.Struct("<8sHH6I7Q32s")
+PROGRAMME = struct.Struct("<IiIIII")
+SUBJECT = struct.Struct("<IIIIII")
+STRAND = struct.Struct("<IIIIIII")
+INDEX = struct.Struct("<I")
+STRING_REF = struct.Struct("<II")
+
+SYSTEM_CODES = {"cbc": 1, "gcse": 2}
+FLAG_OBJECTIVES = 1   # GCSE strands that list 'objectives' instead of 'subtopics'
+
+
+def source_hash(full_data: List[Dict[str, Any]]) -> bytes:
+    return hashlib.sha256(json.dumps(full_data, sort_keys=True, ensure_ascii=False).encode("utf-8")).digest()
+
+
+# =============================================================
+# Writer
+# =============================================================
+
+def write_snapshot(full_data: List[Dict[str, Any]], path: str, system: str,
+                   level_of: Callable[[Dict[str, Any]], int],
+                   abbrev_of: Callable[[str], str]) -> Dict[str, int]:
+    """
+    Writes full_data to `path` (atomically). level_of and abbrev_of as in
+    curriculum_db.export_sqlite. Returns record counts and the file size.
+    """
+    strings: Dict[str, int] = {}
+
+    def s(text: Any) -> int:
+        text = "" if text is None else str(text)
+        idx = strings.get(text)
+        if idx is None:
+            idx = strings[text] = len(strings)
+        return idx
+
+    programmes, subjects, strands, subtopics = [], [], [], []
+    for entry in full_data:
+        subject_first = len(subjects)
+        for subject in entry.get("subjects", []):
+            strand_first = len(strands)
+            for strand in subject.get("strands", []):
+                key = "objectives" if "objectives" in strand and "subtopics" not in strand else "subtopics"
+                items = strand.get(key) or []
+                strands.append((s(strand["id"]), s(strand["name"]), s(strand.get("description", "")),
+                                len(subjects), len(subtopics), len(items),
+                                FLAG_OBJECTIVES if key == "objectives" else 0))
+                subtopics.extend(s(item) for item in items)
+            subjects.append((s(subject["name"]), s(abbrev_of(subject["name"])), s(subject.get("description", "")),
+                             len(programmes), strand_first, len(strands) - strand_first))
+        programmes.append((s(entry["programme"]), level_of(entry), s(entry.get("age_range", "")),
+                           s(entry.get("notes", "")), subject_first, len(subjects) - subject_first))
+
+    texts = list(strings)
+    id_order = sorted(range(len(strands)), key=lambda i: texts[strands[i][0]])
+
+    encoded = [t.encode("utf-8") for t in texts]
+    string_index, offset = [], 0
+    for data in encoded:
+        string_index.append((offset, len(data)))
+        offset += len(data)
+
+    sections = [
+        b"".join(PROGRAMME.pack(*r) for r in programmes),
+        b"".join(SUBJECT.pack(*r) for r in subjects),
+        b"".join(STRAND.pack(*r) for r in strands),
+        b"".join(INDEX.pack(i) for i in subtopics),
+        b"".join(INDEX.pack(i) for i in id_order),
+        b"".join(STRING_REF.pack(*r) for r in string_index),
+    ]
+    offsets, pos = [], HEADER.size
+    for section in sections:
+        offsets.append(pos)
+        pos += len(section)
+    offsets.append(pos)   # string data
+
+    header = HEADER.pack(MAGIC, VERSION, SYSTEM_CODES.get(system, 0),
+                         len(programmes), len(subjects), len(strands), len(subtopics), len(texts), 0,
+                         *offsets, source_hash(full_data))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        for section in sections:
+            f.write(section)
+        for data in encoded:
+            f.write(data)
+    os.replace(tmp, path)
+    return {
+        "programmes": len(programmes),
+        "subjects": len(subjects),
+        "strands": len(strands),
+        "subtopics": len(subtopics),
+        "strings": len(texts),
+        "bytes": os.path.getsize(path),
+    }
+
+
+# =============================================================
+# Reader
+# =============================================================
+
+class CurriculumSnapshot:
+    """
+    Read-only view over a snapshot file. Records are decoded on access;
+    strings are decoded once and cached.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = HEADER.unpack_from(self.buf, 0)
+        magic, version, system_code = fields[:3]
+        if magic != MAGIC:
+            self.buf.close()
+            raise ValueError(f"{path}: not a curriculum snapshot")
+        if version != VERSION:
+            self.buf.close()
+            raise ValueError(f"{path}: snapshot version {version}, this reader supports {VERSION}")
+        (self.n_programmes, self.n_subjects, self.n_strands,
+         self.n_subtopics, self.n_strings, _) = fields[3:9]
+        (self.programmes_at, self.subjects_at, self.strands_at, self.subtopics_at,
+         self.id_order_at, self.string_index_at, self.string_data_at) = fields[9:16]
+        self.source_hash = fields[16].hex()
+        self.system = {v: k for k, v in SYSTEM_CODES.items()}.get(system_code, "")
+        self._strings: Dict[int, str] = {}
+
+    def close(self):
+        self.buf.close()
+
+    def __enter__(self) -> "CurriculumSnapshot":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def string(self, idx: int) -> str:
+        text = self._strings.get(idx)
+        if text is None:
+            offset, length = STRING_REF.unpack_from(self.buf, self.string_index_at + idx * STRING_REF.size)
+            start = self.string_data_at + offset
+            text = self._strings[idx] = self.buf[start:start + length].decode("utf-8")
+        return text
+
+    # ---------------------------------------------------------
+    # Records
+    # ---------------------------------------------------------
+
+    def programme(self, idx: int) -> Dict[str, Any]:
+        name, level, age, notes, first, count = PROGRAMME.unpack_from(
+            self.buf, self.programmes_at + idx * PROGRAMME.size)
+        return {"programme": self.string(name), "level": level, "age_range": self.string(age),
+                "notes": self.string(notes), "subjects": range(first, first + count)}
+
+    def subject(self, idx: int) -> Dict[str, Any]:
+        name, abbrev, desc, programme, first, count = SUBJECT.unpack_from(
+            self.buf, self.subjects_at + idx * SUBJECT.size)
+        return {"name": self.string(name), "abbrev": self.string(abbrev), "description": self.string(desc),
+                "programme": programme, "strands": range(first, first + count)}
+
+    def _strand_record(self, idx: int):
+        return STRAND.unpack_from(self.buf, self.strands_at + idx * STRAND.size)
+
+    def strand_id(self, idx: int) -> str:
+        return self.string(self._strand_record(idx)[0])
+
+    def strand(self, idx: int) -> Dict[str, Any]:
+        """A strand in the processors' JSON shape, plus its subject and programme indexes."""
+        sid, name, desc, subject, first, count, flags = self._strand_record(idx)
+        items = [self.string(INDEX.unpack_from(self.buf, self.subtopics_at + i * INDEX.size)[0])
+                 for i in range(first, first + count)]
+        key = "objectives" if flags & FLAG_OBJECTIVES else "subtopics"
+        return {"id": self.string(sid), "name": self.string(name), "description": self.string(desc),
+                key: items, "subject": subject,
+                "programme": SUBJECT.unpack_from(self.buf, self.subjects_at + subject * SUBJECT.size)[3]}
+
+    # ---------------------------------------------------------
+    # Lookups
+    # ---------------------------------------------------------
+
+    def _ordered(self, pos: int) -> int:
+        return INDEX.unpack_from(self.buf, self.id_order_at + pos * INDEX.size)[0]
+
+    def find_strands(self, strand_id: str) -> List[int]:
+        """Record numbers of every strand with this ID (IDs are not guaranteed unique)."""
+        lo, hi = 0, self.n_strands
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.strand_id(self._ordered(mid)) < strand_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        while lo < self.n_strands:
+            idx = self._ordered(lo)
+            if self.strand_id(idx) != strand_id:
+                break
+            found.append(idx)
+            lo += 1
+        return sorted(found)
+
+    def find_strand(self, strand_id: str) -> Optional[Dict[str, Any]]:
+        found = self.find_strands(strand_id)
+        return self.strand(found[0]) if found else None
+
+    def programmes_for(self, level: int) -> Iterator[int]:
+        for idx in range(self.n_programmes):
+            if PROGRAMME.unpack_from(self.buf, self.programmes_at + idx * PROGRAMME.size)[1] == level:
+                yield idx
+
+    def strands_for(self, level: int, abbrev: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Strands of a grade/year, optionally for one subject abbreviation."""
+        result = []
+        for p in self.programmes_for(level):
+            for sub in self.programme(p)["subjects"]:
+                subject = self.subject(sub)
+                if abbrev and subject["abbrev"] != abbrev:
+                    continue
+                result.extend(self.strand(i) for i in subject["strands"])
+        return result
@@ -0,0 +1,308 @@
+"""
+Firestore Bulk Loader
+=====================
+Loads the processed curricula (cbc_curriculum_with_ids.json,
+gcse_curriculum_with_ids.json) into Firestore:
+
+    curriculumStrands/{strandId}          one document per strand, with subtopics/objectives
+    courseCatalog/{system}-{level}-{abbrev}  one catalog course per grade/year subject, in
+                                          the shape /api/courses/catalog serves (see populate_catalog.js)
+
+Writes go out in batches of up to BATCH_SIZE operations, several batches
+in parallel. Every upsert is keyed, so re-running the loader never creates
+duplicates. Each document carries a contentHash; the loader reads the
+existing hashes first and skips documents that have not changed, so a
+repeat run writes nothing. New documents get createdAt (and catalog courses
+enrollmentCount 0). Updates merge and leave those fields alone. Batches
+that fail on contention or quota are retried with backoff.
+
+Strand IDs are not unique in the source files (CBC lists Grade 8 twice),
+and neither are grade/subject pairs. Later occurrences get a -2, -3 ...
+suffix in curriculum order, so document IDs stay stable between runs.
+
+Credentials come from FIREBASE_PROJECT_ID / FIREBASE_CLIENT_EMAIL /
+FIREBASE_PRIVATE_KEY as in src/lib/firebaseAdmin.ts, falling back to
+application default credentials. With --emulator (or FIRESTORE_EMULATOR_HOST)
+no credentials are needed.
+
+google-cloud-firestore is imported when a client is made, so --dry-run
+(build and hash the documents only) works without it.
+
+Usage:
+    firebase emulators:start --only firestore
+    python firestore_loader.py --emulator 127.0.0.1:8080
+    python firestore_loader.py --only strands --report load_report.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from curriculum_service import SOURCES, SYSTEMS
+
+if TYPE_CHECKING:
+    from google.cloud import firestore
+
+STRANDS_COLLECTION = "curriculumStrands"
+CATALOG_COLLECTION = "courseCatalog"
+BATCH_SIZE = 500          # Firestore's limit on writes per batch
+PARALLEL_BATCHES = 8
+MAX_RETRIES = 6
+BACKOFF = 0.5             # seconds, doubled per retry, plus jitter
+EMULATOR_PROJECT = "demo-ai-tutors"
+
+GRADE_LABELS = {"cbc": "Grade", "gcse": "Year"}
+
+# (collection, document ID, fields)
+Op = Tuple[str, str, Dict[str, Any]]
+
+
+def content_hash(fields: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+# =============================================================
+# Documents
+# =============================================================
+
+def unique_id(collection: str, base: str, seen_ids: Dict[Tuple[str, str], int]) -> str:
+    """base for its first occurrence, then base-2, base-3 ... in curriculum order."""
+    n = seen_ids[collection, base] = seen_ids.get((collection, base), 0) + 1
+    return base if n == 1 else f"{base}-{n}"
+
+
+def build_documents(system: str, entries: List[Dict[str, Any]],
+                    seen_ids: Dict[Tuple[str, str], int]) -> List[Op]:
+    """Strand and catalog documents for one system's full_data list."""
+    level_of, abbrev_of, _ = SYSTEMS[system]
+    ops: List[Op] = []
+    for entry in entries:
+        level = level_of(entry)
+        for subject in entry.get("subjects", []):
+            abbrev = abbrev_of(subject["name"])
+            catalog_strands, chapters = [], []
+            for strand in subject.get("strands", []):
+                doc_id = unique_id(STRANDS_COLLECTION, strand["id"], seen_ids)
+                key = "objectives" if "objectives" in strand and "subtopics" not in strand else "subtopics"
+                topics = strand.get(key) or []
+                ops.append((STRANDS_COLLECTION, doc_id, {
+                    "strandId": strand["id"],
+                    "system": system,
+                    "programme": entry["programme"],
+                    "level": level,
+                    "subject": subject["name"],
+                    "abbrev": abbrev,
+                    "name": strand["name"],
+                    "description": strand.get("description", ""),
+                    key: topics,
+                }))
+                catalog_strands.append({"id": strand["id"], "name": strand["name"],
+                                        "description": strand.get("description", "")})
+                chapters.append({
+                    "id": f"ch{len(chapters) + 1}",
+                    "order": len(chapters) + 1,
+                    "title": strand["name"],
+                    "subject": subject["name"],
+                    "strandId": strand["id"],
+                    "strandName": strand["name"],
+                    "topics": [t if isinstance(t, str) else json.dumps(t, ensure_ascii=False) for t in topics],
+                })
+            if not chapters:
+                continue
+            course_id = unique_id(CATALOG_COLLECTION, f"{system}-{level}-{abbrev}", seen_ids)
+            ops.append((CATALOG_COLLECTION, course_id, {
+                "name": f"{subject['name']} {GRADE_LABELS[system]} {level}",
+                "grade": str(level),
+                "subjects": [{"subject": subject["name"], "strands": catalog_strands}],
+                "description": subject.get("description", ""),
+                "courseType": system,
+                "programme": entry["programme"],
+                "chapters": chapters,
+                "totalChapters": len(chapters),
+                "isPublic": True,
+            }))
+    return ops
+
+
+# =============================================================
+# Loading
+# =============================================================
+
+def make_client(emulator: Optional[str] = None) -> firestore.Client:
+    from google.cloud import firestore
+
+    if emulator:
+        os.environ["FIRESTORE_EMULATOR_HOST"] = emulator
+    project = os.environ.get("FIREBASE_PROJECT_ID")
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        return firestore.Client(project=project or EMULATOR_PROJECT)
+    if project and os.environ.get("FIREBASE_CLIENT_EMAIL") and os.environ.get("FIREBASE_PRIVATE_KEY"):
+        from google.oauth2 import service_account
+        credentials = service_account.Credentials.from_service_account_info({
+            "type": "service_account",
+            "project_id": project,
+            "client_email": os.environ["FIREBASE_CLIENT_EMAIL"],
+            "private_key": os.environ["FIREBASE_PRIVATE_KEY"].replace("\\n", "\n"),
+            "token_uri": "https://oauth2.googleapis.com/token",
+        })
+        return firestore.Client(project=project, credentials=credentials)
+    return firestore.Client(project=project)
+
+
+def existing_hashes(client: firestore.Client, collection: str) -> Dict[str, str]:
+    """Document ID → stored contentHash ('' if missing) for a whole collection."""
+    return {doc.id: (doc.to_dict() or {}).get("contentHash", "")
+            for doc in client.collection(collection).select(["contentHash"]).stream()}
+
+
+def retryable() -> Tuple[type, ...]:
+    """Errors worth retrying a batch for: contention, quota and transient server errors."""
+    from google.api_core import exceptions as gexc
+
+    return (gexc.Aborted, gexc.DeadlineExceeded, gexc.ServiceUnavailable,
+            gexc.ResourceExhausted, gexc.InternalServerError)
+
+
+def commit_batch(client: firestore.Client, ops: List[Tuple[Op, bool]]) -> int:
+    """Commits one batch, retrying contention errors. Returns the retry count."""
+    from google.cloud import firestore
+
+    for attempt in range(MAX_RETRIES + 1):
+        batch = client.batch()
+        for (collection, doc_id, fields), is_new in ops:
+            data = dict(fields, updatedAt=firestore.SERVER_TIMESTAMP)
+            if is_new:
+                data["createdAt"] = firestore.SERVER_TIMESTAMP
+                if collection == CATALOG_COLLECTION:
+                    data["enrollmentCount"] = 0
+            batch.set(client.collection(collection).document(doc_id), data, merge=True)
+        try:
+            batch.commit()
+            return attempt
+        except retryable() as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = BACKOFF * (2 ** attempt) * (1 + random.random())
+            print(f"⚠️  Batch of {len(ops)} hit {type(e).__name__}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+    return MAX_RETRIES
+
+
+def load(client: firestore.Client, ops: List[Op], batch_size: int = BATCH_SIZE,
+         parallel: int = PARALLEL_BATCHES, force: bool = False) -> Dict[str, Any]:
+    """Upserts every changed document. Returns the throughput report."""
+    start = time.time()
+    collections = sorted({op[0] for op in ops})
+    current = {c: existing_hashes(client, c) for c in collections}
+    read_seconds = time.time() - start
+
+    pending: List[Tuple[Op, bool]] = []
+    per_collection = {c: {"documents": 0, "written": 0, "unchanged": 0, "created": 0} for c in collections}
+    for collection, doc_id, fields in ops:
+        digest = content_hash(fields)
+        counts = per_collection[collection]
+        counts["documents"] += 1
+        stored = current.get(collection, {}).get(doc_id)
+        if stored == digest and not force:
+            counts["unchanged"] += 1
+            continue
+        is_new = stored is None
+        counts["written"] += 1
+        counts["created"] += is_new
+        pending.append(((collection, doc_id, dict(fields, contentHash=digest)), is_new))
+
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    stats: Dict[str, Any] = {"retries": 0, "failed_batches": 0, "failed_documents": 0}
+    write_start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+        futures = {pool.submit(commit_batch, client, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                stats["retries"] += future.result()
+            except Exception as e:
+                stats["failed_batches"] += 1
+                stats["failed_documents"] += len(futures[future])
+                print(f"❌ Batch of {len(futures[future])} failed: {e}")
+    write_seconds = time.time() - write_start
+    written = len(pending) - stats["failed_documents"]
+
+    return {
+        "collections": per_collection,
+        "documents": len(ops),
+        "written": written,
+        "unchanged": len(ops) - len(pending),
+        "batches": len(batches),
+        "batch_size": batch_size,
+        "parallel": parallel,
+        **stats,
+        "read_seconds": round(read_seconds, 2),
+        "write_seconds": round(write_seconds, 2),
+        "total_seconds": round(time.time() - start, 2),
+        "docs_per_second": round(written / write_seconds, 1) if write_seconds > 0 and written else 0.0,
+    }
+
+
+def log_report(report: Dict[str, Any]):
+    print("\n" + "=" * 60)
+    print("FIRESTORE LOAD")
+    print("=" * 60)
+    for collection, counts in report["collections"].items():
+        print(f"  {collection}: {counts['documents']} docs, {counts['written']} written "
+              f"({counts['created']} new), {counts['unchanged']} unchanged")
+    print(f"  Batches: {report['batches']} × ≤{report['batch_size']}, {report['parallel']} in parallel, "
+          f"{report['retries']} retries, {report['failed_batches']} failed")
+    print(f"  Time: {report['read_seconds']}s reading hashes, {report['write_seconds']}s writing "
+          f"({report['docs_per_second']} docs/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load processed curricula into Firestore.")
+    parser.add_argument("--cbc", default=SOURCES["cbc"], help="CBC curriculum with IDs ('' to skip)")
+    parser.add_argument("--gcse", default=SOURCES["gcse"], help="GCSE curriculum with IDs ('' to skip)")
+    parser.add_argument("--only", choices=["strands", "catalog"], help="Load one collection only")
+    parser.add_argument("--emulator", metavar="HOST:PORT", help="Use the Firestore emulator")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--parallel", type=int, default=PARALLEL_BATCHES, help="Batches committed at once")
+    parser.add_argument("--force", action="store_true", help="Rewrite documents even if unchanged")
+    parser.add_argument("--dry-run", action="store_true", help="Build the documents without writing")
+    parser.add_argument("--report", metavar="FILE", help="Write the throughput report as JSON")
+    args = parser.parse_args()
+
+    if not 1 <= args.batch_size <= BATCH_SIZE:
+        parser.error(f"--batch-size must be between 1 and {BATCH_SIZE}")
+
+    ops: List[Op] = []
+    seen_ids: Dict[Tuple[str, str], int] = {}
+    for system, path in (("cbc", args.cbc), ("gcse", args.gcse)):
+        if not path:
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            ops.extend(build_documents(system, json.load(f), seen_ids))
+    if args.only:
+        wanted = STRANDS_COLLECTION if args.only == "strands" else CATALOG_COLLECTION
+        ops = [op for op in ops if op[0] == wanted]
+    print(f"📦 {len(ops)} documents built "
+          f"({sum(1 for op in ops if op[0] == STRANDS_COLLECTION)} strands, "
+          f"{sum(1 for op in ops if op[0] == CATALOG_COLLECTION)} catalog courses)")
+    if args.dry_run:
+        return
+
+    report = load(make_client(args.emulator), ops, args.batch_size, args.parallel, args.force)
+    log_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if report["failed_batches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
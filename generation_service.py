@@ -0,0 +1,402 @@
+"""
+Generation Service
+==================
+Long-running local HTTP/JSON service around content_generator. It keeps
+python-docx, requests, content.json and the styled DOCX template warm in one
+process, so the Next.js API routes can submit work without starting a new
+CLI run for every lesson.
+
+Endpoints:
+    POST /jobs                  submit {"kind": "lesson"|"strand", "grade", "subject",
+                                "strand", "substrand" (lesson only), "priority" (optional)}
+    GET  /jobs/<id>             job status
+    POST /jobs/<id>/cancel      cancel a queued or running job
+    GET  /jobs/<id>/artifact    download (?doc_type=Student|Teacher,
+                                &format=docx|lesson|ndjson for the DOCX, the
+                                lesson JSON index or its section lines)
+    GET  /metrics               queue depth, job counts, latencies and endpoint health
+
+Jobs are split into (sub-strand, doc_type) units on one priority queue.
+Interactive lesson jobs are queued ahead of strand batches. Workers pick
+units one at a time, so a lesson submitted in the middle of a long batch
+waits for at most one in-flight unit per worker. Cancelling a job stops its
+in-flight API calls as well as its queued units.
+
+Documents are written by content_generator.render_strand (DOCX, lesson JSON
+and, with --images, pictures). Finished jobs and their files are kept for
+JOB_TTL_SECONDS, and at most MAX_FINISHED_JOBS of them.
+
+Usage:
+    python generation_service.py --port 8765 --workers 4
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import content_generator as cg
+from image_pipeline import ImageManifest
+from lesson_json import lesson_json_paths
+
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+JOB_DIR = os.path.join(cg.OUTPUT_DIR, "jobs")
+
+# Lower runs first. Batch work only proceeds when no lesson is waiting.
+PRIORITY = {"lesson": 0, "strand": 10}
+
+TERMINAL = {"done", "failed", "cancelled"}
+
+JOB_TTL_SECONDS = 3600
+MAX_FINISHED_JOBS = 500
+
+# Job fields kept out of the status response
+PRIVATE = ("texts", "cancel")
+
+ARTIFACT_TYPES = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "lesson": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class JobService:
+    """Job registry, priority unit queue and worker threads."""
+
+    def __init__(self, curriculum: Dict[str, Any], workers: int = DEFAULT_WORKERS,
+                 images: Optional[ImageManifest] = None):
+        self.curriculum = curriculum
+        self.images = images
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.units: "queue.PriorityQueue" = queue.PriorityQueue()
+        self.seq = itertools.count()
+        self.units_generated = 0
+        self.workers = [
+            threading.Thread(target=self._work, name=f"gen-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        os.makedirs(JOB_DIR, exist_ok=True)
+        cg.new_styled_document()  # warm the style template
+
+    def start(self):
+        for t in self.workers:
+            t.start()
+
+    # ---------------------------------------------------------
+    # Jobs
+    # ---------------------------------------------------------
+
+    def submit(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        if not isinstance(spec, dict):
+            raise ValueError("Job spec must be a JSON object")
+        kind = spec.get("kind", "lesson")
+        if kind not in PRIORITY:
+            raise ValueError(f"Unknown job kind: {kind}")
+        grade, subject, strand = str(spec.get("grade", "")), spec.get("subject", ""), spec.get("strand", "")
+        try:
+            details = self.curriculum[grade][subject][strand]
+        except KeyError:
+            raise ValueError(f"Unknown strand: Grade {grade} {subject} / {strand}")
+
+        if kind == "lesson":
+            sub = spec.get("substrand", "")
+            if sub not in details:
+                raise ValueError(f"Unknown sub-strand: {sub}")
+            subs = [sub]
+        else:
+            subs = list(details.keys())
+        doc_types = [spec["doc_type"]] if spec.get("doc_type") in cg.DOC_TYPES else list(cg.DOC_TYPES)
+        try:
+            priority = int(spec.get("priority", PRIORITY[kind]))
+        except (TypeError, ValueError):
+            raise ValueError("priority must be an integer")
+
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "kind": kind,
+            "priority": priority,
+            "grade": grade,
+            "subject": subject,
+            "strand": strand,
+            "substrands": subs,
+            "doc_types": doc_types,
+            "status": "queued",
+            "units_total": len(subs) * len(doc_types),
+            "units_done": 0,
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "artifacts": {},
+            "error": None,
+            "texts": {d: {} for d in doc_types},
+            "cancel": threading.Event(),
+        }
+        with self.lock:
+            self._evict()
+            self.jobs[job["id"]] = job
+        for sub in subs:
+            for doc_type in doc_types:
+                self.units.put((job["priority"], next(self.seq), job["id"], sub, doc_type))
+        return self.status(job["id"])
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return {k: v for k, v in job.items() if k not in PRIVATE}
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] not in TERMINAL:
+                job["status"] = "cancelled"
+                job["finished"] = time.time()
+                job["texts"] = {}
+                job["cancel"].set()
+        return self.status(job_id)
+
+    def artifact(self, job_id: str, doc_type: str, fmt: str = "docx") -> Optional[str]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return (job["artifacts"].get(doc_type) or {}).get(fmt) if job else None
+
+    def _evict(self):
+        """Drops finished jobs past JOB_TTL_SECONDS or beyond MAX_FINISHED_JOBS, with their files. Lock held."""
+        finished = sorted((j for j in self.jobs.values() if j["status"] in TERMINAL), key=lambda j: j["finished"])
+        cutoff = time.time() - JOB_TTL_SECONDS
+        excess = len(finished) - MAX_FINISHED_JOBS
+        for n, job in enumerate(finished):
+            if n >= excess and job["finished"] >= cutoff:
+                break
+            del self.jobs[job["id"]]
+            for paths in job["artifacts"].values():
+                for path in paths.values():
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    # ---------------------------------------------------------
+    # Workers
+    # ---------------------------------------------------------
+
+    def _work(self):
+        while True:
+            _, _, job_id, sub, doc_type = self.units.get()
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None or job["status"] in TERMINAL:
+                    continue
+                if job["status"] == "queued":
+                    job["status"] = "running"
+                    job["started"] = time.time()
+            try:
+                details = self.curriculum[job["grade"]][job["subject"]][job["strand"]]
+                ctx = cg.build_prompt_context(job["strand"], sub, details)
+                text = cg.generate_substrand(doc_type, job["grade"], job["subject"], job["strand"], sub, ctx,
+                                             cancel=job["cancel"])
+                if not text:
+                    self._finish(job_id, "failed", error="empty completion")
+                    continue
+                text = cg.with_assessment_slots(sub, text, doc_type)
+            except Exception as e:
+                self._finish(job_id, "failed", error=str(e))
+                continue
+
+            with self.lock:
+                if job["status"] in TERMINAL:
+                    continue
+                job["texts"][doc_type][sub] = text
+                job["units_done"] += 1
+                self.units_generated += 1
+                ready = job["units_done"] == job["units_total"]
+            if ready:
+                self._render(job)
+
+    def _render(self, job: Dict[str, Any]):
+        try:
+            artifacts = {}
+            for doc_type in job["doc_types"]:
+                content_map = {sub: job["texts"][doc_type][sub] for sub in job["substrands"]}
+                if job["kind"] == "strand":
+                    title, placeholder = cg.strand_assessment(job["strand"], doc_type)
+                    content_map[title] = placeholder
+                path = os.path.join(JOB_DIR, f"{job['id']}_{doc_type}.docx")
+                cg.render_strand(job["grade"], job["subject"], job["strand"],
+                                 cg.parse_content_map(content_map, doc_type), doc_type, path, self.images)
+                artifacts[doc_type] = {"docx": path}
+                if cg.LESSON_JSON:
+                    json_paths = lesson_json_paths(path)
+                    artifacts[doc_type].update(lesson=json_paths["index"], ndjson=json_paths["data"])
+            self._finish(job["id"], "done", artifacts=artifacts)
+        except Exception as e:
+            self._finish(job["id"], "failed", error=str(e))
+
+    def _finish(self, job_id: str, status: str, artifacts: Optional[Dict[str, str]] = None,
+                error: Optional[str] = None):
+        with self.lock:
+            job = self.jobs[job_id]
+            if job["status"] in TERMINAL:
+                return
+            job["status"] = status
+            job["finished"] = time.time()
+            job["artifacts"] = artifacts or {}
+            job["error"] = error
+            job["texts"] = {}
+            job["cancel"].set()   # a failed unit stops the job's other requests
+        cg.log(f"Job {job_id} ({job['kind']}) {status}")
+
+    # ---------------------------------------------------------
+    # Metrics
+    # ---------------------------------------------------------
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            jobs = list(self.jobs.values())
+            units_generated = self.units_generated
+        by_status: Dict[str, int] = {}
+        for job in jobs:
+            by_status[job["status"]] = by_status.get(job["status"], 0) + 1
+
+        latency: Dict[str, Dict[str, float]] = {}
+        for kind in PRIORITY:
+            waits = sorted(j["started"] - j["submitted"] for j in jobs
+                           if j["kind"] == kind and j["started"])
+            totals = sorted(j["finished"] - j["submitted"] for j in jobs
+                            if j["kind"] == kind and j["status"] == "done")
+            latency[kind] = {
+                "completed": len(totals),
+                "queue_wait_p50": percentile(waits, 50),
+                "total_p50": percentile(totals, 50),
+                "total_p95": percentile(totals, 95),
+            }
+        return {
+            "queue_depth": self.units.qsize(),
+            "jobs": by_status,
+            "units_generated": units_generated,
+            "latency_seconds": latency,
+            "hedging": dict(cg.HEDGE_STATS),
+            "providers": cg.provider_pool().health(),
+        }
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return round(values[idx], 3)
+
+
+# =============================================================
+# HTTP layer
+# =============================================================
+
+JOB_PATH = re.compile(r"^/jobs/([0-9a-f]+)(/cancel|/artifact)?$")
+
+
+def make_handler(service: JobService):
+    class Handler(BaseHTTPRequestHandler):
+        def _json(self, code: int, body: Any):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/metrics":
+                return self._json(200, service.metrics())
+            m = JOB_PATH.match(url.path)
+            if not m or m.group(2) == "/cancel":
+                return self._json(404, {"error": "not found"})
+            if m.group(2) == "/artifact":
+                query = parse_qs(url.query)
+                doc_type = query.get("doc_type", ["Student"])[0]
+                fmt = query.get("format", ["docx"])[0]
+                if fmt not in ARTIFACT_TYPES:
+                    return self._json(400, {"error": f"unknown format: {fmt}"})
+                path = service.artifact(m.group(1), doc_type, fmt)
+                if not path or not os.path.exists(path):
+                    return self._json(404, {"error": "artifact not ready"})
+                with open(path, "rb") as f:
+                    data = f.read()
+                self.send_response(200)
+                self.send_header("Content-Type", ARTIFACT_TYPES[fmt])
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            status = service.status(m.group(1))
+            return self._json(200, status) if status else self._json(404, {"error": "unknown job"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path == "/jobs":
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    spec = json.loads(self.rfile.read(length) or b"{}")
+                    return self._json(202, service.submit(spec))
+                except (ValueError, json.JSONDecodeError) as e:
+                    return self._json(400, {"error": str(e)})
+            m = JOB_PATH.match(url.path)
+            if m and m.group(2) == "/cancel":
+                status = service.cancel(m.group(1))
+                return self._json(200, status) if status else self._json(404, {"error": "unknown job"})
+            return self._json(404, {"error": "not found"})
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local job service for content generation.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--content", default="content.json")
+    parser.add_argument("--providers", metavar="FILE", help="JSON list of endpoints to balance across")
+    parser.add_argument("--images", metavar="BACKEND",
+                        help="render [IMAGE DESCRIPTION] blocks to pictures with this backend (e.g. stub)")
+    args = parser.parse_args()
+    if args.providers:
+        cg.PROVIDERS_PATH = args.providers
+
+    if not cg.have_api_key():
+        cg.log("Missing API KEY")
+        raise SystemExit(1)
+
+    with open(args.content, "r", encoding="utf-8") as f:
+        curriculum = json.load(f)
+
+    images = ImageManifest(cg.IMAGE_DIR, args.images) if args.images else None
+    service = JobService(curriculum, args.workers, images)
+    service.start()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    cg.log(f"Generation service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
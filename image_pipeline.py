@@ -0,0 +1,216 @@
+"""
+Image Pipeline
+==============
+Turns [IMAGE DESCRIPTION] blocks from parse_blocks into pictures.
+
+Every description seen in a run is registered in a persistent manifest.
+Near-identical descriptions (same wording give or take case, punctuation
+and a few words) across sub-strands and books share one entry, so each
+unique picture is generated and stored once. Missing pictures are sent in
+batches to a pluggable backend. The DOCX renderer then embeds the file for
+a description's canonical hash. python-docx stores identical image bytes
+once per package, and book assembly does the same across strands.
+
+Backends are callables taking a list of (hash, description) pairs and
+returning {hash: PNG bytes}. "stub" draws a flat placeholder locally and is
+meant for tests and layout checks. Add real backends with register_backend().
+"""
+
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+IMAGE_TAG = re.compile(r"\[IMAGE DESCRIPTION\]\s*:?\s*", re.IGNORECASE)
+NEAR_DUP_THRESHOLD = 0.85
+BATCH_SIZE = 16
+
+Backend = Callable[[List[Tuple[str, str]]], Dict[str, bytes]]
+
+
+def description_text(raw: str) -> str:
+    """The description without its [IMAGE DESCRIPTION] tag."""
+    return IMAGE_TAG.sub("", raw).strip()
+
+
+def normalize_description(raw: str) -> str:
+    text = description_text(raw).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def description_hash(raw: str) -> str:
+    return hashlib.sha1(normalize_description(raw).encode("utf-8")).hexdigest()[:16]
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# =============================================================
+# Backends
+# =============================================================
+
+def png_bytes(width: int, height: int, rgb: Tuple[int, int, int]) -> bytes:
+    """Minimal solid-colour PNG."""
+    row = b"\x00" + bytes(rgb) * width
+    raw = row * height
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 9))
+            + chunk(b"IEND", b""))
+
+
+def stub_backend(batch: List[Tuple[str, str]]) -> Dict[str, bytes]:
+    """Placeholder renderer: a pale tile whose colour is derived from the hash."""
+    out = {}
+    for key, _ in batch:
+        digest = bytes.fromhex(key[:6].ljust(6, "0"))
+        rgb = tuple(160 + b % 96 for b in digest)
+        out[key] = png_bytes(320, 180, rgb)
+    return out
+
+
+BACKENDS: Dict[str, Backend] = {"stub": stub_backend}
+
+
+def register_backend(name: str, backend: Backend):
+    BACKENDS[name] = backend
+
+
+def get_backend(name: str) -> Backend:
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown image backend: {name} (have: {', '.join(sorted(BACKENDS))})")
+
+
+# =============================================================
+# Manifest
+# =============================================================
+
+class ImageManifest:
+    """
+    Persistent registry of descriptions → canonical image entries.
+    Layout under `root`: manifest.json plus one <hash>.png per entry.
+    """
+
+    def __init__(self, root: str, backend: str = "stub", batch_size: int = BATCH_SIZE,
+                 threshold: float = NEAR_DUP_THRESHOLD):
+        self.root = root
+        self.backend_name = backend
+        self.backend = get_backend(backend)
+        self.batch_size = batch_size
+        self.threshold = threshold
+        self.path = os.path.join(root, "manifest.json")
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        self.aliases: Dict[str, str] = {}
+        self.index: Dict[str, set] = {}   # token → canonical hashes containing it
+        self.stats = {"registered": 0, "unique": 0, "near_duplicates": 0, "generated": 0, "batches": 0}
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.entries = data.get("entries", {})
+            self.aliases = data.get("aliases", {})
+            for key, entry in self.entries.items():
+                self._index(key, entry["normalized"])
+
+    def _index(self, key: str, normalized: str):
+        for token in set(normalized.split()):
+            self.index.setdefault(token, set()).add(key)
+
+    def _near_duplicate(self, normalized: str) -> Optional[str]:
+        tokens = set(normalized.split())
+        candidates: Dict[str, int] = {}
+        for token in tokens:
+            for key in self.index.get(token, ()):
+                candidates[key] = candidates.get(key, 0) + 1
+        # Only candidates sharing enough tokens can reach the threshold
+        need = self.threshold * len(tokens)
+        best, best_score = None, self.threshold
+        for key, shared in candidates.items():
+            if shared < need:
+                continue
+            score = jaccard(tokens, set(self.entries[key]["normalized"].split()))
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+    def register(self, raw: str, source: str = "") -> str:
+        """Records a description and returns the canonical hash of its image."""
+        key = description_hash(raw)
+        with self.lock:
+            self.stats["registered"] += 1
+            canonical = self.aliases.get(key)
+            if canonical is None and key in self.entries:
+                canonical = key
+            if canonical is None:
+                normalized = normalize_description(raw)
+                canonical = self._near_duplicate(normalized)
+                if canonical is None:
+                    canonical = key
+                    self.entries[key] = {"description": description_text(raw), "normalized": normalized,
+                                         "file": None, "sources": []}
+                    self._index(key, normalized)
+                    self.stats["unique"] += 1
+                else:
+                    self.stats["near_duplicates"] += 1
+                self.aliases[key] = canonical
+            sources = self.entries[canonical]["sources"]
+            if source and source not in sources:
+                sources.append(source)
+        return canonical
+
+    def pending(self, keys: Optional[Iterable[str]] = None) -> List[str]:
+        keys = self.entries.keys() if keys is None else keys
+        return [k for k in dict.fromkeys(keys) if not self.file_for_key(k)]
+
+    def generate(self, keys: Optional[Iterable[str]] = None) -> int:
+        """Renders missing images for `keys` (default: all) in backend batches."""
+        todo = self.pending(keys)
+        for i in range(0, len(todo), self.batch_size):
+            batch = [(k, self.entries[k]["description"]) for k in todo[i:i + self.batch_size]]
+            images = self.backend(batch)
+            with self.lock:
+                self.stats["batches"] += 1
+                for key, data in images.items():
+                    name = f"{key}.png"
+                    with open(os.path.join(self.root, name), "wb") as f:
+                        f.write(data)
+                    self.entries[key]["file"] = name
+                    self.stats["generated"] += 1
+        if todo:
+            self.save()
+        return len(todo)
+
+    def file_for_key(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if not entry or not entry.get("file"):
+            return None
+        path = os.path.join(self.root, entry["file"])
+        return path if os.path.exists(path) else None
+
+    def file_for(self, raw: str) -> Optional[str]:
+        """Image file for a description registered earlier, if generated."""
+        canonical = self.aliases.get(description_hash(raw))
+        return self.file_for_key(canonical) if canonical else None
+
+    def save(self):
+        with self.lock:
+            data = {"backend": self.backend_name, "entries": self.entries, "aliases": self.aliases}
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp, self.path)
@@ -0,0 +1,182 @@
+"""
+Lesson JSON Renderer
+====================
+Serializes parse_blocks output to a compact, versioned lesson format that
+the web app can serve directly. It is written from the same parsed blocks
+as the DOCX, so content is never parsed twice.
+
+Two files per strand document:
+
+  <name>.lesson.ndjson   one JSON object per section, one per line
+  <name>.lesson.json     index: metadata, sub-strands, and each section's
+                         byte offset and length in the .ndjson file
+
+A client loads the small index first. It can then fetch any section with
+an HTTP Range request (bytes=offset-(offset+length-1)) and paginate
+without downloading the whole strand.
+
+Section line:
+  {"id": "s4", "substrand": 1, "title": "Key Ideas and Relationships",
+   "kind": "regular", "blocks": [...]}
+
+Blocks are short arrays:
+  ["p", text]          paragraph
+  ["ul", [items]]      bullet list
+  ["ol", [items]]      numbered list
+  ["img", text, src]   image description; src is an image file name or null
+  ["ph", text]         placeholder
+  ["note", text]       teacher note
+  ["items", [item]]    generated quiz/assessment items (assessment_bank);
+                       answers and explanations only in Teacher documents
+
+Quiz, assessment and exercise sections carry only their placeholder, the
+same as the DOCX renderer, unless generated items are passed in.
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from assessment_bank import placeholder_kind
+
+FORMAT = "ai-tutors-lesson"
+VERSION = 1
+
+SUPPRESSED_KINDS = {"quiz", "assessment", "exercise"}
+
+
+def lesson_json_paths(docx_path: str) -> Dict[str, str]:
+    base = os.path.splitext(docx_path)[0]
+    return {"index": base + ".lesson.json", "data": base + ".lesson.ndjson"}
+
+
+def placeholder_for(kind: str, substrand: str) -> str:
+    if kind == "exercise":
+        return "Placeholder: Practice questions are intentionally omitted (use Quiz/Assessment)."
+    if kind == "quiz":
+        return f"Placeholder: Quiz for sub-strand '{substrand}'."
+    return f"Placeholder: Assessment for sub-strand '{substrand}'."
+
+
+def compact_block(blk: Dict[str, Any], image_src: Optional[Callable[[str], Optional[str]]]) -> Optional[list]:
+    t = blk["type"]
+    if t == "paragraph":
+        return ["p", blk["text"]]
+    if t == "bullet_list":
+        return ["ul", [item["text"] for item in blk["items"]]]
+    if t == "numbered_list":
+        return ["ol", [item["text"] for item in blk["items"]]]
+    if t == "image_description":
+        src = image_src(blk["text"]) if image_src else None
+        return ["img", blk["text"], os.path.basename(src) if src else None]
+    if t == "placeholder":
+        return ["ph", blk["text"]]
+    if t == "teacher_note":
+        return ["note", blk["text"]]
+    if blk.get("text"):
+        return ["p", blk["text"]]
+    return None
+
+
+def compact_items(items: List[Dict[str, Any]], answers: bool) -> list:
+    if answers:
+        return items
+    return [{k: v for k, v in item.items() if k not in ("answer", "explanation")} for item in items]
+
+
+def sections_from_blocks(blocks_map: Dict[str, List[Dict[str, Any]]],
+                         image_src: Optional[Callable[[str], Optional[str]]] = None,
+                         assessments: Optional[Dict[str, Dict[str, list]]] = None,
+                         answers: bool = False) -> List[Dict[str, Any]]:
+    """
+    Splits each sub-strand's blocks at section headings, keeping sub-strand
+    order. Generated items take the place of the first quiz/assessment
+    placeholder of their kind, as in render_blocks.
+    """
+    sections: List[Dict[str, Any]] = []
+    for sub_idx, (sub, blocks) in enumerate(blocks_map.items()):
+        pending = dict((assessments or {}).get(sub) or {})
+        current = {"substrand": sub_idx, "title": "", "kind": "regular", "blocks": []}
+        for blk in blocks:
+            if blk["type"] == "section_heading":
+                if current["blocks"] or current["title"]:
+                    sections.append(current)
+                kind = blk.get("kind", "regular")
+                title = "Assessment" if kind == "assessment" else blk.get("text", "")
+                current = {"substrand": sub_idx, "title": title, "kind": kind, "blocks": []}
+                if kind in SUPPRESSED_KINDS:
+                    items = pending.pop(kind, None)
+                    current["blocks"].append(["items", compact_items(items, answers)] if items
+                                             else ["ph", placeholder_for(kind, sub)])
+                continue
+            if current["kind"] in SUPPRESSED_KINDS:
+                continue
+            kind = placeholder_kind(blk["text"]) if blk["type"] == "placeholder" else None
+            if kind and pending.get(kind):
+                if current["blocks"] or current["title"]:
+                    sections.append(current)
+                sections.append({"substrand": sub_idx, "title": kind.title(), "kind": kind,
+                                 "blocks": [["items", compact_items(pending.pop(kind), answers)]]})
+                current = {"substrand": sub_idx, "title": "", "kind": "regular", "blocks": []}
+                continue
+            compact = compact_block(blk, image_src)
+            if compact:
+                current["blocks"].append(compact)
+        if current["blocks"] or current["title"]:
+            sections.append(current)
+    for i, section in enumerate(sections, start=1):
+        section["id"] = f"s{i}"
+    return sections
+
+
+def write_lesson_json(docx_path: str, grade: str, subject: str, strand_name: str, doc_type: str,
+                      blocks_map: Dict[str, List[Dict[str, Any]]],
+                      image_src: Optional[Callable[[str], Optional[str]]] = None,
+                      assessments: Optional[Dict[str, Dict[str, list]]] = None) -> Dict[str, str]:
+    """Writes the .ndjson sections and the .json index next to the DOCX. Returns both paths."""
+    paths = lesson_json_paths(docx_path)
+    sections = sections_from_blocks(blocks_map, image_src, assessments, answers=doc_type == "Teacher")
+    subs = list(blocks_map.keys())
+
+    index_sections = []
+    offset = 0
+    with open(paths["data"], "wb") as f:
+        for section in sections:
+            line = json.dumps(
+                {"id": section["id"], "substrand": section["substrand"], "title": section["title"],
+                 "kind": section["kind"], "blocks": section["blocks"]},
+                ensure_ascii=False, separators=(",", ":"),
+            ).encode("utf-8") + b"\n"
+            f.write(line)
+            index_sections.append({
+                "id": section["id"],
+                "substrand": section["substrand"],
+                "title": section["title"],
+                "kind": section["kind"],
+                "offset": offset,
+                "length": len(line),
+            })
+            offset += len(line)
+
+    index = {
+        "format": FORMAT,
+        "version": VERSION,
+        "grade": grade,
+        "subject": subject,
+        "strand": strand_name,
+        "docType": doc_type,
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "data": os.path.basename(paths["data"]),
+        "bytes": offset,
+        "substrands": [
+            {"title": sub, "sections": [s["id"] for s in index_sections if s["substrand"] == i]}
+            for i, sub in enumerate(subs)
+        ],
+        "sections": index_sections,
+    }
+    tmp = paths["index"] + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, paths["index"])
+    return paths
@@ -0,0 +1,223 @@
+"""
+Memory Profiling
+================
+Opt-in memory instrumentation for long generation runs (--memory-profile
+in content_generator.py), for choosing worker counts and open strands per
+host from measurements rather than guesses.
+
+Batch runs hold every completion of a strand until it is rendered, and a
+python-docx tree per document while it is built, so peak memory grows with
+PIPELINE_OPEN_STRANDS, PIPELINE_WORKERS and section parallelism.
+MemoryProfiler records:
+
+  checkpoints  at each stage boundary (generate, parse, render): resident
+               set size, the process RSS high-water mark, and the peak
+               traced Python allocation since the previous checkpoint
+  snapshots    after each strand (or queue unit), a tracemalloc snapshot
+               compared with the previous one; the source lines that grew
+               most are kept, and the slope of traced memory across
+               snapshots shows whether anything is retained between strands
+  alarm        a warning when RSS passes the threshold, repeated each time
+               it grows another ALARM_REPEAT beyond the last warning
+
+Pipeline stages run concurrently, so a stage's figures describe the
+interval that ended at its boundary, not memory owned by that stage alone.
+tracemalloc slows allocation-heavy code noticeably; leave it off for
+production runs.
+
+RSS comes from /proc on Linux, GetProcessMemoryInfo on Windows, and
+getrusage elsewhere (high-water mark only).
+"""
+
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+TOP = 10
+FRAMES = 1
+ALARM_REPEAT = 0.10
+MB = 1024 * 1024
+
+# Allocations made by the profiler itself and by the import system
+IGNORE = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _windows_rss() -> Tuple[Optional[int], Optional[int]]:
+    import ctypes
+    from ctypes import wintypes
+
+    class Counters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = Counters()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.windll.kernel32
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    if not kernel32.K32GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None, None
+    return counters.WorkingSetSize, counters.PeakWorkingSetSize
+
+
+def rss_bytes() -> Tuple[Optional[int], Optional[int]]:
+    """(current, high-water) resident set size in bytes; None where the platform does not report it."""
+    try:
+        with open("/proc/self/status", "r", encoding="ascii", errors="replace") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        kb = lambda name: int(fields[name].split()[0]) * 1024 if name in fields else None
+        return kb("VmRSS"), kb("VmHWM")
+    except (OSError, ValueError):
+        pass
+    if sys.platform == "win32":
+        try:
+            return _windows_rss()
+        except (OSError, AttributeError):
+            return None, None
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux and the BSDs
+    return None, peak if sys.platform == "darwin" else peak * 1024
+
+
+def to_mb(n: Optional[int]) -> Optional[float]:
+    return None if n is None else round(n / MB, 1)
+
+
+def slope(values: List[float]) -> float:
+    """Least-squares change per step of a series (0 for fewer than two points)."""
+    n = len(values)
+    if n < 2:
+        return 0.0
+    mean_x, mean_y = (n - 1) / 2, sum(values) / n
+    num = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+    den = sum((x - mean_x) ** 2 for x in range(n))
+    return num / den
+
+
+def top_growth(new: tracemalloc.Snapshot, old: tracemalloc.Snapshot, limit: int) -> List[Dict[str, Any]]:
+    """The `limit` source lines whose allocations grew most from old to new."""
+    grown = [d for d in new.compare_to(old, "lineno") if d.size_diff > 0][:limit]
+    return [{"where": f"{d.traceback[0].filename}:{d.traceback[0].lineno}",
+             "size_kb": round(d.size_diff / 1024, 1), "count": d.count_diff} for d in grown]
+
+
+class MemoryProfiler:
+    """
+    Collects checkpoints and snapshots for one run. Thread-safe: pipeline
+    stages call checkpoint() from their own threads.
+    """
+
+    def __init__(self, top: int = TOP, alarm_mb: float = 0, log: Callable[[str], None] = print,
+                 frames: int = FRAMES):
+        self.top = top
+        self.alarm_mb = alarm_mb
+        self.log = log
+        self.frames = frames
+        self.lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.snapshots: List[Dict[str, Any]] = []
+        self.alarms: List[Dict[str, Any]] = []
+        self.traced_peak = 0
+        self.rss_peak = 0
+        self.next_alarm = alarm_mb * MB if alarm_mb else 0
+        self.started = 0.0
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.previous: Optional[tracemalloc.Snapshot] = None
+        self.owns_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.owns_tracing = True
+        self.started = time.monotonic()
+        self.baseline = self.previous = tracemalloc.take_snapshot().filter_traces(IGNORE)
+        self.checkpoint("start")
+
+    def _alarm(self, stage: str, rss: int):
+        """Called with the lock held."""
+        if not self.next_alarm or rss < self.next_alarm:
+            return
+        self.alarms.append({"stage": stage, "rss_mb": to_mb(rss),
+                            "seconds": round(time.monotonic() - self.started, 1)})
+        self.next_alarm = rss * (1 + ALARM_REPEAT)
+        self.log(f"⚠️ Memory alarm: RSS {to_mb(rss)} MB at {stage} (threshold {self.alarm_mb} MB)")
+
+    def checkpoint(self, stage: str):
+        """Records memory at the end of a stage step."""
+        rss, hwm = rss_bytes()
+        with self.lock:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            self.traced_peak = max(self.traced_peak, peak)
+            self.rss_peak = max(self.rss_peak, hwm or 0, rss or 0)
+            s = self.stages.setdefault(stage, {"checkpoints": 0, "rss_max": 0, "traced_max": 0, "traced_peak_max": 0})
+            s["checkpoints"] += 1
+            s["rss_max"] = max(s["rss_max"], rss or 0)
+            s["traced_max"] = max(s["traced_max"], current)
+            s["traced_peak_max"] = max(s["traced_peak_max"], peak)
+            if rss is not None:
+                self._alarm(stage, rss)
+            elif hwm is not None:
+                self._alarm(stage, hwm)
+
+    def snapshot(self, label: str):
+        """Diffs allocations against the previous snapshot and keeps the top growth."""
+        snap = tracemalloc.take_snapshot().filter_traces(IGNORE)
+        with self.lock:
+            previous, self.previous = self.previous, snap
+            traced = sum(stat.size for stat in snap.statistics("filename"))
+            self.snapshots.append({
+                "label": label,
+                "traced_mb": to_mb(traced),
+                "rss_mb": to_mb(rss_bytes()[0]),
+                "top": top_growth(snap, previous, self.top) if previous is not None else [],
+            })
+
+    def summary(self) -> Dict[str, Any]:
+        """The run report's "memory" section."""
+        rss, hwm = rss_bytes()
+        with self.lock:
+            _, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+            traced_peak = max(self.traced_peak, peak)
+            rss_peak = max(self.rss_peak, hwm or 0, rss or 0)
+            since_start = []
+            if self.baseline is not None and tracemalloc.is_tracing():
+                since_start = top_growth(tracemalloc.take_snapshot().filter_traces(IGNORE), self.baseline, self.top)
+            series = [s["traced_mb"] for s in self.snapshots]
+            return {
+                "rss_mb": to_mb(rss),
+                "rss_peak_mb": to_mb(rss_peak or None),
+                "traced_peak_mb": to_mb(traced_peak),
+                "alarm_mb": self.alarm_mb or None,
+                "alarms": list(self.alarms),
+                "stages": {name: {"checkpoints": s["checkpoints"], "rss_max_mb": to_mb(s["rss_max"] or None),
+                                  "traced_max_mb": to_mb(s["traced_max"]),
+                                  "traced_peak_max_mb": to_mb(s["traced_peak_max"])}
+                           for name, s in self.stages.items()},
+                "growth_per_snapshot_kb": round(slope(series) * 1024, 1),
+                "snapshots": list(self.snapshots),
+                "top_since_start": since_start,
+            }
+
+    def stop(self) -> Dict[str, Any]:
+        """Summarises the run and stops tracing if this profiler started it."""
+        summary = self.summary()
+        self.baseline = self.previous = None
+        if self.owns_tracing:
+            tracemalloc.stop()
+            self.owns_tracing = False
+        return summary
@@ -0,0 +1,360 @@
+"""
+Near-Duplicate Sections
+=======================
+Finds generated sections that say nearly the same thing across a whole
+corpus without comparing every pair. A typical example is the "Common
+Misconceptions" or "Materials and Resources" sections of neighbouring
+grades.
+
+  1. sections   completions are cleaned and split with parse_blocks (from a
+                work queue database), or read back from the lesson JSON
+                written next to the DOCX files. Quiz, assessment and
+                exercise sections are only placeholders and are skipped.
+  2. shingles   each section's lower-cased words as overlapping runs of
+                SHINGLE_WORDS words, hashed to 32 bits
+  3. MinHash    NUM_PERM hashes (a·x + b) mod PRIME of every shingle, keeping
+                the minimum per section; computed for many sections at once
+                with NumPy
+  4. LSH        signatures are cut into bands, and sections that share a
+                band bucket become candidates, so the work grows with the
+                number of sections rather than the number of pairs
+  5. verify     candidates whose exact shingle Jaccard similarity reaches the
+                threshold are kept and grouped into clusters
+
+Only sections of the same doc_type are compared, and never two sections of
+the same sub-strand. The report lists each cluster and counts duplicates
+per section title. The regeneration list keeps the first member of each
+cluster (lowest grade, then curriculum order) and names every other
+member's unit, in the work queue's unit fields, with the section to rewrite.
+
+Usage:
+    python near_duplicates.py --queue runs.db --regenerate regenerate.json
+    python near_duplicates.py --lessons output_docs --threshold 0.6
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import re
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from content_generator import DOC_TYPES, OUTPUT_DIR, clean_model_output, parse_blocks
+from lesson_json import FORMAT, SUPPRESSED_KINDS, sections_from_blocks
+from work_queue import WorkQueue
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+THRESHOLD = 0.7
+MIN_WORDS = 25
+RECALL = 0.95
+SEED = 1
+REPORT_PATH = os.path.join(OUTPUT_DIR, "near_duplicates.json")
+
+PRIME = np.uint64(4294967311)        # smallest prime above 2**32, so a·x + b fits in uint64
+MASK32 = np.uint64(0xFFFFFFFF)
+SHINGLE_MIX = 0x9E3779B97F4A7C15
+CHUNK_SHINGLES = 1 << 16             # per NumPy batch: NUM_PERM × this × 8 bytes
+MAX_BUCKET = 100                     # larger LSH buckets are joined as a star, not every pair
+
+WORD = re.compile(r"\w+")
+TEXT_BLOCKS = ("p", "ul", "ol", "note")
+UNIT_FIELDS = ("grade", "subject", "strand", "substrand", "doc_type")
+
+Section = Dict[str, Any]
+
+
+# =============================================================
+# Sections
+# =============================================================
+
+def block_text(block: list) -> str:
+    if block[0] not in TEXT_BLOCKS:
+        return ""
+    return " ".join(block[1]) if isinstance(block[1], list) else block[1]
+
+
+def make_section(grade: str, subject: str, strand: str, substrand: str, doc_type: str,
+                 section: Dict[str, Any]) -> Optional[Section]:
+    """A comparable section from a lesson JSON section line, or None for placeholders."""
+    if section["kind"] in SUPPRESSED_KINDS:
+        return None
+    text = " ".join(filter(None, (block_text(b) for b in section["blocks"])))
+    if not text:
+        return None
+    return {"grade": grade, "subject": subject, "strand": strand, "substrand": substrand,
+            "doc_type": doc_type, "section": section["title"] or "(untitled)", "text": text}
+
+
+def queue_sections(path: str) -> Iterator[Section]:
+    """Sections of every finished unit in a work queue database, in curriculum order."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    wq = WorkQueue(path)
+    for strand in wq.strands():
+        grade, subject, strand_name = strand["grade"], strand["subject"], strand["strand"]
+        for doc_type in DOC_TYPES:
+            for sub, text in wq.results(grade, subject, strand_name, doc_type).items():
+                blocks = parse_blocks(clean_model_output(text or ""), doc_type)
+                for section in sections_from_blocks({sub: blocks}):
+                    found = make_section(grade, subject, strand_name, sub, doc_type, section)
+                    if found:
+                        yield found
+
+
+def lesson_sections(directory: str) -> Iterator[Section]:
+    """Sections of every lesson JSON file under `directory`."""
+    for index_path in sorted(glob.glob(os.path.join(directory, "**", "*.lesson.json"), recursive=True)):
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("format") != FORMAT:
+            continue
+        subs = [s["title"] for s in index["substrands"]]
+        with open(os.path.join(os.path.dirname(index_path), index["data"]), "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                section = json.loads(line)
+                found = make_section(index["grade"], index["subject"], index["strand"],
+                                     subs[section["substrand"]], index["docType"], section)
+                if found:
+                    yield found
+
+
+def grade_key(grade: str) -> Tuple[int, str]:
+    return (int(grade), "") if grade.isdigit() else (1 << 30, grade)
+
+
+def unit_label(section: Section) -> str:
+    return (f"Grade {section['grade']} {section['subject']} → {section['strand']} → "
+            f"{section['substrand']} ({section['doc_type']}) / {section['section']}")
+
+
+# =============================================================
+# Shingles and MinHash
+# =============================================================
+
+def shingle_hashes(text: str, k: int = SHINGLE_WORDS) -> np.ndarray:
+    """Sorted distinct 32-bit hashes of the k-word shingles of text (needs at least k words)."""
+    words = WORD.findall(text.lower())
+    ids = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    powers = np.array([pow(SHINGLE_MIX, j, 1 << 64) for j in range(k)], dtype=np.uint64)
+    mixed = np.lib.stride_tricks.sliding_window_view(ids, k) @ powers   # wraps mod 2**64
+    return np.unique((mixed >> np.uint64(32)) ^ (mixed & MASK32))
+
+
+def permutations(num_perm: int, seed: int = SEED) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+def minhash(shingles: List[np.ndarray], num_perm: int = NUM_PERM, seed: int = SEED) -> np.ndarray:
+    """
+    (sections, num_perm) signatures. Sections are hashed in batches of about
+    CHUNK_SHINGLES shingles; every array in `shingles` must be non-empty.
+    """
+    a, b = permutations(num_perm, seed)
+    sigs = np.empty((len(shingles), num_perm), dtype=np.uint64)
+    start = 0
+    while start < len(shingles):
+        end, total = start, 0
+        while end < len(shingles) and (end == start or total + len(shingles[end]) <= CHUNK_SHINGLES):
+            total += len(shingles[end])
+            end += 1
+        batch = shingles[start:end]
+        offsets = np.cumsum([0] + [len(s) for s in batch[:-1]])
+        hashed = (a * np.concatenate(batch)[None, :] + b) % PRIME
+        sigs[start:end] = np.minimum.reduceat(hashed, offsets, axis=1).T
+        start = end
+    return sigs
+
+
+# =============================================================
+# LSH banding
+# =============================================================
+
+def choose_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    (bands, rows) with bands × rows = num_perm: the most rows per band
+    (fewest false candidates) that still finds a pair at the threshold
+    with probability RECALL.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= RECALL:
+            best = (bands, rows)
+    return best
+
+
+def candidate_pairs(sigs: np.ndarray, groups: np.ndarray, bands: int, rows: int) -> Set[Tuple[int, int]]:
+    """Index pairs (i < j) that share a bucket in any band, within the same group."""
+    rng = np.random.default_rng(SEED + 1)
+    mix = rng.integers(1, 1 << 63, size=rows, dtype=np.uint64) | np.uint64(1)
+    pairs: Set[Tuple[int, int]] = set()
+    for band in range(bands):
+        # One 64-bit key per band; a collision only adds a candidate that verification drops
+        keys = (sigs[:, band * rows:(band + 1) * rows] @ mix) ^ groups
+        order = np.argsort(keys, kind="stable")
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for members in np.split(order, bounds):
+            if len(members) < 2:
+                continue
+            members = members.tolist()
+            if len(members) > MAX_BUCKET:
+                pairs.update((members[0], m) for m in members[1:])
+            else:
+                pairs.update(itertools.combinations(members, 2))
+    return pairs
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    inter = np.intersect1d(a, b, assume_unique=True).size
+    return inter / (a.size + b.size - inter)
+
+
+def clusters_of(n: int, pairs: List[Tuple[int, int, float]]) -> List[List[int]]:
+    """Connected components of the verified pairs, largest first, members in index order."""
+    parent = list(range(n))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j, _ in pairs:
+        parent[find(i)] = find(j)
+    groups: Dict[int, List[int]] = {}
+    for k in sorted({k for i, j, _ in pairs for k in (i, j)}):
+        groups.setdefault(find(k), []).append(k)
+    return sorted(groups.values(), key=lambda c: (-len(c), c[0]))
+
+
+# =============================================================
+# Index
+# =============================================================
+
+def find_duplicates(sections: List[Section], threshold: float = THRESHOLD, k: int = SHINGLE_WORDS,
+                    num_perm: int = NUM_PERM, min_words: int = MIN_WORDS) -> Dict[str, Any]:
+    """The report: clusters of near-duplicate sections, with per-pair similarity."""
+    kept = [s for s in sections if len(WORD.findall(s["text"])) >= max(min_words, k)]
+    # Lowest grade first, so the first member of a cluster is the one to keep
+    kept.sort(key=lambda s: grade_key(s["grade"]))
+    shingles = [shingle_hashes(s["text"], k) for s in kept]
+    bands, rows = choose_bands(threshold, num_perm)
+
+    pairs: List[Tuple[int, int, float]] = []
+    candidates: Set[Tuple[int, int]] = set()
+    if kept:
+        sigs = minhash(shingles, num_perm)
+        groups = np.array([DOC_TYPES.index(s["doc_type"]) if s["doc_type"] in DOC_TYPES else len(DOC_TYPES)
+                           for s in kept], dtype=np.uint64)
+        candidates = candidate_pairs(sigs, groups, bands, rows)
+        for i, j in sorted(candidates):
+            if all(kept[i][f] == kept[j][f] for f in UNIT_FIELDS[:4]):
+                continue
+            similarity = jaccard(shingles[i], shingles[j])
+            if similarity >= threshold:
+                pairs.append((i, j, round(similarity, 3)))
+
+    clusters = []
+    by_title: Dict[str, int] = {}
+    for members in clusters_of(len(kept), pairs):
+        position = {idx: n for n, idx in enumerate(members)}
+        for idx in members[1:]:
+            by_title[kept[idx]["section"]] = by_title.get(kept[idx]["section"], 0) + 1
+        clusters.append({
+            "size": len(members),
+            "sections": sorted({kept[idx]["section"] for idx in members}),
+            "members": [{f: kept[idx][f] for f in UNIT_FIELDS + ("section",)} for idx in members],
+            "pairs": [{"a": position[i], "b": position[j], "similarity": sim}
+                      for i, j, sim in pairs if i in position],
+        })
+
+    return {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "threshold": threshold,
+        "shingle_words": k,
+        "num_perm": num_perm,
+        "bands": bands,
+        "rows": rows,
+        "sections": len(sections),
+        "compared": len(kept),
+        "candidates": len(candidates),
+        "pairs": len(pairs),
+        "duplicates": sum(c["size"] - 1 for c in clusters),
+        "by_title": dict(sorted(by_title.items(), key=lambda kv: -kv[1])),
+        "clusters": clusters,
+    }
+
+
+def regeneration_list(report: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Every cluster member but the first, with the section it duplicates."""
+    regenerate = []
+    for cluster in report["clusters"]:
+        members = cluster["members"]
+        best: Dict[int, float] = {}
+        for pair in cluster["pairs"]:
+            for m in (pair["a"], pair["b"]):
+                best[m] = max(best.get(m, 0.0), pair["similarity"])
+        for n, member in enumerate(members[1:], start=1):
+            regenerate.append(dict(member, duplicate_of=unit_label(members[0]), similarity=best.get(n, 0.0)))
+    return regenerate
+
+
+def log_report(report: Dict[str, Any]):
+    print(f"🔍 Near-duplicates: {report['duplicates']} sections in {len(report['clusters'])} clusters "
+          f"({report['pairs']} pairs from {report['candidates']} LSH candidates, "
+          f"{report['compared']} of {report['sections']} sections compared)")
+    for title, count in list(report["by_title"].items())[:10]:
+        print(f"   {count:5d}  {title}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate sections in generated content.")
+    parser.add_argument("--queue", metavar="DB", action="append", default=[],
+                        help="work queue database to read completions from (repeatable)")
+    parser.add_argument("--lessons", metavar="DIR", action="append", default=[],
+                        help="directory of lesson JSON files (default: OUTPUT_DIR when no --queue)")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="minimum Jaccard similarity")
+    parser.add_argument("--shingle-words", type=int, default=SHINGLE_WORDS)
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM)
+    parser.add_argument("--min-words", type=int, default=MIN_WORDS, help="skip shorter sections")
+    parser.add_argument("--report", default=REPORT_PATH)
+    parser.add_argument("--regenerate", metavar="FILE", help="also write the units to regenerate")
+    args = parser.parse_args()
+
+    sections: List[Section] = []
+    for path in args.queue:
+        sections.extend(queue_sections(path))
+    for directory in args.lessons or ([] if args.queue else [OUTPUT_DIR]):
+        sections.extend(lesson_sections(directory))
+    if not sections:
+        parser.error("no generated sections found")
+
+    report = find_duplicates(sections, args.threshold, args.shingle_words, args.num_perm, args.min_words)
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    log_report(report)
+    print(f"Report: {args.report}")
+
+    if args.regenerate:
+        regenerate = regeneration_list(report)
+        with open(args.regenerate, "w", encoding="utf-8") as f:
+            json.dump(regenerate, f, indent=2, ensure_ascii=False)
+        print(f"Regeneration list: {len(regenerate)} sections → {args.regenerate}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ This script processes the CBC curriculum JSON to:
 1. Add unique IDs to each strand
 2. Create a simplified version for modal selection (without descriptions)
 3. Maintain the original structure with added IDs
+4. Write an indexed SQLite copy (see curriculum_db.py)
+5. Write a memory-mappable binary snapshot (see curriculum_snapshot.py)
 
 Author: AI Tutors Team
 Date: October 20, 2025
@@ -15,10 +17,15 @@ import re
 from typing import Dict, List, Any
 from pathlib import Path
 
+from curriculum_db import export_sqlite
+from curriculum_snapshot import write_snapshot
+
 # Explicit paths
 INPUT_PATH = r"C:\Users\HP\Documents\ai-tutors-frontend\src\components\CBCStudent\cbc_curriculum.json"
 OUTPUT_FULL_PATH = r"C:\Users\HP\Documents\ai-tutors-frontend\src\components\CBCStudent\cbc_curriculum_with_ids.json"
 OUTPUT_SIMPLE_PATH = r"C:\Users\HP\Documents\ai-tutors-frontend\src\components\CBCStudent\cbc_curriculum_simple.json"
+OUTPUT_DB_PATH = r"C:\Users\HP\Documents\ai-tutors-frontend\src\components\CBCStudent\cbc_curriculum.db"
+OUTPUT_SNAPSHOT_PATH = r"C:\Users\HP\Documents\ai-tutors-frontend\src\components\CBCStudent\cbc_curriculum.snap"
 
 
 def slugify(text: str) -> str:
@@ -33,11 +40,8 @@ def slugify(text: str) -> str:
     return text
 
 
-def create_strand_id(subject_name: str, grade_num: int, strand_name: str) -> str:
-    """
-    Create a unique strand ID
-    Format: {subject-abbrev}-g{grade}-{strand-slug}
-    """
+def subject_abbreviation(subject_name: str) -> str:
+    """Short subject code used as the strand ID prefix"""
     # Create subject abbreviation
     subject_slug = slugify(subject_name)
     
@@ -68,7 +72,15 @@ def create_strand_id(subject_name: str, grade_num: int, strand_name: str) -> str
         'foreign-languages-optional-pathways': 'foreign',
     }
     
-    subject_abbrev = subject_abbrev_map.get(subject_slug, subject_slug[:10])
+    return subject_abbrev_map.get(subject_slug, subject_slug[:10])
+
+
+def create_strand_id(subject_name: str, grade_num: int, strand_name: str) -> str:
+    """
+    Create a unique strand ID
+    Format: {subject-abbrev}-g{grade}-{strand-slug}
+    """
+    subject_abbrev = subject_abbreviation(subject_name)
     
     # Create strand slug
     strand_slug = slugify(strand_name)
@@ -334,6 +346,32 @@ def save_json(data: Any, filepath: str, description: str):
     print(f"   ✅ Saved successfully ({file_size:,} bytes)\n")
 
 
+def save_sqlite(data: List[Dict[str, Any]], filepath: str):
+    """Save indexed SQLite copy of the full data for lookups by strand ID, grade or subject"""
+    print(f"💾 Saving SQLite database...")
+    print(f"   Path: {filepath}")
+    
+    counts = export_sqlite(data, filepath, "cbc", lambda grade: extract_grade_number(grade['programme']), subject_abbreviation)
+    
+    file_size = Path(filepath).stat().st_size
+    print(f"   ✅ Saved successfully ({file_size:,} bytes)")
+    print(f"   • {counts['programmes']} programmes, {counts['subjects']} subjects, "
+          f"{counts['strands']} strands, {counts['subtopics']} subtopics")
+    if counts['duplicate_strand_ids']:
+        print(f"   ⚠️  {counts['duplicate_strand_ids']} strand IDs are used more than once")
+    print()
+
+
+def save_snapshot(data: List[Dict[str, Any]], filepath: str):
+    """Save memory-mappable binary snapshot for fast service startup"""
+    print(f"💾 Saving binary snapshot...")
+    print(f"   Path: {filepath}")
+    
+    counts = write_snapshot(data, filepath, "cbc", lambda grade: extract_grade_number(grade['programme']), subject_abbreviation)
+    
+    print(f"   ✅ Saved successfully ({counts['bytes']:,} bytes, {counts['strings']:,} distinct strings)\n")
+
+
 def main():
     """Main execution function"""
     print("\n" + "="*60)
@@ -402,6 +440,9 @@ def main():
         "Simplified curriculum for modal"
     )
     
+    save_sqlite(full_data, OUTPUT_DB_PATH)
+    save_snapshot(full_data, OUTPUT_SNAPSHOT_PATH)
+    
     # Print sample IDs
     print(f"📋 SAMPLE STRAND IDs (first 10)")
     print(f"{'='*60}")
@@ -425,6 +466,8 @@ def main():
     print(f"\nOutput files:")
     print(f"   1. Full version: {OUTPUT_FULL_PATH}")
     print(f"   2. Simple version: {OUTPUT_SIMPLE_PATH}")
+    print(f"   3. SQLite database: {OUTPUT_DB_PATH}")
+    print(f"   4. Binary snapshot: {OUTPUT_SNAPSHOT_PATH}")
     print(f"\nUse the simple version for modal dropdowns.")
     print(f"Use the full version for curriculum context in AI prompts.\n")
 
@@ -0,0 +1,164 @@
+"""
+Provider Pool
+=============
+Routes completions across several OpenAI-compatible endpoints (different
+providers, regions or API keys for the same model family).
+
+Each endpoint has a weight, a smoothed latency and a circuit breaker:
+
+  closed     normal routing
+  open       FAILURE_THRESHOLD failures within BURST_WINDOW seconds; no
+             traffic until the cooldown passes (the cooldown doubles on
+             each re-open, up to COOLDOWN_MAX)
+  half-open  after the cooldown one trial request is let through; success
+             closes the breaker, failure opens it again
+
+Routing picks the available endpoint with the lowest
+latency × (in-flight + 1) / weight. Endpoints without a latency sample yet
+are scored with the best observed latency, so they get probed early. A failed call
+goes straight to the next endpoint instead of sleeping. The caller only
+backs off when every breaker is open.
+
+Config file (JSON list):
+  [{"name": "primary", "base_url": "https://api.deepseek.com/v1/chat/completions",
+    "model": "deepseek-chat", "api_key": "...", "weight": 2},
+   {"name": "local", "base_url": "http://127.0.0.1:9000/v1/chat/completions",
+    "model": "deepseek-chat", "api_key": "test"}]
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+FAILURE_THRESHOLD = 3
+BURST_WINDOW = 30.0
+COOLDOWN = 15.0
+COOLDOWN_MAX = 240.0
+LATENCY_SMOOTHING = 0.3   # weight of the newest sample in the moving average
+
+
+class Endpoint:
+    def __init__(self, name: str, base_url: str, model: str, api_key: str, weight: float = 1.0):
+        if weight <= 0:
+            raise ValueError(f"Endpoint {name}: weight must be positive")
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.weight = weight
+        self.state = "closed"
+        self.failures: deque = deque()
+        self.opened_at = 0.0
+        self.cooldown = COOLDOWN
+        self.trial_in_flight = False
+        self.latency: Optional[float] = None
+        self.in_flight = 0
+        self.stats = {"requests": 0, "successes": 0, "failures": 0, "opened": 0}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "weight": self.weight,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "in_flight": self.in_flight,
+            **self.stats,
+        }
+
+
+class ProviderPool:
+    """Thread-safe endpoint selection and health tracking."""
+
+    def __init__(self, endpoints: List[Endpoint]):
+        if not endpoints:
+            raise ValueError("Provider pool needs at least one endpoint")
+        names = [ep.name for ep in endpoints]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate endpoint names: {names}")
+        self.endpoints = endpoints
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str) -> "ProviderPool":
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        return cls([
+            Endpoint(e.get("name") or f"endpoint-{i}", e["base_url"], e["model"], e.get("api_key", ""),
+                     float(e.get("weight", 1)))
+            for i, e in enumerate(entries)
+        ])
+
+    def _available(self, ep: Endpoint, now: float) -> bool:
+        if ep.state == "closed":
+            return True
+        if ep.state == "open" and now - ep.opened_at >= ep.cooldown:
+            ep.state = "half_open"
+        return ep.state == "half_open" and not ep.trial_in_flight
+
+    def acquire(self, exclude: Optional[set] = None) -> Optional[Endpoint]:
+        """
+        The best available endpoint, marked in flight, or None when every
+        breaker is open (or every endpoint is excluded). Pair with success()
+        or failure().
+        """
+        now = time.monotonic()
+        with self.lock:
+            candidates = [ep for ep in self.endpoints
+                          if (not exclude or ep.name not in exclude) and self._available(ep, now)]
+            if not candidates:
+                return None
+            known = [ep.latency for ep in self.endpoints if ep.latency is not None]
+            default = min(known) if known else 1.0
+            best = min(candidates, key=lambda ep: (default if ep.latency is None else ep.latency)
+                       * (ep.in_flight + 1) / ep.weight)
+            if best.state == "half_open":
+                best.trial_in_flight = True
+            best.in_flight += 1
+            best.stats["requests"] += 1
+            return best
+
+    def success(self, ep: Endpoint, latency: float):
+        with self.lock:
+            ep.in_flight -= 1
+            ep.stats["successes"] += 1
+            ep.latency = latency if ep.latency is None else \
+                LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * ep.latency
+            if ep.state == "half_open":
+                ep.state = "closed"
+                ep.trial_in_flight = False
+                ep.cooldown = COOLDOWN
+                ep.failures.clear()
+
+    def failure(self, ep: Endpoint):
+        now = time.monotonic()
+        with self.lock:
+            ep.in_flight -= 1
+            ep.stats["failures"] += 1
+            if ep.state == "half_open":
+                ep.trial_in_flight = False
+                ep.cooldown = min(ep.cooldown * 2, COOLDOWN_MAX)
+                self._open(ep, now)
+                return
+            ep.failures.append(now)
+            while ep.failures and now - ep.failures[0] > BURST_WINDOW:
+                ep.failures.popleft()
+            if ep.state == "closed" and len(ep.failures) >= FAILURE_THRESHOLD:
+                self._open(ep, now)
+
+    def _open(self, ep: Endpoint, now: float):
+        ep.state = "open"
+        ep.opened_at = now
+        ep.failures.clear()
+        ep.stats["opened"] += 1
+
+    def retry_after(self) -> float:
+        """Seconds until the first open breaker allows a trial request."""
+        now = time.monotonic()
+        with self.lock:
+            waits = [max(0.0, ep.opened_at + ep.cooldown - now) for ep in self.endpoints if ep.state == "open"]
+        return min(waits) if waits else 0.0
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {ep.name: ep.snapshot() for ep in self.endpoints}
@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LESSON = "## Introduction\nNumbers help us count things around us.\n"
+
+
+class StandIn:
+    """
+    A local OpenAI-compatible chat endpoint. `status` is the HTTP status to
+    answer with and `content` the completion text (None sends a null
+    content, as a misbehaving provider would).
+    """
+
+    def __init__(self):
+        self.status = 200
+        self.content = LESSON
+        self.requests = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stand_in.requests += 1
+                body = json.dumps({"choices": [{"message": {"content": stand_in.content}, "finish_reason": "stop"}],
+                                   "usage": {"completion_tokens": 12}}).encode("utf-8")
+                self.send_response(stand_in.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stand_ins():
+    """Factory for StandIn servers, shut down after the test."""
+    servers = []
+
+    def make():
+        servers.append(StandIn())
+        return servers[-1]
+
+    yield make
+    for server in servers:
+        server.close()
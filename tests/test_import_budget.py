@@ -0,0 +1,61 @@
+"""
+Import-time budget for content_generator: `python -X importtime -c
+"import content_generator"` in a fresh interpreter and an empty working
+directory must stay under IMPORT_BUDGET_MS, load none of HEAVY_IMPORTS and
+create no OUTPUT_DIR.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import content_generator as cg
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROBE = "import json, sys, content_generator; print(json.dumps(sorted(sys.modules)))"
+
+
+def import_in_fresh_interpreter(cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE], cwd=cwd, env=env,
+                          capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    return json.loads(proc.stdout), proc.stderr
+
+
+def cumulative_ms(importtime: str, module: str) -> float:
+    for line in importtime.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if name.strip() == module and name.startswith(" ") and not name.startswith("  "):
+                return int(cumulative) / 1000
+    pytest.fail(f"{module} missing from -X importtime output")
+
+
+@pytest.fixture(scope="module")
+def fresh_import(tmp_path_factory):
+    warm = tmp_path_factory.mktemp("warm")
+    import_in_fresh_interpreter(warm)   # compile bytecode so the timed run measures imports, not compilation
+    cwd = tmp_path_factory.mktemp("import")
+    modules, importtime = import_in_fresh_interpreter(cwd)
+    return cwd, modules, importtime
+
+
+def test_import_stays_under_budget(fresh_import):
+    _, _, importtime = fresh_import
+    assert cumulative_ms(importtime, "content_generator") <= cg.IMPORT_BUDGET_MS
+
+
+def test_import_loads_no_heavy_modules(fresh_import):
+    _, modules, _ = fresh_import
+    heavy = [m for m in modules if m.split(".")[0] in cg.HEAVY_IMPORTS]
+    assert not heavy
+
+
+def test_import_creates_no_output_dir(fresh_import):
+    cwd, _, _ = fresh_import
+    assert not (cwd / cg.OUTPUT_DIR).exists()
+    assert os.listdir(cwd) == []
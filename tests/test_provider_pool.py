@@ -0,0 +1,98 @@
+"""
+Circuit breaker and failover checks for provider_pool.py, driving
+api_complete against local stand-in endpoints.
+"""
+
+import time
+
+import pytest
+
+import content_generator as cg
+import provider_pool as pp
+
+COOLDOWN = 0.2
+
+
+@pytest.fixture
+def pool(monkeypatch, stand_ins):
+    """A healthy endpoint and a preferred one that can be made to fail."""
+    monkeypatch.setattr(pp, "COOLDOWN", COOLDOWN)
+    monkeypatch.setattr(cg, "BACKOFF", 0)
+    monkeypatch.setattr(cg, "HEDGE_REQUESTS", False)
+    flaky, good = stand_ins(), stand_ins()
+    pool = pp.ProviderPool([pp.Endpoint("flaky", flaky.url, "m", "k", weight=4),
+                            pp.Endpoint("good", good.url, "m", "k")])
+    monkeypatch.setattr(cg, "_provider_pool", pool)
+    return pool, flaky, good
+
+
+def state(pool, name):
+    return pool.health()[name]["state"]
+
+
+def test_failures_open_the_breaker_and_route_to_the_healthy_endpoint(pool):
+    pool, flaky, good = pool
+    flaky.status = 503
+    for _ in range(pp.FAILURE_THRESHOLD):
+        assert cg.api_complete("prompt")["text"]
+    assert state(pool, "flaky") == "open"
+    assert flaky.requests == pp.FAILURE_THRESHOLD
+
+    for _ in range(3):
+        assert cg.api_complete("prompt")["text"]
+    assert flaky.requests == pp.FAILURE_THRESHOLD
+    assert good.requests == pp.FAILURE_THRESHOLD + 3
+    assert all(h["in_flight"] == 0 for h in pool.health().values())
+
+
+def test_half_open_trial_success_closes_the_breaker(pool):
+    pool, flaky, good = pool
+    flaky.status = 503
+    for _ in range(pp.FAILURE_THRESHOLD):
+        cg.api_complete("prompt")
+    flaky.status = 200
+    time.sleep(COOLDOWN)
+
+    trial = pool.acquire()
+    assert trial.name == "flaky" and trial.state == "half_open"
+    assert pool.acquire().name == "good"   # only one trial at a time
+    pool.success(trial, 0.01)
+    assert state(pool, "flaky") == "closed"
+
+    before = flaky.requests
+    cg.api_complete("prompt")
+    assert flaky.requests == before + 1
+
+
+def test_half_open_trial_failure_reopens_with_longer_cooldown(pool):
+    pool, flaky, good = pool
+    flaky.status = 503
+    for _ in range(pp.FAILURE_THRESHOLD):
+        cg.api_complete("prompt")
+    time.sleep(COOLDOWN)
+
+    assert cg.api_complete("prompt")["text"]
+    assert flaky.requests == pp.FAILURE_THRESHOLD + 1
+    assert state(pool, "flaky") == "open"
+    assert pool.endpoints[0].cooldown == 2 * COOLDOWN
+    assert pool.retry_after() > 0
+
+
+def test_every_breaker_open_returns_no_endpoint(pool):
+    pool, flaky, good = pool
+    flaky.status = good.status = 503
+    for _ in range(pp.FAILURE_THRESHOLD):
+        pool.failure(pool.acquire({"good"}))
+        pool.failure(pool.acquire({"flaky"}))
+    assert pool.acquire() is None
+    assert 0 < pool.retry_after() <= COOLDOWN
+
+
+def test_malformed_completion_releases_the_endpoint_once(pool):
+    pool, flaky, good = pool
+    flaky.content = None
+    assert cg.api_complete("prompt")["text"]
+    health = pool.health()
+    assert health["flaky"]["failures"] == 1
+    assert health["good"]["successes"] == 1
+    assert all(h["in_flight"] == 0 for h in health.values())
@@ -0,0 +1,109 @@
+"""
+Several worker processes sharing one SQLite queue (work_queue.py) through
+run_worker, with a fake completion in place of the API.
+"""
+
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter
+
+import content_generator as cg
+from work_queue import WorkQueue
+
+LEASE = 1.0
+WORKERS = 4
+CURRICULUM = {"1": {"Mathematics": {
+    strand: {f"{strand} {n}": {"learning_outcomes": [f"Outcome {n}"]} for n in range(1, 5)}
+    for strand in ("Numbers", "Measurement", "Geometry")
+}}}
+
+
+def worker(path: str, worker_id: str, log_path: str):
+    """Runs run_worker in this process with a completion that logs who produced what."""
+    def fake_generate(doc_type, grade, subject, strand, sub, ctx, *args, **kwargs):
+        time.sleep(random.uniform(0.01, 0.05))
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(f"{sub}|{doc_type}|{worker_id}\n")
+        return f"## Introduction\n{sub} for {doc_type} by {worker_id}\n"
+
+    cg.generate_substrand = fake_generate
+    cg.WORKER_POLL_SECONDS = 0.1
+    cg.run_worker(WorkQueue(path, lease_seconds=LEASE), CURRICULUM, worker_id)
+
+
+def crashed_worker(path: str):
+    """Claims a unit and dies without completing or failing it."""
+    WorkQueue(path, lease_seconds=LEASE).claim("crashed")
+    os._exit(1)
+
+
+def run_processes(targets):
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=target, args=args) for target, args in targets]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert not p.is_alive(), "worker did not finish"
+    return procs
+
+
+def queue(tmp_path):
+    path = str(tmp_path / "queue.db")
+    wq = WorkQueue(path, lease_seconds=LEASE)
+    units = cg.queue_units(cg.iter_strands(CURRICULUM))
+    assert wq.enqueue(units) == len(units)
+    return path, wq, units
+
+
+def test_concurrent_workers_complete_each_unit_once(tmp_path):
+    path, wq, units = queue(tmp_path)
+    log_path = str(tmp_path / "log.txt")
+    run_processes([(worker, (path, f"w{n}", log_path)) for n in range(WORKERS)])
+
+    assert wq.counts() == {"done": len(units)}
+    with open(log_path, encoding="utf-8") as f:
+        produced = Counter(line.rsplit("|", 1)[0] for line in f.read().splitlines())
+    assert len(produced) == len(units)
+    assert set(produced.values()) == {1}
+    results = wq.results("1", "Mathematics", "Numbers", "Student")
+    assert list(results) == [f"Numbers {n}" for n in range(1, 5)]
+
+
+def test_lease_of_a_crashed_worker_is_reclaimed(tmp_path):
+    path, wq, units = queue(tmp_path)
+    run_processes([(crashed_worker, (path,))])
+    assert wq.counts() == {"leased": 1, "pending": len(units) - 1}
+
+    log_path = str(tmp_path / "log.txt")
+    run_processes([(worker, (path, f"w{n}", log_path)) for n in range(WORKERS)])
+    assert wq.counts() == {"done": len(units)}
+    with wq._connect() as conn:
+        first = conn.execute("SELECT worker, attempts FROM units WHERE id = 1").fetchone()
+    assert first["worker"] != "crashed" and first["attempts"] == 2
+
+
+def test_result_from_a_lost_lease_is_discarded(tmp_path):
+    _, wq, _ = queue(tmp_path)
+    slow = wq.claim("slow")
+    time.sleep(LEASE + 0.1)
+    fast = wq.claim("fast")
+    assert fast["id"] == slow["id"] and fast["attempts"] == 2
+
+    assert not wq.heartbeat(slow["id"], "slow")
+    assert not wq.complete(slow["id"], "slow", "stale")
+    assert wq.complete(fast["id"], "fast", "fresh")
+    assert wq.results(fast["grade"], fast["subject"], fast["strand"], fast["doc_type"]) == {fast["substrand"]: "fresh"}
+
+
+def test_expired_lease_fails_after_max_attempts(tmp_path):
+    path = str(tmp_path / "queue.db")
+    wq = WorkQueue(path, lease_seconds=0.05, max_attempts=2)
+    wq.enqueue(cg.queue_units(cg.iter_strands(CURRICULUM, strand="Numbers"))[:1])
+    for n in range(2):
+        assert wq.claim(f"w{n}") is not None
+        time.sleep(0.1)
+    assert wq.claim("w2") is None
+    assert wq.counts() == {"failed": 1}
@@ -0,0 +1,183 @@
+"""
+Token Budgets
+=============
+Per-request max_tokens learned from the run ledger.
+
+Every completion is appended to a JSONL ledger (one line per call) with
+its budget key, prompt and output token counts, finish reason and latency.
+The key is (grade band, subject, doc_type, scope). Scope is "full" for a
+whole sub-strand and "section" for one section-parallel or repair request.
+
+TokenBudget keeps recent output lengths per key and sets max_tokens to a
+high quantile of them plus headroom, clamped between a floor and the model
+ceiling. Keys with too little history get the configured default. A call
+cut off at its limit is censored: its real length is unknown, only that it
+was longer. When more than the quantile's tail of a key was cut off, the
+key gets the ceiling until longer completions are observed.
+
+LedgerStats and approx_tokens serve the dry-run planner: expected output
+length and latency per key, falling back to coarser keys when a subject
+has no history yet.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+QUANTILE = 0.95
+HEADROOM = 1.2
+MIN_SAMPLES = 20
+WINDOW = 500
+FLOOR = 512
+PLAN_MIN_SAMPLES = 3
+
+Key = Tuple[str, str, str, str]
+
+TOKEN_PIECE = re.compile(r"[^\W\d_]+|\d|\S")
+
+
+def piece_tokens(piece: str) -> int:
+    return (len(piece) + 3) // 4 if piece[0].isalpha() else 1
+
+
+def approx_tokens(text: str) -> int:
+    """
+    Local stand-in for a BPE tokenizer: a word costs one token per four
+    letters (at least one), each digit and punctuation mark one token.
+    """
+    return sum(piece_tokens(piece) for piece in TOKEN_PIECE.findall(text))
+
+
+def clip_to_tokens(text: str, tokens: int) -> str:
+    """The longest prefix of text, ending at a piece boundary, that approx_tokens counts within `tokens`."""
+    used, end = 0, 0
+    for m in TOKEN_PIECE.finditer(text):
+        used += piece_tokens(m.group(0))
+        if used > tokens:
+            break
+        end = m.end()
+    return text[:end]
+
+
+class RunLedger:
+    """Append-only JSONL log of completions, shared by every run."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def append(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line torn by a crash mid-write
+
+
+def record_key(record: Dict[str, Any]) -> Key:
+    return record["band"], record["subject"], record["doc_type"], record["scope"]
+
+
+class TokenBudget:
+    """Output-length history per key and the max_tokens derived from it."""
+
+    def __init__(self, ledger: RunLedger, default: int, ceiling: int, floor: int = FLOOR,
+                 quantile: float = QUANTILE, headroom: float = HEADROOM,
+                 min_samples: int = MIN_SAMPLES, window: int = WINDOW):
+        self.ledger = ledger
+        self.default = default
+        self.ceiling = ceiling
+        self.floor = floor
+        self.quantile = quantile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.window = window
+        self.lock = threading.Lock()
+        self.history: Dict[Key, Deque[Tuple[int, bool]]] = {}
+        for record in ledger.records():
+            if record.get("finish_reason") and "output_tokens" in record:
+                self._add(record_key(record), record["output_tokens"], record["finish_reason"] == "length")
+
+    def _add(self, key: Key, tokens: int, truncated: bool):
+        self.history.setdefault(key, deque(maxlen=self.window)).append((tokens, truncated))
+
+    def max_tokens(self, key: Key) -> int:
+        with self.lock:
+            samples = list(self.history.get(key, ()))
+        if len(samples) < self.min_samples:
+            return self.default
+        if sum(1 for _, cut in samples if cut) > (1 - self.quantile) * len(samples):
+            return self.ceiling
+        lengths = sorted(tokens for tokens, _ in samples)
+        idx = min(len(lengths) - 1, int(math.ceil(self.quantile * len(lengths))) - 1)
+        return max(self.floor, min(self.ceiling, int(lengths[idx] * self.headroom)))
+
+    def record(self, key: Key, prompt_tokens: int, output_tokens: int, finish_reason: str,
+               max_tokens: int, latency: float):
+        """Adds a finished call to the history and the ledger."""
+        with self.lock:
+            self._add(key, output_tokens, finish_reason == "length")
+        band, subject, doc_type, scope = key
+        self.ledger.append({
+            "time": round(time.time(), 3),
+            "band": band,
+            "subject": subject,
+            "doc_type": doc_type,
+            "scope": scope,
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "finish_reason": finish_reason,
+            "max_tokens": max_tokens,
+            "latency": round(latency, 3),
+        })
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Current budget and sample count per key, for the run report."""
+        with self.lock:
+            keys = list(self.history)
+        return {"/".join(key): {"samples": len(self.history[key]), "max_tokens": self.max_tokens(key)}
+                for key in keys}
+
+
+class LedgerStats:
+    """Mean output tokens and latency per key from the ledger."""
+
+    def __init__(self, ledger: RunLedger, min_samples: int = PLAN_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self.groups: Dict[Key, list] = {}   # key → [samples, output tokens, latency seconds]
+        for record in ledger.records():
+            if not record.get("finish_reason") or "output_tokens" not in record:
+                continue
+            for key in self.levels(record_key(record)):
+                group = self.groups.setdefault(key, [0, 0, 0.0])
+                group[0] += 1
+                group[1] += record["output_tokens"]
+                group[2] += record.get("latency", 0.0)
+
+    @staticmethod
+    def levels(key: Key) -> List[Key]:
+        """The key, then the same band for any subject, then any band."""
+        band, _, doc_type, scope = key
+        return [key, (band, "*", doc_type, scope), ("*", "*", doc_type, scope)]
+
+    def expect(self, key: Key) -> Optional[Tuple[float, float]]:
+        """(output tokens, latency seconds) from the most specific level with enough samples."""
+        for level in self.levels(key):
+            group = self.groups.get(level)
+            if group and group[0] >= self.min_samples:
+                return group[1] / group[0], group[2] / group[0]
+        return None
@@ -0,0 +1,178 @@
+"""
+Shared Work Queue
+=================
+SQLite-backed queue of generation units for running content_generator on
+several machines at once. A unit is one (grade, subject, strand, sub-strand,
+doc_type) completion.
+
+Workers claim a unit under a lease, renew it with heartbeats while the API
+call runs, and store the result when done. A unit whose lease expires
+(worker crashed or lost the network) becomes claimable again, so no unit is
+lost and, while leases are live, none is worked twice. Results stay in the
+database for the final assembly step.
+
+Put the database on storage every worker can reach. SQLite locking needs a
+filesystem with working POSIX locks; avoid NFS mounts that lack them.
+"""
+
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+LEASE_SECONDS = 900
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    grade TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    strand TEXT NOT NULL,
+    substrand TEXT NOT NULL,
+    doc_type TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated REAL,
+    UNIQUE (grade, subject, strand, substrand, doc_type)
+);
+CREATE INDEX IF NOT EXISTS idx_units_status ON units (status, lease_expires);
+CREATE INDEX IF NOT EXISTS idx_units_strand ON units (grade, subject, strand);
+"""
+
+UNIT_FIELDS = ("id", "grade", "subject", "strand", "substrand", "doc_type", "position", "attempts")
+
+
+class WorkQueue:
+    """Lease-based unit queue. Every call opens its own connection, so one
+    instance can be shared between a worker and its heartbeat thread."""
+
+    def __init__(self, path: str, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, units: Iterable[Dict[str, Any]]) -> int:
+        """Adds units that are not already queued. Returns how many were new."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO units (grade, subject, strand, substrand, doc_type, position, updated) "
+                "VALUES (:grade, :subject, :strand, :substrand, :doc_type, :position, :updated)",
+                [{**u, "updated": now} for u in units],
+            )
+            added = conn.total_changes - before
+            conn.execute("COMMIT")
+        return added
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Leases the next pending (or expired) unit to this worker, or returns None."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE units SET status = 'failed', error = 'lease expired', lease_expires = NULL, updated = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT * FROM units WHERE attempts < ? AND "
+                "(status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                "ORDER BY id LIMIT 1",
+                (self.max_attempts, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE units SET status = 'leased', worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker, now + self.lease_seconds, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        unit = {k: row[k] for k in UNIT_FIELDS}
+        unit["attempts"] += 1
+        return unit
+
+    def heartbeat(self, unit_id: int, worker: str) -> bool:
+        """Extends the lease. False means the lease was lost to another worker."""
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE units SET lease_expires = ?, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (now + self.lease_seconds, now, unit_id, worker),
+            )
+            return cur.rowcount == 1
+
+    def complete(self, unit_id: int, worker: str, result: str) -> bool:
+        """Stores the result if this worker still holds the lease."""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE units SET status = 'done', result = ?, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (result, time.time(), unit_id, worker),
+            )
+            return cur.rowcount == 1
+
+    def fail(self, unit_id: int, worker: str, error: str):
+        """Returns the unit to the queue, or marks it failed after max_attempts."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (self.max_attempts, error, time.time(), unit_id, worker),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall()
+        return {status: n for status, n in rows}
+
+    def outstanding(self) -> int:
+        """Units that may still produce a result."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM units WHERE status IN ('pending', 'leased')"
+            ).fetchone()[0]
+
+    def strands(self) -> List[Dict[str, Any]]:
+        """Every queued strand with its unit totals, for assembly."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT grade, subject, strand, COUNT(*) AS total, "
+                "SUM(status = 'done') AS done FROM units "
+                "GROUP BY grade, subject, strand ORDER BY MIN(id)"
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def results(self, grade: str, subject: str, strand: str, doc_type: str) -> Dict[str, str]:
+        """Sub-strand → result text for one strand and doc_type, in curriculum order."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT substrand, result FROM units "
+                "WHERE grade = ? AND subject = ? AND strand = ? AND doc_type = ? AND status = 'done' "
+                "ORDER BY position",
+                (grade, subject, strand, doc_type),
+            ).fetchall()
+        return {r["substrand"]: r["result"] for r in rows}